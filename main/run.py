@@ -6,6 +6,8 @@ from src.api.bq_read import bq_router
 from src.api.routes import router
 from src.api.pg_read import pg_router
 from src.api.auth_api import auth_router
+from src.api.jobs import jobs_router
+from src.llm.http_client import aclose_chat_clients
 
 app = FastAPI()
 
@@ -23,6 +25,11 @@ app.include_router(auth_router)
 app.include_router(router)
 app.include_router(bq_router)
 app.include_router(pg_router)
+app.include_router(jobs_router)
+
+@app.on_event("shutdown")
+async def close_shared_clients():
+    await aclose_chat_clients()
 
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
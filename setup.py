@@ -54,9 +54,12 @@ setup(
         "grpcio==1.70.0",
         "grpcio-status==1.70.0",
         "h11==0.14.0",
+        "h2==4.1.0",
+        "hpack==4.0.0",
         "httpcore==1.0.7",
         "httpx==0.28.1",
         "httpx-sse==0.4.0",
+        "hyperframe==6.0.1",
         "idna==3.10",
         "iniconfig==2.1.0",
         "itsdangerous==2.2.0",
@@ -0,0 +1,125 @@
+from fastapi import HTTPException, APIRouter, Depends
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from typing import Optional
+import os
+from src.utils.mock_ldap import verify_token
+
+from src.api.routes import QueryPayload
+from src.database.query_executor import submit_query_job, get_query_job, query_job_status, fetch_job_page
+from src.services.market_registry import get_market_resources
+from src.services.query_guard import check_query_before_execution
+from src.utils.logger import logger
+
+jobs_router = APIRouter(tags=["jobs"])
+
+class JobRequest(BaseModel):
+    market: str
+
+def _check_market_access(user: dict, username: str, market: str):
+    if market not in user["markets"]:
+        logger.warning("ACCESS_DENIED - User %s attempted to access unauthorized market: %s", username, market)
+        raise HTTPException(status_code=403, detail="Market access denied")
+
+def _get_job_or_404(job_id: str, market: str, username: str):
+    job = get_query_job(job_id, market, username)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+@jobs_router.post("/jobs")
+def submit_job(payload: QueryPayload, user: dict = Depends(verify_token)):
+    """Submit a query as a BigQuery job and return its handle without waiting for the query to finish."""
+    username = user.get('username', 'unknown')
+    logger.info("SUBMIT_JOB started - User: %s, Market: %s, Query: %s",
+                username, payload.market, payload.query[:100] + "..." if len(payload.query) > 100 else payload.query)
+
+    if os.getenv("TEST_MODE") == "true":
+        logger.info("TEST_MODE enabled - returning mock response")
+        return JSONResponse(content={"message": "Mocked response in test mode"}, status_code=200)
+
+    _check_market_access(user, username, payload.market)
+    config = get_market_resources(payload.market).config
+    try:
+        # Jobs are not bound to a request, so they get a longer estimated-time limit than /execute_query
+        rejection, _ = check_query_before_execution(
+            payload.query, payload.market, username,
+            max_seconds=config.getint('QUERY_EXECUTION', 'job_max_estimated_seconds', fallback=600))
+        if rejection is not None:
+            return JSONResponse(
+                status_code=400,
+                content={'result': [], 'metadata': "", 'sql_query': "", 'textual_summary': [rejection], 'followup_prompts': [], "x-axis": "", "typeOFgraph": ""}
+            )
+        job_id = submit_query_job(payload.query, payload.market, username,
+                                  job_timeout_seconds=config.getint('QUERY_EXECUTION', 'job_timeout_seconds', fallback=1800))
+    except Exception as e:
+        logger.exception("SUBMIT_JOB_ERROR - User: %s, Market: %s, Error: %s", username, payload.market, str(e))
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
+    logger.info("SUBMIT_JOB completed - User: %s, Market: %s, Job ID: %s", username, payload.market, job_id)
+    return JSONResponse(content={"status": "success", "result": {"job_id": job_id, "state": "PENDING"}}, status_code=202)
+
+@jobs_router.get("/jobs/{job_id}")
+def job_status(job_id: str, market: str, user: dict = Depends(verify_token)):
+    """State and progress (bytes processed, slot-ms, completed stages) of one of the user's jobs."""
+    username = user.get('username', 'unknown')
+    _check_market_access(user, username, market)
+    try:
+        status = query_job_status(_get_job_or_404(job_id, market, username))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("JOB_STATUS_ERROR - User: %s, Job ID: %s, Error: %s", username, job_id, str(e))
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
+    logger.debug("JOB_STATUS - User: %s, Job ID: %s, State: %s", username, job_id, status['state'])
+    return JSONResponse(content={"status": "success", "result": status})
+
+@jobs_router.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str, payload: JobRequest, user: dict = Depends(verify_token)):
+    """Request cancellation; BigQuery cancels asynchronously, so poll the status for the final state."""
+    username = user.get('username', 'unknown')
+    _check_market_access(user, username, payload.market)
+    try:
+        job = _get_job_or_404(job_id, payload.market, username)
+        if job.state != 'DONE':
+            job.cancel()
+            job.reload()
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("CANCEL_JOB_ERROR - User: %s, Job ID: %s, Error: %s", username, job_id, str(e))
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
+    logger.info("CANCEL_JOB - User: %s, Job ID: %s, State: %s", username, job_id, job.state)
+    return JSONResponse(content={"status": "success", "result": query_job_status(job)})
+
+@jobs_router.get("/jobs/{job_id}/results")
+def job_results(job_id: str, market: str, page_token: Optional[str] = None, page_size: Optional[int] = None,
+                user: dict = Depends(verify_token)):
+    """One page of a finished job's rows; pass back next_page_token to read the following page."""
+    username = user.get('username', 'unknown')
+    _check_market_access(user, username, market)
+    config = get_market_resources(market).config
+    max_page_size = config.getint('QUERY_EXECUTION', 'job_max_page_size', fallback=10000)
+    page_size = min(page_size or config.getint('QUERY_EXECUTION', 'job_page_size', fallback=1000), max_page_size)
+    try:
+        job = _get_job_or_404(job_id, market, username)
+        if job.state != 'DONE':
+            raise HTTPException(status_code=409, detail=f"Job {job_id} is {job.state}; results are available once it is DONE")
+        if job.error_result:
+            raise HTTPException(status_code=400, detail=f"Job {job_id} failed: {job.error_result.get('message')}")
+        page = fetch_job_page(job, market, page_size=page_size, page_token=page_token)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("JOB_RESULTS_ERROR - User: %s, Job ID: %s, Error: %s", username, job_id, str(e))
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
+    logger.info("JOB_RESULTS - User: %s, Job ID: %s, Rows returned: %d, More: %s",
+                username, job_id, len(page['rows']), bool(page['next_page_token']))
+    return JSONResponse(
+        status_code=200,
+        content={'result': page['rows'], 'total_rows': page['total_rows'], 'next_page_token': page['next_page_token'],
+                 'metadata': "", 'sql_query': "", 'textual_summary': [], 'followup_prompts': [], "x-axis": "", "typeOFgraph": ""}
+    )
@@ -8,10 +8,9 @@ from src.utils.mock_ldap import verify_token
 from typing import Optional
 
 from src.database.db_connector import get_postgres_connection_params
-from src.utils.config_reader import load_config
 from src.database.postgres_loader import generate_id_key, generate_column_id_key
 from src.utils.logger import logger
-from src.database.db_config import GoogleCloudSqlUtility
+from src.services.market_registry import get_market_resources
 
 pg_router = APIRouter(tags=["metadata"])
 
@@ -37,10 +36,10 @@ def get_table_metadata(payload: TableMetadataRequest, user: dict = Depends(verif
             raise HTTPException(status_code=403, detail="Market access denied")
         
         logger.debug("Loading database connection params for market: %s", market)
-        db_util = GoogleCloudSqlUtility(market)
+        db_util = get_market_resources(market).db_util
         conn, connector = db_util.get_db_connection()
         
-        config = load_config(market)
+        config = get_market_resources(market).config
         project_id = config.get('Database', 'bigquery_project')
         dataset_id = config.get('Database', 'bigquery_dataset')
         
@@ -108,10 +107,10 @@ def get_column_metadata(payload: ColumnMetadataRequest, user: dict = Depends(ver
             raise HTTPException(status_code=403, detail="Market access denied")
         
         logger.debug("Loading database connection params for market: %s", market)
-        db_util = GoogleCloudSqlUtility(market)
+        db_util = get_market_resources(market).db_util
         conn, connector = db_util.get_db_connection()
         
-        config = load_config(market)
+        config = get_market_resources(market).config
         project_id = config.get('Database', 'bigquery_project')
         dataset_id = config.get('Database', 'bigquery_dataset')
         
@@ -191,7 +190,7 @@ def get_recommendations(payload: RecommendationTableRequest):
         #     raise HTTPException(status_code=403, detail="Market access denied")
         
         logger.debug("Loading database connection params for market: %s", market)
-        db_util = GoogleCloudSqlUtility(market)
+        db_util = get_market_resources(market).db_util
         conn, connector = db_util.get_db_connection()
         
         logger.debug("Connecting to PostgreSQL - Host: %s, Database: %s", conn, connector)
@@ -257,14 +256,14 @@ def get_audit_table(payload: AuditTableRequest, user: dict = Depends(verify_toke
     conn = None
     
     try:
-        db_util = GoogleCloudSqlUtility(market)
+        db_util = get_market_resources(market).db_util
         conn, connector = db_util.get_db_connection()
         cur = conn.cursor()
 
         entity_id = None
         if payload.table_name:
             try:
-                config = load_config(market)
+                config = get_market_resources(market).config
                 project_id = config.get('Database', 'bigquery_project')
                 dataset_id = config.get('Database', 'bigquery_dataset')
                 if payload.column_name:
@@ -326,7 +325,7 @@ def get_total_schemas(payload: StatsRequest):
                 content={"data": {"total_schemas": 42}}
             )
             
-        db_util = GoogleCloudSqlUtility(market)
+        db_util = get_market_resources(market).db_util
         conn, connector = db_util.get_db_connection()
         
         logger.debug("Connecting to PostgreSQL - Host: %s, Database: %s", conn, connector)
@@ -377,7 +376,7 @@ def get_total_queries(payload: StatsRequest):
                 content={"data": {"total_queries": 1000}}
             )
             
-        db_util = GoogleCloudSqlUtility(market)
+        db_util = get_market_resources(market).db_util
         conn, connector = db_util.get_db_connection()
         
         logger.debug("Connecting to PostgreSQL - Host: %s, Database: %s", conn, connector)
@@ -428,7 +427,7 @@ def get_total_query_scanned(payload: StatsRequest):
                 content={"data": {"total_query_scanned": 5000}}
             )
             
-        db_util = GoogleCloudSqlUtility(market)
+        db_util = get_market_resources(market).db_util
         conn, connector = db_util.get_db_connection()
         
         logger.debug("Connecting to PostgreSQL - Host: %s, Database: %s", conn, connector)
@@ -500,7 +499,7 @@ def rule_id(payload: RuleIdPayload):
         raise HTTPException(status_code=400, detail="Invalid rule_id")
 
     try:
-        db_util = GoogleCloudSqlUtility(market)
+        db_util = get_market_resources(market).db_util
         conn, connector = db_util.get_db_connection()
         cur = conn.cursor()
 
@@ -1,25 +1,37 @@
+import asyncio
 import warnings
 import json
 import os
 import re
+import time
 import nltk
 import httpx
 from concurrent.futures import TimeoutError
 from fastapi import APIRouter, Request, HTTPException, Depends
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse, Response
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
+from typing import Optional
 from langchain_community.document_loaders import JSONLoader
 
-from src.utils.config_reader import load_config
+from src.services.market_registry import get_market_resources, reload_market_resources
 from src.utils.nlp_utils import *
 from src.services.guardrails_service import *
 from src.services.text_to_sql_service import ConvertTextToSqlRequest
-from src.database.query_executor import execute
+from src.database.query_executor import (serialize_arrow, RESULT_FORMATS, open_arrow_stream,
+                                         encode_stream, STREAM_FORMATS)
+from src.services.result_cache import execute_with_cache
 from src.database.postgres_loader import PostgresLoader
 from src.services.cost_estimator import Estimate
+from src.services.query_guard import check_query_before_execution
 from src.utils.logger import logger
+from src.utils.rate_limiter import rate_limiter_stats
+from src.utils.sql_analyzer import analyze_sql, UNSAFE, UNSURE
+from src.llm.resilience import resilience_stats
+from src.llm.llm_connector import llm_usage_stats
 from src.utils.mock_ldap import verify_token
 from src.database.postgres_vector_loader import PostgresVectorLoader
+from src.database.vector_index_manager import VectorIndexManager, CONTEXT_TABLES
 from src.services.ragQueryPipline import RAGPipeline
 from src.utils.logger import logger
 from src.database.db_config import GoogleCloudSqlUtility
@@ -53,6 +65,129 @@ class QueryRequest(BaseModel):
     llm_type: str
     market: str
     
+def _rejection(message):
+    return JSONResponse(
+        status_code=400,
+        content={'result': [], 'metadata': "", 'sql_query': "", 'textual_summary': [message], 'followup_prompts': [], "x-axis": "", "typeOFgraph": ""}
+    )
+
+_PRE_CHECK_REJECTIONS = {
+    'analytical': "Sorry not a valid BI query. Could you please try again?",
+    'domain': "Sorry, it feels like query is out of my domain. Could you please try again?",
+}
+
+def _log_pre_check_rejection(failed_check, username):
+    if failed_check == 'analytical':
+        logger.warning("VALIDATION_FAILED - Query not identified as analytical for user: %s", username)
+    else:
+        logger.warning("Invalid domain query detected")
+
+async def _run_pre_generation_pipeline(query, llm_type, market, username):
+    """
+    Validation and cache stage shared by /generate_query and /generate_query_stream.
+
+    Returns:
+        dict: 'rejection' (JSONResponse or None), 'cached_sql', 'context_data', 'question_embedding'
+              'verdict_pending' (intent/domain checks deferred to the generation call) and
+              'known_verdict' (checks the local pre-filter already passed)
+    """
+    resources = get_market_resources(market)
+    config = resources.config
+    result = {'rejection': None, 'cached_sql': None, 'context_data': None, 'question_embedding': None,
+              'verdict_pending': False, 'known_verdict': {}}
+
+    logger.debug("Starting query validation pipeline")
+
+    # Validation 1: Invalid utterances
+    if invalid_utterance_in_prompt(query):
+        logger.warning("VALIDATION_FAILED - Invalid BI query detected for user: %s", username)
+        result['rejection'] = _rejection("The input doesn't appear to be a business-related query. Please provide a data question or request.")
+        return result
+
+    # Validation 2: English validation
+    if validate_english(query):
+        logger.warning("VALIDATION_FAILED - English validation failed for user: %s, query: %s", username, query[:50])
+        result['rejection'] = _rejection("The query doesn't seem to start with a valid English phrase or has malicious intent. Please revise and try again.")
+        return result
+
+    # Semantic cache: a near-identical question already passed every guardrail
+    semantic_cache = resources.semantic_cache
+    rag_pipeline = RAGPipeline(market)
+    if semantic_cache is not None:
+        try:
+            result['question_embedding'] = await asyncio.to_thread(rag_pipeline.get_embedding, query)
+            cached = await asyncio.to_thread(semantic_cache.lookup, result['question_embedding'], llm_type)
+        except Exception as e:
+            logger.warning("Semantic cache lookup failed for user: %s, Error: %s", username, str(e))
+            cached = None
+        if cached is not None:
+            logger.info("GENERATE_QUERY served from semantic cache for user: %s, similarity: %.4f, cached question: '%s'",
+                        username, cached['similarity'], cached['question'][:100])
+            result['cached_sql'] = cached['sql_query']
+            return result
+
+    # Local pre-filter answers clear-cut intent/domain cases without an LLM call
+    prefilter = resources.guardrail_prefilter
+    if prefilter is not None:
+        local_verdict = prefilter.classify(query)
+        failed_check = next((check for check in PRE_GENERATION_CHECKS if local_verdict[check] == 'False'), None)
+        if failed_check:
+            logger.info("Guardrail pre-filter rejected the query locally (%s) for user: %s", failed_check, username)
+            _log_pre_check_rejection(failed_check, username)
+            result['rejection'] = _rejection(_PRE_CHECK_REJECTIONS[failed_check])
+            return result
+        result['known_verdict'] = {check: value for check, value in local_verdict.items() if value == 'True'}
+        logger.debug("Guardrail pre-filter verdict: %s", local_verdict)
+
+    # Validations 3 and 4: analytical intent and domain checks run concurrently with RAG retrieval
+    context_fn = (lambda: rag_pipeline.query(query)) if llm_type == 'openai' else None
+    mode = guardrail_mode(config)
+    if mode == 'merged' and llm_type == 'openai':
+        logger.debug("Deferring intent and domain checks to the SQL generation call")
+        result['context_data'] = await asyncio.to_thread(context_fn)
+        result['verdict_pending'] = True
+        return result
+
+    logger.debug("Validating query intent and domain (%s mode) while retrieving context", mode)
+    failed_check, result['context_data'] = await run_pre_generation_checks(
+        query, config, context_fn=context_fn, mode='combined' if mode == 'combined' else 'separate',
+        known_verdict=result['known_verdict']
+    )
+    if failed_check:
+        _log_pre_check_rejection(failed_check, username)
+        result['rejection'] = _rejection(_PRE_CHECK_REJECTIONS[failed_check])
+    return result
+
+async def _check_generated_sql(sql_query, config, username):
+    """Run the post-generation security validations; returns the rejection message or None."""
+    logger.debug("Starting SQL security validations")
+
+    # Static analysis classifies the SQL; only statements it cannot vouch for go to the LLM
+    analysis = analyze_sql(sql_query)
+    logger.debug("SQL analyzer verdict: %s %s", analysis.verdict, analysis.reasons)
+
+    # Check for modification queries
+    if analysis.modifies:
+        logger.error("SECURITY_VIOLATION - Modification query detected for user: %s, SQL: %s", username, sql_query)
+        return "Query blocked: Modifications to the database (e.g., UPDATE, DELETE, DROP, etc.) are not permitted. Please try again with a valid query."
+
+    # Check for SQL injection
+    if analysis.verdict == UNSAFE:
+        logger.error("SECURITY_VIOLATION - SQL Injection detected by static analysis (%s) for user: %s, SQL: %s",
+                     ", ".join(analysis.reasons), username, sql_query)
+        return "SQL Injection detected in the Query. Query execution blocked by guardrails !!"
+    if analysis.verdict == UNSURE and await avalidate_query_for_sql_injection(sql_query, config) == 'True':
+        logger.error("SECURITY_VIOLATION - SQL Injection detected for user: %s, SQL: %s", username, sql_query)
+        return "SQL Injection detected in the Query. Query execution blocked by guardrails !!"
+    return None
+
+def _store_in_semantic_cache(market, query, question_embedding, llm_type, sql_query):
+    semantic_cache = get_market_resources(market).semantic_cache
+    if semantic_cache is not None and question_embedding is not None:
+        semantic_cache.store(query, question_embedding, llm_type, sql_query, verdicts={
+            'analytical': 'True', 'domain': 'True', 'modification': False, 'sql_injection': 'False'
+        })
+
 #Route for generating SQL query with logic and gaurdrails
 @router.post("/generate_query")
 async def generate_query(req: QueryRequest, user: dict = Depends(verify_token)):
@@ -69,69 +204,31 @@ async def generate_query(req: QueryRequest, user: dict = Depends(verify_token)):
         llm_type = req.llm_type
         market = req.market
 
-        logger.debug("Loading config for market: %s", market)
-        config = load_config(market)
-
-        logger.debug("Starting query validation pipeline")
-
-        # Validation 1: Invalid utterances
-        if invalid_utterance_in_prompt(query):
-            logger.warning("VALIDATION_FAILED - Invalid BI query detected for user: %s", username)
-            return JSONResponse(
-                status_code=400,
-                content={'result': [], 'metadata': "", 'sql_query': "", 'textual_summary': ["The input doesn't appear to be a business-related query. Please provide a data question or request."], 'followup_prompts': [], "x-axis": "", "typeOFgraph": ""}
-            )
-
-        # Validation 2: English validation
-        if validate_english(query):
-            logger.warning("VALIDATION_FAILED - English validation failed for user: %s, query: %s", username, query[:50])
-            return JSONResponse(
-                status_code=400,
-                content={'result': [], 'metadata': "", 'sql_query': "", 'textual_summary': ["The query doesn't seem to start with a valid English phrase or has malicious intent. Please revise and try again."], 'followup_prompts': [], "x-axis": "", "typeOFgraph": ""}
-            )
+        pipeline = await _run_pre_generation_pipeline(query, llm_type, market, username)
+        if pipeline['rejection'] is not None:
+            return pipeline['rejection']
+        if pipeline['cached_sql'] is not None:
+            return JSONResponse(content={'sql_query_generated': pipeline['cached_sql']})
 
-        # Validation 3: Analytical intent validation
-        logger.debug("Validating query intent for analytical purpose")
-        validation_res = validate_query_intent_for_analytical(query, config)
-        if validation_res == 'False':
-            logger.warning("VALIDATION_FAILED - Query not identified as analytical for user: %s", username)
-            return JSONResponse(
-                status_code=400,
-                content={'result': [], 'metadata': "", 'sql_query': "", 'textual_summary': ["Sorry not a valid BI query. Could you please try again?"], 'followup_prompts': [], "x-axis": "", "typeOFgraph": ""}
-            )
-         
-        validation_res = validate_query_for_invalid_domain_query(query, config)
-        if validation_res == 'False':
-            logger.warning("Invalid domain query detected")
-            return JSONResponse(
-                status_code=400,
-                content={'result': [], 'metadata': "", 'sql_query': "", 'textual_summary': ["Sorry, it feels like query is out of my domain. Could you please try again?"], 'followup_prompts': [], "x-axis": "", "typeOFgraph": ""}
-            ) 
-                 
         # SQL Generation
         logger.info("Starting SQL generation using LLM for user: %s", username)
-        request = ConvertTextToSqlRequest(query, llm_type, market)
-        sql_query = request.convert_text_to_sql_using_llm()
+        request = ConvertTextToSqlRequest(query, llm_type, market, include_verdict=pipeline['verdict_pending'])
+        sql_query = await asyncio.to_thread(request.convert_text_to_sql_using_llm, pipeline['context_data'])
+        if pipeline['verdict_pending']:
+            failed_check = await resolve_pre_generation_verdict(dict(pipeline['known_verdict'], **request.verdict), query, request.config)
+            if failed_check:
+                _log_pre_check_rejection(failed_check, username)
+                return _rejection(_PRE_CHECK_REJECTIONS[failed_check])
         logger.info("SQL generated successfully for user: %s, SQL: %s", username, sql_query[:200] + "..." if len(sql_query) > 200 else sql_query)
+        if request.last_usage:
+            logger.info("SQL generation token usage for user: %s - %s", username, request.last_usage)
 
         # SQL Security Validations
-        logger.debug("Starting SQL security validations")
-
-        # Check for modification queries
-        if check_for_modification_in_query(sql_query=sql_query):
-            logger.error("SECURITY_VIOLATION - Modification query detected for user: %s, SQL: %s", username, sql_query)
-            return JSONResponse(
-                status_code=400,
-                content={'result': [], 'metadata': "", 'sql_query': "", 'textual_summary': ["Query blocked: Modifications to the database (e.g., UPDATE, DELETE, DROP, etc.) are not permitted. Please try again with a valid query."], 'followup_prompts': [], "x-axis": "", "typeOFgraph": ""}
-            )
+        rejection_message = await _check_generated_sql(sql_query, request.config, username)
+        if rejection_message:
+            return _rejection(rejection_message)
 
-        # Check for SQL injection
-        if validate_query_for_sql_injection(sql_query, config) == 'True':
-            logger.error("SECURITY_VIOLATION - SQL Injection detected for user: %s, SQL: %s", username, sql_query)
-            return JSONResponse(
-                status_code=400,
-                content={'result': [], 'metadata': "", 'sql_query': "", 'textual_summary': ["SQL Injection detected in the Query. Query execution blocked by guardrails !!"], 'followup_prompts': [], "x-axis": "", "typeOFgraph": ""}
-            )
+        _store_in_semantic_cache(market, query, pipeline['question_embedding'], llm_type, sql_query)
 
         ans = {'sql_query_generated': sql_query}
         logger.info("GENERATE_QUERY completed successfully for user: %s", username)
@@ -142,9 +239,97 @@ async def generate_query(req: QueryRequest, user: dict = Depends(verify_token)):
                         username, query[:100], str(e))
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
+def _sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+#Streaming variant of /generate_query: SQL is forwarded as server-sent events while the LLM generates it
+@router.post("/generate_query_stream")
+async def generate_query_stream(req: QueryRequest, user: dict = Depends(verify_token)):
+    """
+    Events:
+        sql: {"delta": str} - SQL fragments as they are generated
+        done: {"sql_query_generated": str} - final SQL once security validations passed
+        error: {"textual_summary": [str]} - guardrail rejection or failure; discard any streamed SQL
+
+    Rejections before generation starts are returned as a regular 400 JSON response.
+    """
+    username = user.get('username', 'unknown')
+    logger.info("GENERATE_QUERY_STREAM started - User: %s, Market: %s, Query: '%s'",
+                username, req.market, req.query[:100] + "..." if len(req.query) > 100 else req.query)
+
+    if os.getenv("TEST_MODE") == "true":
+        logger.info("TEST_MODE enabled - returning mock response")
+        return JSONResponse(content={"message": "Mocked response in test mode", "user": user}, status_code=200)
+
+    query = req.query
+    llm_type = req.llm_type
+    market = req.market
+    try:
+        pipeline = await _run_pre_generation_pipeline(query, llm_type, market, username)
+    except Exception as e:
+        logger.exception("GENERATE_QUERY_STREAM_ERROR - Unexpected error for user: %s, Query: %s, Error: %s",
+                        username, query[:100], str(e))
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+    if pipeline['rejection'] is not None:
+        return pipeline['rejection']
+
+    async def events():
+        if pipeline['cached_sql'] is not None:
+            yield _sse_event("sql", {"delta": pipeline['cached_sql']})
+            yield _sse_event("done", {"sql_query_generated": pipeline['cached_sql']})
+            return
+
+        try:
+            request = ConvertTextToSqlRequest(query, llm_type, market, include_verdict=pipeline['verdict_pending'])
+            verdict_checked = not pipeline['verdict_pending']
+            fragments = []
+            sql_stream = request.stream_sql(pipeline['context_data'])
+            async for fragment in sql_stream:
+                # Merged mode: the verdict precedes the SQL, so check it before forwarding anything
+                if not verdict_checked:
+                    verdict_checked = True
+                    failed_check = await resolve_pre_generation_verdict(dict(pipeline['known_verdict'], **request.verdict), query, request.config)
+                    if failed_check:
+                        _log_pre_check_rejection(failed_check, username)
+                        yield _sse_event("error", {"textual_summary": [_PRE_CHECK_REJECTIONS[failed_check]]})
+                        await sql_stream.aclose()
+                        return
+                fragments.append(fragment)
+                yield _sse_event("sql", {"delta": fragment})
+            if not verdict_checked:
+                failed_check = await resolve_pre_generation_verdict(dict(pipeline['known_verdict'], **request.verdict), query, request.config)
+                if failed_check:
+                    _log_pre_check_rejection(failed_check, username)
+                    yield _sse_event("error", {"textual_summary": [_PRE_CHECK_REJECTIONS[failed_check]]})
+                    return
+            sql_query = "".join(fragments)
+            logger.info("SQL streamed successfully for user: %s, SQL: %s", username, sql_query[:200] + "..." if len(sql_query) > 200 else sql_query)
+
+            rejection_message = await _check_generated_sql(sql_query, request.config, username)
+            if rejection_message:
+                yield _sse_event("error", {"textual_summary": [rejection_message]})
+                return
+
+            _store_in_semantic_cache(market, query, pipeline['question_embedding'], llm_type, sql_query)
+            logger.info("GENERATE_QUERY_STREAM completed successfully for user: %s", username)
+            yield _sse_event("done", {"sql_query_generated": sql_query})
+        except Exception as e:
+            logger.exception("GENERATE_QUERY_STREAM_ERROR - Unexpected error for user: %s, Query: %s, Error: %s",
+                            username, query[:100], str(e))
+            yield _sse_event("error", {"textual_summary": [f"Unexpected error: {str(e)}"]})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 class QueryPayload(BaseModel):
     query: str
     market: str
+    # 'json', 'arrow' or 'parquet' fetch the result as Arrow record batches; None keeps the row-by-row path
+    result_format: Optional[str] = None
+    # Stream the result page by page as 'ndjson' (default) or 'arrow' (IPC stream) instead of one response body
+    stream: Optional[bool] = False
+    # Lowers the configured stream_max_rows for this request
+    max_rows: Optional[int] = None
 
 @router.post("/execute_query")
 def execute_query(payload: QueryPayload, user: dict = Depends(verify_token)):
@@ -157,85 +342,19 @@ def execute_query(payload: QueryPayload, user: dict = Depends(verify_token)):
         return JSONResponse(content={"message": "Mocked response in test mode"}, status_code=200) 
     
     try:
-        logger.debug("Estimating query cost and execution time for user: %s", username)
-        estimate = Estimate(payload.query, payload.market)
-        cost_result = estimate.estimate_query_cost()
-
-        if cost_result.get("status") == "error":
-            logger.error("EXECUTE_QUERY_ESTIMATION_ERROR - User: %s, Error: %s", username, cost_result.get("error_message"))
-            raise Exception(cost_result["error_message"])
-            
-        cost_usd = cost_result.get('estimated_cost_usd', 0)
-        bytes_processed = cost_result.get('bytes_processed', 0)
-        
-        # Heuristic timeout calculation (1GB/s processing speed)
-        estimated_seconds = bytes_processed / (1024 ** 3) if bytes_processed > 0 else 0
-        
-        logger.info("EXECUTE_QUERY_ESTIMATES - User: %s, Cost: $%.6f, Estimated time: %.1fs", 
-                   username, cost_usd, estimated_seconds)
-        
-        # Check cost limit ($10.00)
-        if cost_usd > 10.0:
-            logger.warning("EXECUTE_QUERY_BLOCKED - Cost limit exceeded - User: %s, Cost: $%.6f > $10.00", 
-                          username, cost_usd)
-            return JSONResponse(
-                status_code=400,
-                content={
-                    'result': [], 
-                    'metadata': "", 
-                    'sql_query': "", 
-                    'textual_summary': [f"Query execution blocked: Cost ${cost_usd:.2f} exceeds limit of $10.00"], 
-                    'followup_prompts': [], 
-                    "x-axis": "", 
-                    "typeOFgraph": ""
-                }
-            )
-        
-        # Check time limit (30 seconds)
-        if estimated_seconds > 30:
-            logger.warning("EXECUTE_QUERY_BLOCKED - Time limit exceeded - User: %s, Estimated time: %.1fs > 30s", 
-                          username, estimated_seconds)
-            return JSONResponse(
-                status_code=400,
-                content={
-                    'result': [], 
-                    'metadata': "", 
-                    'sql_query': "", 
-                    'textual_summary': [f"Query execution blocked: Estimated execution time {estimated_seconds:.1f}s exceeds limit of 30s"], 
-                    'followup_prompts': [], 
-                    "x-axis": "", 
-                    "typeOFgraph": ""
-                }
-            )
-        
+        rejection, estimate = check_query_before_execution(payload.query, payload.market, username)
+        if rejection is not None:
+            return _rejection(rejection)
+
         # Execute the query with a 30-second timeout
         timeout = 30
         
         logger.debug("Executing query with timeout: %ss for user: %s", timeout, username)
         
-        if is_dml_query(payload.query):
-            logger.error("SECURITY_VIOLATION - DML query detected for user: %s, SQL: %s", username, payload.query)
-            return JSONResponse(
-                status_code=400,
-                content={'result': [], 'metadata': "", 'sql_query': "", 'textual_summary': ["DML query detected in the Query. Query execution blocked by guardrails !!"], 'followup_prompts': [], "x-axis": "", "typeOFgraph": ""}
-            )
-        
-        if payload.query == '':
-            logger.error("SECURITY_VIOLATION - Query is None for user: %s", username)
-            return JSONResponse(
-                status_code=400,
-                content={'result': [], 'metadata': "", 'sql_query': "", 'textual_summary': ["No query was detected. Kindly input a valid search query to proceed."], 'followup_prompts': [], "x-axis": "", "typeOFgraph": ""}
-            )
-        
-        result = execute(payload.query, payload.market, timeout=timeout)
-        
-        result_count = len(result) if isinstance(result, list) else "N/A"
-        logger.info("EXECUTE_QUERY completed - User: %s, Rows returned: %s, Result: %s", username, result_count, result)
-        
-        return JSONResponse(
-            status_code=200,
-            content={'result': result, 'metadata': "", 'sql_query': "", 'textual_summary': [], 'followup_prompts': [], "x-axis": "", "typeOFgraph": ""}
-        )
+        if payload.stream:
+            return _execute_query_stream(payload, timeout, username)
+        # Without a result_format this is the dashboards' JSON path; it is served through the result cache too
+        return _execute_query_columnar(payload, timeout, username, estimate.get('referenced_tables'))
     except Exception as e:
         logger.exception("EXECUTE_QUERY_ERROR - User: %s, Market: %s, Query: %s, Error: %s", 
                         username, payload.market, payload.query[:50], str(e))
@@ -244,6 +363,70 @@ def execute_query(payload: QueryPayload, user: dict = Depends(verify_token)):
             content={'result': [], 'metadata': "", 'sql_query': "", 'textual_summary': [f"BigQuery Error: {str(e)}"], 'followup_prompts': [], "x-axis": "", "typeOFgraph": ""}
         )
 
+def _execute_query_columnar(payload: QueryPayload, timeout: int, username: str, referenced_tables=None):
+    """Arrow execution path of /execute_query: the result is serialised from columnar buffers (JSON by default)."""
+    result_format = (payload.result_format or 'json').strip().lower()
+    if result_format not in RESULT_FORMATS:
+        return JSONResponse(
+            status_code=400,
+            content={'result': [], 'metadata': "", 'sql_query': "", 'textual_summary': [f"Unsupported result_format '{payload.result_format}'. Use one of: {', '.join(RESULT_FORMATS)}."], 'followup_prompts': [], "x-axis": "", "typeOFgraph": ""}
+        )
+
+    table, stats = execute_with_cache(payload.query, payload.market, timeout, referenced_tables)
+    started = time.perf_counter()
+    body = serialize_arrow(table, result_format)
+    stats['serialize_seconds'] = round(time.perf_counter() - started, 4)
+    elapsed = stats['fetch_seconds'] + stats['serialize_seconds']
+    stats['rows_per_second'] = round(stats['rows'] / elapsed, 1) if elapsed > 0 else None
+    stats['result_format'] = result_format
+    stats['result_bytes'] = len(body)
+    logger.info("EXECUTE_QUERY completed - User: %s, Rows returned: %s, Format: %s, Bytes: %s, Rows/s: %s, Cache: %s",
+                username, stats['rows'], result_format, len(body), stats['rows_per_second'], stats['result_cache'])
+
+    if result_format == 'json':
+        # The result array is already encoded; splice it into the usual envelope instead of re-parsing it
+        envelope = {'metadata': "", 'sql_query': "", 'textual_summary': [], 'followup_prompts': [], "x-axis": "", "typeOFgraph": "", 'execution_stats': stats}
+        content = b'{"result":' + body + b',' + json.dumps(envelope).encode('utf-8')[1:]
+        return Response(content=content, status_code=200, media_type=RESULT_FORMATS['json'])
+    return Response(
+        content=body, status_code=200, media_type=RESULT_FORMATS[result_format],
+        headers={'X-Row-Count': str(stats['rows']), 'X-Rows-Per-Second': str(stats['rows_per_second']),
+                 'X-Execution-Stats': json.dumps(stats)}
+    )
+
+def _execute_query_stream(payload: QueryPayload, timeout: int, username: str):
+    """Streaming path of /execute_query: one encoded chunk per BigQuery result page, with row/byte cutoffs."""
+    result_format = (payload.result_format or 'ndjson').strip().lower()
+    if result_format not in STREAM_FORMATS:
+        return JSONResponse(
+            status_code=400,
+            content={'result': [], 'metadata': "", 'sql_query': "", 'textual_summary': [f"Unsupported result_format '{payload.result_format}' for streaming. Use one of: {', '.join(STREAM_FORMATS)}."], 'followup_prompts': [], "x-axis": "", "typeOFgraph": ""}
+        )
+
+    config = get_market_resources(payload.market).config
+    page_size = config.getint('QUERY_EXECUTION', 'stream_page_size', fallback=10000)
+    max_rows = config.getint('QUERY_EXECUTION', 'stream_max_rows', fallback=1000000)
+    max_bytes = config.getint('QUERY_EXECUTION', 'stream_max_bytes', fallback=512 * 1024 * 1024)
+    if payload.max_rows and payload.max_rows > 0:
+        max_rows = min(max_rows, payload.max_rows) if max_rows else payload.max_rows
+
+    # Runs the query before the response starts, so query errors still get the JSON error envelope
+    job_id, batches, schema = open_arrow_stream(payload.query, payload.market, timeout=timeout, page_size=page_size)
+
+    def chunks():
+        # A sync generator is iterated in the threadpool one chunk at a time as the client reads,
+        # so at most one result page is in memory per request
+        stats = {}
+        try:
+            yield from encode_stream(batches, schema, result_format, max_rows=max_rows, max_bytes=max_bytes, stats=stats)
+        finally:
+            logger.info("EXECUTE_QUERY completed - User: %s, Mode: stream, Format: %s, Rows: %s, Bytes: %s, "
+                        "Truncated: %s, Rows/s: %s, Job ID: %s", username, result_format, stats.get('rows'),
+                        stats.get('bytes'), stats.get('truncated'), stats.get('rows_per_second'), job_id)
+
+    return StreamingResponse(chunks(), media_type=STREAM_FORMATS[result_format],
+                             headers={'X-Job-Id': job_id, 'X-Accel-Buffering': 'no'})
+
 class MetadataRequest(BaseModel):
     metadata_type: str  # "table" or "column"
     market: str
@@ -367,6 +550,8 @@ def estimate_cost(payload: QueryPayload, user: dict = Depends(verify_token)):
 class RAGQueryRequest(BaseModel):
     market: str
     question: str
+    ef_search: Optional[int] = None
+    probes: Optional[int] = None
 
 # This endpoint queries the RAG pipeline for a given question and market and returns top relevant contexts.
 @router.post("/rag_query")
@@ -379,7 +564,7 @@ def query_rag(request: RAGQueryRequest):
     try:
         logger.debug("Creating RAG_Pipeline instance")
         query = RAGPipeline(request.market)
-        result = query.query(request.question)
+        result = query.query(request.question, ef_search=request.ef_search, probes=request.probes)
         logger.debug("Returning result: %s", result)
         return JSONResponse(content={"result": result}, status_code=200)
 
@@ -387,147 +572,123 @@ def query_rag(request: RAGQueryRequest):
         logger.error("RAG_QUERY_ERROR found: %s", str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
+def _load_metadata_records(file_path: str, jq_schema: str, project_id: str, dataset_id: str) -> list:
+    """Load metadata records from a JSON file, accepting either single objects or lists of objects."""
+    data = JSONLoader(
+        file_path=file_path,
+        jq_schema=jq_schema,
+        text_content=False,
+        json_lines=False
+    ).load()
+
+    records = []
+    for doc in data:
+        content = json.loads(doc.page_content)
+        for record in (content if isinstance(content, list) else [content]):
+            record['data_source_id'] = project_id
+            record['data_namespace'] = dataset_id
+            records.append(record)
+    return records
+
 @router.post("/pg_vector_loader")
 def pg_vector_loader(request: MetadataRequest):
+    logger.info("PG_VECTOR_LOADER started - Type: %s, Market: %s", request.metadata_type, request.market)
+
     if os.getenv("TEST_MODE") == "true":
         return JSONResponse(content={"message": "Mocked response in test mode"}, status_code=200)
     
-    config = load_config(request.market)
-    tables_path = config.get('Database', 'tables_path')
-    columns_path = config.get('Database', 'columns_path')
+    config = get_market_resources(request.market).config
+    db_tables_path = config.get('Database', 'tables_path')
+    db_column_path = config.get('Database', 'columns_path')
     project_id = config.get('Database', 'bigquery_project')
     dataset_id = config.get('Database', 'bigquery_dataset')
 
-    postgres_vector_loader = PostgresVectorLoader(request.market)
-
     if request.metadata_type == "table":
-        # postgres_vector_loader.create_table_context()
-        data = JSONLoader(
-            file_path=tables_path,
-            jq_schema='.',
-            text_content=False,
-            json_lines=False
-        ).load()
-
-        for doc in data:
-            record = json.loads(doc.page_content)
-            record['data_source_id'] = project_id
-            record['data_namespace'] = dataset_id
-            postgres_vector_loader.insert_table_context(record, "table_context")
-
-        return JSONResponse(
-            content={"status": "success", "message": "table_context metadata inserted successfully"},
-            status_code=200
-        )
-
+        file_path, jq_schema, table_name = db_tables_path, '.', "table_context"
     elif request.metadata_type == "column":
-        # postgres_vector_loader.create_column_context()
-        try:
-            data = JSONLoader(
-                file_path=columns_path,
-                jq_schema='.[]',
-                text_content=False,
-                json_lines=False
-            ).load()
-        except Exception as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Error loading column metadata: {str(e)}"
-            )
-    
-        for doc in data:
-            record = json.loads(doc.page_content)
-            record['data_source_id'] = project_id
-            record['data_namespace'] = dataset_id
-            postgres_vector_loader.insert_column_context(record, "column_context")
-            
-        return JSONResponse(
-            content={"status": "success", "message": "column_context metadata inserted successfully"},
-            status_code=200
-        )
-        
+        file_path, jq_schema, table_name = db_column_path, '.[]', "column_context"
     else:
         raise HTTPException(
             status_code=400,
             detail="Invalid metadata_type. Must be 'table' or 'column'."
         )
 
-    # except Exception as e:
-    #     raise HTTPException(
-    #         status_code=500,
-    #         detail=f"Unexpected error: {str(e)}"
-    #     )
+    try:
+        records = _load_metadata_records(file_path, jq_schema, project_id, dataset_id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error loading {request.metadata_type} metadata: {str(e)}"
+        )
+
+    try:
+        postgres_vector_loader = PostgresVectorLoader(request.market)
+        stats = postgres_vector_loader.load_contexts(records, table_name, request.metadata_type)
+        if stats.get("inserted") or stats.get("updated") or stats.get("deleted"):
+            get_market_resources(request.market).invalidate_context_caches(f"{table_name} reloaded")
+    except Exception as e:
+        logger.exception("PG_VECTOR_LOADER_ERROR - Type: %s, Error: %s", request.metadata_type, str(e))
+        raise HTTPException(
+            status_code=500,
+            detail=f"Unexpected error: {str(e)}"
+        )
+
+    logger.info("PG_VECTOR_LOADER completed - Type: %s, Stats: %s", request.metadata_type, stats)
+    return JSONResponse(
+        content={"status": "success", "message": f"{table_name} metadata inserted successfully", **stats},
+        status_code=200
+    )
+
+class VectorIndexRequest(BaseModel):
+    market: str
+    action: str  # "build", "rebuild", "drop" or "report"
+    metadata_type: Optional[str] = None  # "table", "column" or None for both
+    method: Optional[str] = None  # "hnsw" or "ivfflat"
+    m: Optional[int] = None
+    ef_construction: Optional[int] = None
+    lists: Optional[int] = None
+
+@router.post("/pg_vector_index")
+def pg_vector_index(request: VectorIndexRequest, user: dict = Depends(verify_token)):
+    username = user.get('username', 'unknown')
+    logger.info("PG_VECTOR_INDEX started - User: %s, Market: %s, Action: %s, Type: %s",
+                username, request.market, request.action, request.metadata_type)
 
-@router.post("/pg_vector_loader")
-def pg_vector_loader(request: MetadataRequest):
     if os.getenv("TEST_MODE") == "true":
         return JSONResponse(content={"message": "Mocked response in test mode"}, status_code=200)
-    
-    config = load_config(request.market)
-    db_tables_path = config.get('Database', 'tables_path')
-    db_column_path = config.get('Database', 'columns_path')
-    project_id = config.get('Database', 'bigquery_project')
-    dataset_id = config.get('Database', 'bigquery_dataset')
 
-    postgres_vector_loader = PostgresVectorLoader(request.market)
+    table_by_type = {"table": "table_context", "column": "column_context"}
+    if request.metadata_type and request.metadata_type not in table_by_type:
+        raise HTTPException(status_code=400, detail="Invalid metadata_type. Must be 'table' or 'column'.")
+    tables = [table_by_type[request.metadata_type]] if request.metadata_type else list(CONTEXT_TABLES)
 
-    if request.metadata_type == "table":
-        data = JSONLoader(
-            file_path=db_tables_path,
-            jq_schema='.',
-            text_content=False,
-            json_lines=False
-        ).load()
-
-        for doc in data:
-            records = json.loads(doc.page_content)
-            # Check if records is a list or a single record
-            if isinstance(records, list):
-                for record in records:
-                    record['data_source_id'] = project_id
-                    record['data_namespace'] = dataset_id
-                    postgres_vector_loader.insert_table_context(record, "table_context")
-            else:
-                # Handle case where it's a single record
-                records['data_source_id'] = project_id
-                records['data_namespace'] = dataset_id
-                postgres_vector_loader.insert_table_context(records, "table_context")
+    try:
+        manager = VectorIndexManager(request.market)
+        if request.action == "build":
+            result = [manager.build_index(table, method=request.method, m=request.m,
+                                          ef_construction=request.ef_construction, lists=request.lists)
+                      for table in tables]
+        elif request.action == "rebuild":
+            result = [entry for table in tables for entry in manager.rebuild_index(table)]
+        elif request.action == "drop":
+            for table in tables:
+                manager.drop_index(table, method=request.method)
+            result = []
+        elif request.action == "report":
+            result = [entry for table in tables for entry in manager.report(table)]
+        else:
+            raise HTTPException(status_code=400, detail="Invalid action. Must be 'build', 'rebuild', 'drop' or 'report'.")
 
-        return JSONResponse(
-            content={"status": "success", "message": "table_context metadata inserted successfully"},
-            status_code=200
-        )
+        logger.info("PG_VECTOR_INDEX completed - User: %s, Action: %s, Indexes: %d", username, request.action, len(result))
+        return JSONResponse(content={"status": "success", "result": jsonable_encoder(result)}, status_code=200)
 
-    elif request.metadata_type == "column":
-        try:
-            data = JSONLoader(
-                file_path=db_column_path,
-                jq_schema='.[]',
-                text_content=False,
-                json_lines=False
-            ).load()
-        except Exception as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Error loading column metadata: {str(e)}"
-            )
-    
-        for doc in data:
-            record = json.loads(doc.page_content)
-            record['data_source_id'] = project_id
-            record['data_namespace'] = dataset_id
-            postgres_vector_loader.insert_column_context(record, "column_context")
-            
-        return JSONResponse(
-            content={"status": "success", "message": "column_context metadata inserted successfully"},
-            status_code=200
-        )
-        
-    else:
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid metadata_type. Must be 'table' or 'column'."
-        )
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.exception("PG_VECTOR_INDEX_ERROR - Action: %s, Error: %s", request.action, str(e))
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
 class Payload(BaseModel):
     market: str
@@ -544,6 +705,34 @@ def test_cloudsql_connection(payload: Payload):
     except Exception as e:
         return JSONResponse(content={"status": "error", "message": str(e)}, status_code=500)
 
+@router.post("/reload_market")
+def reload_market(payload: Payload, user: dict = Depends(verify_token)):
+    username = user.get('username', 'unknown')
+    logger.info("RELOAD_MARKET requested - User: %s, Market: %s", username, payload.market)
+    released = reload_market_resources(payload.market)
+    return JSONResponse(content={"status": "success", "reloaded_markets": released})
+
+@router.post("/cache_stats")
+def cache_stats(payload: Payload, user: dict = Depends(verify_token)):
+    resources = get_market_resources(payload.market)
+    embedding_cache = resources.embedding_cache
+    semantic_cache = resources.semantic_cache
+    stats = {
+        "embedding_cache": embedding_cache.stats() if embedding_cache else None,
+        "semantic_cache": semantic_cache.stats() if semantic_cache else None,
+        "result_cache": resources.result_cache.stats() if resources.result_cache else None,
+        "estimate_cache": resources.estimate_cache.stats() if resources.estimate_cache else None,
+    }
+    return JSONResponse(content={"status": "success", "market": payload.market, "result": stats})
+
+@router.get("/llm_metrics")
+def llm_metrics(user: dict = Depends(verify_token)):
+    return JSONResponse(content={"status": "success", "result": {
+        "rate_limiter": rate_limiter_stats(),
+        "llm_endpoints": resilience_stats(),
+        "token_usage": llm_usage_stats(),
+    }})
+
 # @router.post("/postgres_loader/")
 # async def postgres_loader(request: MetadataRequest):
 #     logger.info("LOAD_METADATA: %s", request.metadata_type)
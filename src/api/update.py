@@ -15,6 +15,7 @@ from src.database.audit_loader import get_table_audit_data, get_column_audit_dat
 from src.utils.mock_ldap import verify_token
 from src.utils.logger import logger
 from src.database.postgres_vector_loader import PostgresVectorLoader
+from src.services.market_registry import get_market_resources
 
 update_router = APIRouter(tags=["context update"])
 
@@ -111,6 +112,7 @@ def update_table(payload: TableUpdateRequest, user: dict = Depends(verify_token)
             )
 
         conn.commit()
+        get_market_resources(payload.market).invalidate_context_caches("table_context updated")
         logger.info("UPDATE_TABLE completed successfully - User: %s, Market: %s, Table: %s, Rows updated: %d", 
                     username, payload.market, payload.table_name, len(rows_to_update))
         return JSONResponse(status_code=200, content={"message": "Row(s) update successful."})
@@ -228,6 +230,7 @@ def update_columns(payload: ColumnUpdateRequest, user: dict = Depends(verify_tok
             )
 
         conn.commit()
+        get_market_resources(payload.market).invalidate_context_caches("column_context updated")
         logger.info("UPDATE_COLUMNS completed successfully - User: %s, Market: %s, Table: %s, Column: %s, Rows updated: %d", 
                     username, payload.market, payload.table_name, payload.column_name, len(rows_to_update))
         return JSONResponse(status_code=200, content={"message": "Column row(s) update successful."})
@@ -1,4 +1,5 @@
 import configparser
+import threading
 import urllib.parse
 from google.cloud.sql.connector import Connector
 import os
@@ -6,8 +7,8 @@ import sqlalchemy
 from src.utils.config_reader import load_config
 
 class GoogleCloudSqlUtility:
-    def __init__(self, market):
-        self.config = load_config(market)
+    def __init__(self, market, config=None, shared_connector=False):
+        self.config = config if config is not None else load_config(market)
         self.section = 'GCLOUD_DB'
         self.project_id = self.config.get(self.section, 'project_id')
         self.region = self.config.get(self.section, 'region')
@@ -21,13 +22,41 @@ class GoogleCloudSqlUtility:
 
         self.service_account_file = self.config.get(self.section, 'service_account_file', fallback=None)
         self.dataset_id = self.config.get(self.section, 'dataset_id', fallback=None)
+        self.bq_location = self.config.get(
+            self.section, 'bq_location',
+            fallback=self.config.get('extraction_utility', 'bq_location', fallback=None)
+        )
+
+        # A shared connector is kept open for the utility's lifetime so certificates
+        # and IAM tokens are refreshed in the background instead of on every query
+        self.shared_connector = shared_connector
+        self._connector = None
+        self._connector_lock = threading.Lock()
         # Set the environment variable for Google credentials if service_account_file is provided
         if self.service_account_file:
             os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = self.service_account_file
 
+    def _get_connector(self):
+        if not self.shared_connector:
+            return Connector()
+        with self._connector_lock:
+            if self._connector is None:
+                self._connector = Connector()
+            return self._connector
+
+    def release_connector(self, connector):
+        if connector is not None and connector is not self._connector:
+            connector.close()
+
+    def close(self):
+        with self._connector_lock:
+            if self._connector is not None:
+                self._connector.close()
+                self._connector = None
+
     def get_db_connection(self):
         try:
-            connector = Connector()
+            connector = self._get_connector()
             conn = connector.connect(
                 self.instance_connection_name,
                 "pg8000",
@@ -60,7 +89,7 @@ class GoogleCloudSqlUtility:
             return None
         finally:
             conn.close()
-            connector.close()
+            self.release_connector(connector)
 
     def insert(self, query, params=None):
         return self.execute_query(query, params)
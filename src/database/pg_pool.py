@@ -0,0 +1,215 @@
+"""
+Bounded, thread-safe psycopg2 connection pool used for pgvector retrieval.
+
+Connections are leased and returned instead of being opened per request, which
+avoids paying the TCP/TLS/auth handshake on every RAG lookup. Idle connections
+are health-checked before reuse and recycled once they exceed their max lifetime.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+from src.utils.logger import logger
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection could be leased before the timeout expired."""
+
+
+class PoolClosedError(Exception):
+    """Raised when leasing from a pool that has been closed."""
+
+
+class _PooledConnection:
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        # Per-connection scratch space (e.g. names of server-side prepared statements)
+        self.state = {}
+
+
+class PgConnectionPool:
+    def __init__(self, host, port, database, user, password, min_size=1, max_size=10,
+                 max_lifetime=1800, health_check_interval=30, acquire_timeout=10, name="postgres"):
+        self.connect_kwargs = dict(host=host, port=port, dbname=database, user=user, password=password)
+        self.min_size = max(0, int(min_size))
+        self.max_size = max(1, int(max_size))
+        self.max_lifetime = float(max_lifetime)
+        self.health_check_interval = float(health_check_interval)
+        self.acquire_timeout = float(acquire_timeout)
+        self.name = name
+
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._leased = {}
+        self._size = 0
+        self._closed = False
+        self._stats = {'leases': 0, 'created': 0, 'recycled': 0, 'failed_health_checks': 0, 'timeouts': 0}
+
+        logger.info(f"Connection pool '{name}' configured - min: {self.min_size}, max: {self.max_size}, "
+                    f"max lifetime: {self.max_lifetime}s")
+        self._prefill()
+
+    def _prefill(self):
+        for _ in range(self.min_size):
+            try:
+                record = self._open()
+            except Exception as e:
+                logger.warning(f"Connection pool '{self.name}' prefill failed: {e}")
+                return
+            with self._cond:
+                self._size += 1
+                self._idle.append(record)
+
+    def _open(self):
+        conn = psycopg2.connect(**self.connect_kwargs)
+        self._stats['created'] += 1
+        logger.debug(f"Connection pool '{self.name}' opened a new connection")
+        return _PooledConnection(conn)
+
+    def _expired(self, record):
+        return self.max_lifetime > 0 and time.monotonic() - record.created_at > self.max_lifetime
+
+    def _healthy(self, record):
+        if record.conn.closed:
+            return False
+        if time.monotonic() - record.last_used < self.health_check_interval:
+            return True
+        try:
+            cur = record.conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            record.conn.rollback()
+            return True
+        except psycopg2.Error as e:
+            self._stats['failed_health_checks'] += 1
+            logger.warning(f"Connection pool '{self.name}' health check failed: {e}")
+            return False
+
+    def _discard(self, record):
+        try:
+            if not record.conn.closed:
+                record.conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def lease(self, timeout=None):
+        """
+        Lease a connection from the pool, opening one if the pool is below max_size.
+
+        Args:
+            timeout (float, optional): Seconds to wait for a free connection
+
+        Returns:
+            psycopg2 connection that must be handed back with release()
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        while True:
+            record = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolClosedError(f"Connection pool '{self.name}' is closed")
+                    if self._idle:
+                        record = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeoutError(
+                            f"Timed out after {timeout}s waiting for a connection from pool '{self.name}'"
+                        )
+                    self._cond.wait(remaining)
+
+            if record is None:
+                try:
+                    record = self._open()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif self._expired(record) or not self._healthy(record):
+                self._stats['recycled'] += 1
+                self._discard(record)
+                continue
+
+            with self._cond:
+                self._leased[id(record.conn)] = record
+                self._stats['leases'] += 1
+            return record.conn
+
+    def release(self, conn, discard=False):
+        """Return a leased connection; broken, expired or discarded connections are closed."""
+        with self._cond:
+            record = self._leased.pop(id(conn), None)
+        if record is None:
+            logger.warning(f"Connection pool '{self.name}' received a connection it did not lease")
+            return
+
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        if discard or conn.closed or self._closed or self._expired(record):
+            if self._expired(record):
+                self._stats['recycled'] += 1
+            self._discard(record)
+            return
+
+        record.last_used = time.monotonic()
+        with self._cond:
+            self._idle.append(record)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.lease(timeout)
+        discard = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def connection_state(self, conn):
+        """Scratch dict that lives as long as the physical connection."""
+        record = self._leased.get(id(conn))
+        return record.state if record is not None else {}
+
+    def stats(self):
+        with self._cond:
+            return dict(self._stats, size=self._size, idle=len(self._idle), leased=len(self._leased),
+                        max_size=self.max_size)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for record in idle:
+            try:
+                record.conn.close()
+            except Exception:
+                pass
+        logger.info(f"Connection pool '{self.name}' closed")
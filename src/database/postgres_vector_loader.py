@@ -1,8 +1,12 @@
 import json
+import time
 import psycopg2
 from psycopg2 import sql
-from src.utils.config_reader import load_config
-from src.llm.embedding import Embedding
+from psycopg2.extras import execute_values
+from src.services.market_registry import get_market_resources
+from src.utils.hash_audit import compute_content_hash
+from src.utils.logger import logger
+from src.utils.rate_limiter import request_priority, BULK
 
 from src.database.db_connector import get_postgres_connection_params
 
@@ -18,10 +22,11 @@ class PostgresVectorLoader:
     def __init__(self, market):
         self.market = market
         self.host, self.port, self.database, self.user, self.password = get_postgres_connection_params(market)
-        # load config and initialize embeddings client
-        config = load_config(market)
-        emb = Embedding(config)
-        self.client = emb.get_embeddings()
+        # reuse the market's shared embeddings client
+        resources = get_market_resources(market)
+        self.client = resources.embedding_client
+        self.batch_size = resources.config.getint('VECTOR_LOADER', 'batch_size', fallback=100)
+        self.embedding_model = resources.config.get('LLM', 'embedding_model', fallback='')
 
     def create_embedding_table(self, table_name="context_embeddings"):
         conn = None
@@ -240,13 +245,143 @@ class PostgresVectorLoader:
                     lines.append(f"{key}: {clean(value)}.")
             return "\n\n".join(lines)
 
-    def insert_table_context(self, record: dict, table_name: str = "table_context"):
+    def _table_context_id_key(self, record: dict):
         table_name_val = record.get("table_name") or record.get("table_name_details")
-        id_key = generate_id_key(
+        return generate_id_key(
             record.get("data_source_id"),
             record.get('data_namespace', ''),
             table_name_val
         )
+
+    def _column_context_id_key(self, record: dict):
+        table_name_val = record.get("table_name_details") or record.get("table_name")
+        column_name_val = record.get("column_name_details") or record.get("column_name")
+        return generate_column_id_key(
+            record.get("data_source_id"),
+            record.get('data_namespace', ''),
+            table_name_val,
+            column_name_val
+        )
+
+    def ensure_context_table(self, cur, table_name: str):
+        cur.execute(sql.SQL("""
+            CREATE EXTENSION IF NOT EXISTS vector;
+            CREATE TABLE IF NOT EXISTS {table} (
+                id_key       VARCHAR(255) PRIMARY KEY,
+                embedding    VECTOR(1536),
+                raw_text     TEXT
+            );
+            ALTER TABLE {table} ADD COLUMN IF NOT EXISTS content_hash VARCHAR(32);
+        """).format(table=sql.Identifier(table_name)))
+
+    def content_hash(self, raw_text: str) -> str:
+        # The embedding model is part of the hash so switching models re-embeds everything
+        return compute_content_hash(raw_text, self.embedding_model)
+
+    @staticmethod
+    def _namespace_prefix(id_key: str) -> str:
+        # id_keys are "<source>~<namespace>~<table>[~<column>]"; the prefix scopes deletions to the loaded namespace
+        parts = id_key.split("~")
+        return "~".join(parts[:2]) + "~"
+
+    def load_contexts(self, records, table_name: str, metadata_type: str, batch_size: int = None):
+        """
+        Embed and upsert many context records over a single connection.
+
+        Records are embedded in chunks with embed_documents and written with one
+        multi-row upsert per chunk; the extension/table DDL runs once per load.
+        Rows whose rendered text hash is unchanged are skipped entirely, and rows
+        of the loaded namespaces that are no longer in the metadata are deleted.
+
+        Args:
+            records (list): Table or column metadata records
+            table_name (str): Target context table
+            metadata_type (str): 'table' or 'column'
+            batch_size (int, optional): Records per embedding call/upsert, defaults to [VECTOR_LOADER] batch_size
+
+        Returns:
+            dict: Counts of inserted, updated, unchanged and deleted rows
+        """
+        batch_size = max(1, batch_size or self.batch_size)
+        id_key_fn = self._table_context_id_key if metadata_type == "table" else self._column_context_id_key
+
+        # Duplicate id_keys would make a single ON CONFLICT upsert fail; the last record wins
+        rows_by_key = {}
+        for record in records:
+            rows_by_key[id_key_fn(record)] = self._to_readable_text(record)
+
+        start = time.monotonic()
+        stats = {"inserted": 0, "updated": 0, "unchanged": 0, "deleted": 0, "batches": 0}
+        conn = None
+        try:
+            conn = psycopg2.connect(host=self.host, port=self.port, dbname=self.database,
+                                    user=self.user, password=self.password)
+            cur = conn.cursor()
+            self.ensure_context_table(cur, table_name)
+            conn.commit()
+
+            cur.execute(sql.SQL("SELECT id_key, content_hash FROM {table}").format(table=sql.Identifier(table_name)))
+            existing_hashes = dict(cur.fetchall())
+
+            pending = []
+            for id_key, raw_text in rows_by_key.items():
+                content_hash = self.content_hash(raw_text)
+                if id_key not in existing_hashes:
+                    stats["inserted"] += 1
+                elif existing_hashes[id_key] != content_hash:
+                    stats["updated"] += 1
+                else:
+                    stats["unchanged"] += 1
+                    continue
+                pending.append((id_key, raw_text, content_hash))
+
+            upsert_sql = sql.SQL("""
+                INSERT INTO {table} (id_key, embedding, raw_text, content_hash)
+                VALUES %s
+                ON CONFLICT (id_key) DO UPDATE SET
+                    embedding    = EXCLUDED.embedding,
+                    raw_text     = EXCLUDED.raw_text,
+                    content_hash = EXCLUDED.content_hash;
+            """).format(table=sql.Identifier(table_name))
+
+            for offset in range(0, len(pending), batch_size):
+                chunk = pending[offset:offset + batch_size]
+                # Ingestion yields the shared embedding quota to interactive traffic
+                with request_priority(BULK):
+                    embeddings = self.client.embed_documents([raw_text for _, raw_text, _ in chunk])
+                values = [(id_key, embedding, raw_text, content_hash)
+                          for (id_key, raw_text, content_hash), embedding in zip(chunk, embeddings)]
+                execute_values(cur, upsert_sql.as_string(conn), values, template="(%s, %s::vector, %s, %s)",
+                               page_size=len(values))
+                conn.commit()
+                stats["batches"] += 1
+                logger.info(f"{table_name}: stored batch {stats['batches']} ({offset + len(chunk)}/{len(pending)} changed records)")
+
+            # Remove rows of the loaded namespaces that no longer exist in the metadata
+            prefixes = {self._namespace_prefix(id_key) for id_key in rows_by_key}
+            stale_keys = [id_key for id_key in existing_hashes
+                          if id_key not in rows_by_key and self._namespace_prefix(id_key) in prefixes]
+            if stale_keys:
+                cur.execute(sql.SQL("DELETE FROM {table} WHERE id_key = ANY(%s)").format(table=sql.Identifier(table_name)),
+                            (stale_keys,))
+                conn.commit()
+                stats["deleted"] = cur.rowcount
+            cur.close()
+        except Exception as e:
+            logger.error(f"load_contexts failed for {table_name}: {e}", exc_info=True)
+            if conn:
+                conn.rollback()
+            raise
+        finally:
+            if conn:
+                conn.close()
+
+        stats["elapsed_seconds"] = round(time.monotonic() - start, 3)
+        logger.info(f"{table_name}: load finished - {stats}")
+        return stats
+
+    def insert_table_context(self, record: dict, table_name: str = "table_context"):
+        id_key = self._table_context_id_key(record)
         raw_text = self._to_readable_text(record)
         embedding = self.get_openai_embedding(raw_text)
 
@@ -255,20 +390,18 @@ class PostgresVectorLoader:
             conn = psycopg2.connect(host=self.host, port=self.port, dbname=self.database,
                                     user=self.user, password=self.password)
             cur = conn.cursor()
+            self.ensure_context_table(cur, table_name)
             insert_sql = sql.SQL("""
-                CREATE EXTENSION IF NOT EXISTS vector;
-                CREATE TABLE IF NOT EXISTS {table} (
-                    id_key VARCHAR(255) PRIMARY KEY,
-                    embedding VECTOR(1536),
-                    raw_text TEXT
-                );
-                INSERT INTO {table} (id_key, embedding, raw_text)
-                VALUES (%s, %s, %s)
+                INSERT INTO {table} (id_key, embedding, raw_text, content_hash)
+                VALUES (%s, %s, %s, %s)
                 ON CONFLICT (id_key) DO UPDATE SET
                     embedding = EXCLUDED.embedding,
-                    raw_text = EXCLUDED.raw_text;
+                    raw_text = EXCLUDED.raw_text,
+                    content_hash = EXCLUDED.content_hash;
             """).format(table=sql.Identifier(table_name))
-            cur.execute(insert_sql, (id_key, embedding, raw_text))
+            # Without an embedding the hash is left empty so the next reload retries the row
+            content_hash = self.content_hash(raw_text) if embedding is not None else None
+            cur.execute(insert_sql, (id_key, embedding, raw_text, content_hash))
             conn.commit()
             cur.close()
             print(f"Table context stored: {id_key}")
@@ -280,15 +413,7 @@ class PostgresVectorLoader:
                 conn.close()
 
     def insert_column_context(self, record: dict, table_name: str = "column_context"):
-        table_name_val = record.get("table_name_details") or record.get("table_name")
-        column_name_val = record.get("column_name_details") or record.get("column_name")
-        
-        id_key = generate_column_id_key(
-            record.get("data_source_id"),
-            record.get('data_namespace', ''),
-            table_name_val,
-            column_name_val
-        )
+        id_key = self._column_context_id_key(record)
 
         raw_text = self._to_readable_text(record)
         print(raw_text)
@@ -299,20 +424,18 @@ class PostgresVectorLoader:
             conn = psycopg2.connect(host=self.host, port=self.port, dbname=self.database,
                                     user=self.user, password=self.password)
             cur = conn.cursor()
+            self.ensure_context_table(cur, table_name)
             insert_sql = sql.SQL("""
-                CREATE EXTENSION IF NOT EXISTS vector;
-                CREATE TABLE IF NOT EXISTS {table} (
-                    id_key       VARCHAR(255) PRIMARY KEY,
-                    embedding    VECTOR(1536),
-                    raw_text     TEXT
-                );
-                INSERT INTO {table} (id_key, embedding, raw_text)
-                VALUES (%s, %s, %s)
+                INSERT INTO {table} (id_key, embedding, raw_text, content_hash)
+                VALUES (%s, %s, %s, %s)
                 ON CONFLICT (id_key) DO UPDATE SET
-                    embedding = EXCLUDED.embedding,
-                    raw_text  = EXCLUDED.raw_text;
+                    embedding    = EXCLUDED.embedding,
+                    raw_text     = EXCLUDED.raw_text,
+                    content_hash = EXCLUDED.content_hash;
             """).format(table=sql.Identifier(table_name))
-            cur.execute(insert_sql, (id_key, embedding, raw_text))
+            # Without an embedding the hash is left empty so the next reload retries the row
+            content_hash = self.content_hash(raw_text) if embedding is not None else None
+            cur.execute(insert_sql, (id_key, embedding, raw_text, content_hash))
             conn.commit()
             cur.close()
             print(f"Column context stored: {id_key}")
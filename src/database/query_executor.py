@@ -2,43 +2,49 @@ from google.cloud import bigquery
 from concurrent.futures import TimeoutError
 from src.services.bq_client import get_bigquery_client
 from google.cloud import bigquery
-from google.api_core.exceptions import BadRequest, GoogleAPIError
+from google.api_core.exceptions import BadRequest, GoogleAPIError, NotFound
 from src.utils.logger import logger
 from datetime import datetime
+from contextlib import contextmanager
+import hashlib
+import io
+import json
+import re
+import time
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
 
-def serialize_row(row):
-    return {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in row.items()}
+# Nullable pandas dtypes keep INT64/BOOL columns with NULLs from turning into floats/objects in JSON
+_JSON_PANDAS_TYPES = {pa.int64(): pd.Int64Dtype(), pa.bool_(): pd.BooleanDtype()}
 
-def execute(sql_query: str, market: str, timeout: int) -> list:
-    logger.info("QUERY_EXECUTION_START - Market: %s", market)
-    logger.debug("SQL Query: %s", sql_query[:200] + "..." if len(sql_query) > 200 else sql_query)
-    
-    try:
-        logger.debug("Getting BigQuery client for market: %s", market)
-        client, project_id, dataset_id = get_bigquery_client(market)
-        logger.info("BigQuery client obtained - Project: %s, Dataset: %s", project_id, dataset_id)
+# Prefix of number text that _json_records() emits unquoted; pandas escapes it as \u0000 in the JSON.
+# Strings that already start with NULs and '#' get one more NUL, which the same pass strips again.
+# Quotes inside JSON strings are escaped, so a quote after ':', ',' or '[' always opens a value.
+_RAW_NUMBER_MARK = '\x00#'
+_RAW_NUMBER_RE = re.compile(r'(?<=[:,\[])"\\u0000(?:#([-+.0-9eE]+)"|((?:\\u0000)+#))')
 
-        job_config = bigquery.QueryJobConfig(
-            dry_run=False, 
-            use_query_cache=False,
-            default_dataset=f"{project_id}.{dataset_id}"
-        )
+def _unmark_number(match):
+    number, escaped = match.groups()
+    return number if number is not None else '"' + escaped
 
-        logger.debug("Submitting query to BigQuery")
-        query_job = client.query(sql_query, job_config=job_config)
-        
-        logger.info("Query job submitted - Job ID: %s", query_job.job_id)
-        results = query_job.result(timeout=timeout)
+# Columnar result formats and their media types
+RESULT_FORMATS = {
+    'json': 'application/json',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet',
+}
 
-        # Convert results to list
-        result_list = [serialize_row(row) for row in results]
-        row_count = len(result_list)
-        
-        logger.info("QUERY_EXECUTION_SUCCESS - Market: %s, Rows returned: %d, Job ID: %s", 
-                   market, row_count, query_job.job_id)
-        
-        return result_list
+def serialize_row(row):
+    return {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in row.items()}
 
+@contextmanager
+def _bigquery_errors(sql_query: str, market: str):
+    """Translate BigQuery failures into the errors callers of execute() expect."""
+    try:
+        yield
     except BadRequest as e:
         logger.error("BIGQUERY_BAD_REQUEST - Market: %s, Error: %s", market, e.message)
         logger.debug("SQL Query that failed: %s", sql_query)
@@ -54,4 +60,338 @@ def execute(sql_query: str, market: str, timeout: int) -> list:
     except Exception as e:
         logger.exception("QUERY_EXECUTION_CRITICAL_ERROR - Market: %s, Error: %s", market, str(e))
         logger.debug("SQL Query that failed: %s", sql_query)
-        raise Exception(f"Unexpected error during query execution: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Unexpected error during query execution: {str(e)}")
+
+def _run_query(sql_query: str, market: str, timeout: int, page_size: int = None, use_query_cache: bool = False):
+    """Submit the query and wait for it; returns (query_job, RowIterator)."""
+    logger.debug("Getting BigQuery client for market: %s", market)
+    client, project_id, dataset_id, _ = get_bigquery_client(market)
+    logger.info("BigQuery client obtained - Project: %s, Dataset: %s", project_id, dataset_id)
+
+    job_config = bigquery.QueryJobConfig(
+        dry_run=False,
+        use_query_cache=use_query_cache,
+        default_dataset=f"{project_id}.{dataset_id}"
+    )
+
+    logger.debug("Submitting query to BigQuery")
+    query_job = client.query(sql_query, job_config=job_config)
+
+    logger.info("Query job submitted - Job ID: %s", query_job.job_id)
+    return query_job, query_job.result(timeout=timeout, page_size=page_size)
+
+def execute(sql_query: str, market: str, timeout: int, use_query_cache: bool = False) -> list:
+    logger.info("QUERY_EXECUTION_START - Market: %s", market)
+    logger.debug("SQL Query: %s", sql_query[:200] + "..." if len(sql_query) > 200 else sql_query)
+
+    with _bigquery_errors(sql_query, market):
+        query_job, results = _run_query(sql_query, market, timeout, use_query_cache=use_query_cache)
+
+        # Convert results to list
+        result_list = [serialize_row(row) for row in results]
+        row_count = len(result_list)
+
+        logger.info("QUERY_EXECUTION_SUCCESS - Market: %s, Rows returned: %d, Job ID: %s",
+                   market, row_count, query_job.job_id)
+
+        return result_list
+
+def execute_arrow(sql_query: str, market: str, timeout: int, use_query_cache: bool = False):
+    """
+    Execute a query and fetch the result as a pyarrow.Table, without per-row Python objects.
+
+    Uses the BigQuery Storage read API when google-cloud-bigquery-storage is installed,
+    otherwise the REST pages are decoded into Arrow record batches by the client library.
+
+    Returns:
+        tuple: (pyarrow.Table, stats dict with rows, query_seconds, fetch_seconds, rows_per_second)
+    """
+    logger.info("QUERY_EXECUTION_START - Market: %s, Mode: arrow", market)
+    logger.debug("SQL Query: %s", sql_query[:200] + "..." if len(sql_query) > 200 else sql_query)
+
+    with _bigquery_errors(sql_query, market):
+        started = time.perf_counter()
+        query_job, results = _run_query(sql_query, market, timeout, use_query_cache=use_query_cache)
+        fetch_started = time.perf_counter()
+        table = results.to_arrow(progress_bar_type=None, create_bqstorage_client=True)
+        finished = time.perf_counter()
+
+        stats = {
+            'rows': table.num_rows,
+            'arrow_bytes': table.nbytes,
+            'query_seconds': round(fetch_started - started, 4),
+            'fetch_seconds': round(finished - fetch_started, 4),
+            'rows_per_second': round(table.num_rows / (finished - fetch_started), 1) if finished > fetch_started else None,
+            'bigquery_cache_hit': query_job.cache_hit,
+        }
+        logger.info("QUERY_EXECUTION_SUCCESS - Market: %s, Rows returned: %d, Fetch rows/s: %s, Job ID: %s",
+                    market, table.num_rows, stats['rows_per_second'], query_job.job_id)
+        return table, stats
+
+def _json_compatible_array(array):
+    """
+    Cast temporal values to ISO strings and numbers to marked number text, recursing into STRUCT and ARRAY children.
+
+    FLOAT64/NUMERIC values become Arrow's shortest round-trip text behind _RAW_NUMBER_MARK, which
+    _json_records() turns back into bare JSON numbers, so no digits are lost to the JSON writer.
+    """
+    array_type = array.type
+    if pa.types.is_floating(array_type) or pa.types.is_decimal(array_type):
+        text = pc.cast(array, pa.string())
+        if pa.types.is_floating(array_type):
+            # NaN/Infinity are not JSON numbers
+            text = pc.if_else(pc.is_finite(array), text, pa.scalar(None, pa.string()))
+        return pc.binary_join_element_wise(_RAW_NUMBER_MARK, text, '')
+    if pa.types.is_string(array_type) or pa.types.is_large_string(array_type):
+        if not pc.any(pc.starts_with(array, '\x00')).as_py():
+            return array
+        return pc.replace_substring_regex(array, pattern=r'^(\x00+#)', replacement='\x00\\1')
+    if pa.types.is_timestamp(array_type):
+        # '2024-01-01 12:00:00.000000Z' -> '2024-01-01T12:00:00.000000Z'
+        return pc.replace_substring(pc.cast(array, pa.string()), ' ', 'T', max_replacements=1)
+    if pa.types.is_date(array_type) or pa.types.is_time(array_type):
+        return pc.cast(array, pa.string())
+    if not (pa.types.is_struct(array_type) or pa.types.is_list(array_type)):
+        return array
+    if isinstance(array, pa.ChunkedArray):
+        return pa.chunked_array([_json_compatible_array(chunk) for chunk in array.chunks]
+                                or [pa.array([], type=array_type)])
+    if pa.types.is_struct(array_type):
+        names = [array_type.field(i).name for i in range(array_type.num_fields)]
+        return pa.StructArray.from_arrays([_json_compatible_array(child) for child in array.flatten()],
+                                          names=names, mask=array.is_null())
+    offsets = pc.subtract(array.offsets, array.offsets[0])
+    return pa.ListArray.from_arrays(offsets, _json_compatible_array(array.flatten()), mask=array.is_null())
+
+def _json_compatible(table):
+    """Column by column, make every value representable in JSON without losing precision."""
+    return pa.table([_json_compatible_array(column) for column in table.columns], names=table.column_names)
+
+def _json_records(table, lines: bool = False) -> str:
+    """Encode a table as a JSON array of row objects (or JSON lines) with pandas' C JSON writer."""
+    table = _json_compatible(table)
+    frame = table.to_pandas(types_mapper=_JSON_PANDAS_TYPES.get)
+    for name, column in zip(table.column_names, table.columns):
+        # Nested values as plain Python objects; pandas would turn nullable INT64 children into floats
+        if pa.types.is_struct(column.type) or pa.types.is_list(column.type):
+            frame[name] = pd.Series(column.to_pylist(), index=frame.index, dtype=object)
+    # Numbers were written as marked strings; unquote them. double_precision=15 (the pandas default
+    # rounds to 10 decimals) only matters for floats that did not go through _json_compatible
+    encoded = frame.to_json(orient='records', lines=lines, date_format='iso', double_precision=15)
+    return _RAW_NUMBER_RE.sub(_unmark_number, encoded)
+
+def serialize_arrow(table, result_format: str) -> bytes:
+    """
+    Serialise an Arrow table straight from its columnar buffers.
+
+    Args:
+        table (pyarrow.Table): Query result
+        result_format (str): 'json' (array of row objects), 'arrow' (IPC stream) or 'parquet'
+
+    Returns:
+        bytes: Encoded result; see RESULT_FORMATS for the media type
+    """
+    if result_format == 'json':
+        # pandas' C JSON writer walks the columns; no Python dict is built per row
+        return _json_records(table).encode('utf-8')
+    sink = io.BytesIO()
+    if result_format == 'arrow':
+        with ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    elif result_format == 'parquet':
+        pq.write_table(table, sink, compression='snappy')
+    else:
+        raise ValueError(f"Unsupported result format '{result_format}'. Must be one of {list(RESULT_FORMATS)}.")
+    return sink.getvalue()
+
+# Media types of the streaming formats
+STREAM_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+
+def open_arrow_stream(sql_query: str, market: str, timeout: int, page_size: int = None):
+    """
+    Execute a query and return an iterator of Arrow record batches, one per result page.
+
+    The query runs (and fails) eagerly; pages are only fetched as the iterator is consumed,
+    so a slow consumer holds back the download instead of buffering the whole result.
+
+    Returns:
+        tuple: (job_id, iterator of pyarrow.RecordBatch, pyarrow.Schema)
+    """
+    logger.info("QUERY_EXECUTION_START - Market: %s, Mode: stream", market)
+    logger.debug("SQL Query: %s", sql_query[:200] + "..." if len(sql_query) > 200 else sql_query)
+
+    with _bigquery_errors(sql_query, market):
+        query_job, results = _run_query(sql_query, market, timeout, page_size=page_size)
+        batches = results.to_arrow_iterable()
+        first = next(batches, None)
+        if first is None:
+            # No rows: take the schema from an empty table of the finished job
+            schema = query_job.result().to_arrow(progress_bar_type=None, create_bqstorage_client=False).schema
+            return query_job.job_id, iter(()), schema
+        return query_job.job_id, _prepend(first, batches), first.schema
+
+def _prepend(first, batches):
+    yield first
+    yield from batches
+
+def encode_stream(batches, schema, result_format: str, max_rows: int = 0, max_bytes: int = 0, stats: dict = None):
+    """
+    Encode record batches as NDJSON lines or an Arrow IPC stream, stopping at max_rows/max_bytes (0 = no limit).
+
+    A batch that would take the stream past max_bytes is cut down to the rows that fit before it is
+    sent; only the end-of-stream trailer may go over. Both formats end with a trailer reporting rows,
+    bytes and whether the result was truncated: NDJSON with a `{"_stream_end": {...}}` line, Arrow
+    with a zero-row batch whose custom metadata holds the same JSON under `stream_end` (read it with
+    RecordBatchStreamReader.read_next_batch_with_custom_metadata()). `stats` (if given) is updated
+    in place as the stream progresses.
+
+    Yields:
+        bytes: Encoded chunks, one per record batch
+    """
+    if result_format not in STREAM_FORMATS:
+        raise ValueError(f"Unsupported stream format '{result_format}'. Must be one of {list(STREAM_FORMATS)}.")
+    stats = stats if stats is not None else {}
+    stats.update(rows=0, bytes=0, truncated=False)
+    started = time.perf_counter()
+
+    sink = io.BytesIO()
+    writer = ipc.new_stream(sink, schema) if result_format == 'arrow' else None
+
+    def encode(batch):
+        if writer is not None:
+            writer.write_batch(batch)
+        else:
+            lines = _json_records(pa.Table.from_batches([batch]), lines=True)
+            # Older pandas omit the trailing newline after the last record
+            sink.write(lines.rstrip('\n').encode('utf-8') + b'\n')
+
+    def drain():
+        chunk = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        stats['bytes'] += len(chunk)
+        return chunk
+
+    try:
+        if writer is not None:
+            yield drain()
+        for batch in batches:
+            if max_rows and stats['rows'] + batch.num_rows > max_rows:
+                batch = batch.slice(0, max_rows - stats['rows'])
+                stats['truncated'] = True
+            rows = batch.num_rows
+            while rows:
+                encode(batch.slice(0, rows))
+                size = sink.tell()
+                if not max_bytes or stats['bytes'] + size <= max_bytes:
+                    break
+                # Over the byte limit: drop the unsent chunk (BigQuery schemas have no dictionary columns, so
+                # the IPC writer keeps no per-batch state) and retry with the share of rows that fits
+                sink.seek(0)
+                sink.truncate()
+                stats['truncated'] = True
+                rows = min(rows - 1, max(0, int(rows * (max_bytes - stats['bytes']) / size)))
+            if rows:
+                stats['rows'] += rows
+                yield drain()
+            if stats['truncated']:
+                break
+    finally:
+        elapsed = time.perf_counter() - started
+        stats['seconds'] = round(elapsed, 4)
+        stats['rows_per_second'] = round(stats['rows'] / elapsed, 1) if elapsed > 0 else None
+
+    if writer is not None:
+        writer.write_batch(pa.RecordBatch.from_pylist([], schema=schema),
+                           custom_metadata={'stream_end': json.dumps(stats)})
+        writer.close()
+        yield drain()
+    else:
+        yield (json.dumps({'_stream_end': stats}) + '\n').encode('utf-8')
+
+def _label_value(value: str) -> str:
+    """
+    Collision-free BigQuery label value (lowercase hex, at most 63 characters) for an exact string.
+
+    Sanitising the string itself would map e.g. 'John.Doe' and 'john_doe' to the same label.
+    """
+    return hashlib.sha256(str(value).encode('utf-8')).hexdigest()[:63]
+
+def submit_query_job(sql_query: str, market: str, username: str, job_timeout_seconds: int = None) -> str:
+    """
+    Submit a query job without waiting for it; the job is labelled with the submitting user.
+
+    Returns:
+        str: BigQuery job id
+    """
+    client, project_id, dataset_id, _ = get_bigquery_client(market)
+    job_config = bigquery.QueryJobConfig(
+        dry_run=False,
+        use_query_cache=False,
+        default_dataset=f"{project_id}.{dataset_id}",
+        labels={'submitted_by': _label_value(username), 'market': _label_value(market)}
+    )
+    if job_timeout_seconds:
+        job_config.job_timeout_ms = job_timeout_seconds * 1000
+
+    with _bigquery_errors(sql_query, market):
+        query_job = client.query(sql_query, job_config=job_config)
+    logger.info("QUERY_JOB_SUBMITTED - Market: %s, User: %s, Job ID: %s", market, username, query_job.job_id)
+    return query_job.job_id
+
+def get_query_job(job_id: str, market: str, username: str):
+    """
+    Look up a query job submitted by `username` for `market`.
+
+    Returns:
+        bigquery.QueryJob or None: None when the job does not exist, is not a query job or belongs to another user
+            or market
+    """
+    client, _, _, _ = get_bigquery_client(market)
+    try:
+        job = client.get_job(job_id)
+    except NotFound:
+        return None
+    labels = (job.labels or {}) if isinstance(job, bigquery.QueryJob) else {}
+    if labels.get('submitted_by') != _label_value(username) or labels.get('market') != _label_value(market):
+        return None
+    return job
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+def query_job_status(job) -> dict:
+    """State and progress of a query job; the statistics fill in while the job runs."""
+    stages = job.query_plan or []
+    error = job.error_result or None
+    return {
+        'job_id': job.job_id,
+        'state': job.state,
+        'error': error.get('message') if error else None,
+        'created': _isoformat(job.created),
+        'started': _isoformat(job.started),
+        'ended': _isoformat(job.ended),
+        'bytes_processed': job.total_bytes_processed,
+        'bytes_billed': job.total_bytes_billed,
+        'slot_millis': job.slot_millis,
+        'cache_hit': job.cache_hit,
+        'stages_completed': sum(1 for stage in stages if stage.status == 'COMPLETE'),
+        'stages_total': len(stages),
+    }
+
+def fetch_job_page(job, market: str, page_size: int, page_token: str = None) -> dict:
+    """
+    Read one page of a finished job's results from its destination table.
+
+    Returns:
+        dict: rows, total_rows and next_page_token (None on the last page)
+    """
+    client, _, _, _ = get_bigquery_client(market)
+    with _bigquery_errors(job.query, market):
+        rows = client.list_rows(job.destination, page_size=page_size, page_token=page_token)
+        page = next(rows.pages, [])
+        result = [serialize_row(row) for row in page]
+    return {'rows': result, 'total_rows': rows.total_rows, 'next_page_token': rows.next_page_token}
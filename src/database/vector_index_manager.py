@@ -0,0 +1,221 @@
+import math
+import psycopg2
+from psycopg2 import sql
+
+from src.database.db_connector import get_postgres_connection_params
+from src.services.market_registry import get_market_resources
+from src.utils.logger import logger
+
+# Operator class matching the `<->` (L2 distance) operator used by RAGPipeline
+VECTOR_OPCLASS = "vector_l2_ops"
+SUPPORTED_METHODS = ("hnsw", "ivfflat")
+CONTEXT_TABLES = ("column_context", "table_context")
+
+
+def index_name_for(table_name, method):
+    return f"{table_name}_embedding_{method}_idx"
+
+
+class VectorIndexManager:
+    """Builds, rebuilds and reports pgvector ANN indexes on the context tables."""
+
+    def __init__(self, market):
+        self.market = market
+        self.host, self.port, self.database, self.user, self.password = get_postgres_connection_params(market)
+        config = get_market_resources(market).config
+        section = 'VECTOR_INDEX'
+        self.default_method = config.get(section, 'method', fallback='hnsw').strip().lower()
+        self.default_m = config.getint(section, 'm', fallback=16)
+        self.default_ef_construction = config.getint(section, 'ef_construction', fallback=64)
+        self.default_lists = config.getint(section, 'lists', fallback=0)
+        self.maintenance_work_mem = config.get(section, 'maintenance_work_mem', fallback='').strip()
+
+    # Index DDL runs on a dedicated autocommit connection so CONCURRENTLY is allowed
+    # and long builds do not hold a slot in the retrieval pool
+    def _connect(self):
+        conn = psycopg2.connect(host=self.host, port=self.port, dbname=self.database,
+                                user=self.user, password=self.password)
+        conn.autocommit = True
+        return conn
+
+    @staticmethod
+    def _validate_table(table_name):
+        if table_name not in CONTEXT_TABLES:
+            raise ValueError(f"Unsupported table '{table_name}'. Must be one of {CONTEXT_TABLES}.")
+
+    @staticmethod
+    def _auto_lists(row_count):
+        # pgvector guidance: rows / 1000 up to 1M rows, sqrt(rows) beyond
+        if row_count <= 1_000_000:
+            return max(1, row_count // 1000)
+        return max(1, int(math.sqrt(row_count)))
+
+    def build_index(self, table_name, method=None, m=None, ef_construction=None, lists=None, concurrently=True):
+        """
+        Create (or replace) the ANN index on a context table's embedding column.
+
+        Args:
+            table_name (str): 'column_context' or 'table_context'
+            method (str): 'hnsw' or 'ivfflat'
+            m (int): HNSW max connections per layer
+            ef_construction (int): HNSW candidate list size during build
+            lists (int): IVFFlat list count; 0 or None derives it from the row count
+            concurrently (bool): Build without blocking writes
+
+        Returns:
+            dict: Report entry for the new index
+        """
+        self._validate_table(table_name)
+        method = (method or self.default_method).lower()
+        if method not in SUPPORTED_METHODS:
+            raise ValueError(f"Unsupported index method '{method}'. Must be one of {SUPPORTED_METHODS}.")
+
+        conn = None
+        try:
+            conn = self._connect()
+            cur = conn.cursor()
+            if self.maintenance_work_mem:
+                cur.execute("SET maintenance_work_mem = %s", (self.maintenance_work_mem,))
+
+            if method == "hnsw":
+                options = {
+                    "m": int(m or self.default_m),
+                    "ef_construction": int(ef_construction or self.default_ef_construction),
+                }
+            else:
+                lists = lists or self.default_lists
+                if not lists:
+                    cur.execute(sql.SQL("SELECT COUNT(*) FROM {table}").format(table=sql.Identifier(table_name)))
+                    lists = self._auto_lists(cur.fetchone()[0])
+                options = {"lists": int(lists)}
+
+            index_name = index_name_for(table_name, method)
+            with_clause = sql.SQL(', ').join(
+                sql.SQL("{} = {}").format(sql.SQL(key), sql.Literal(value)) for key, value in options.items()
+            )
+            concurrently_sql = sql.SQL("CONCURRENTLY ") if concurrently else sql.SQL("")
+
+            # Build under a temporary name so queries keep using the old index until the swap
+            staging_name = f"{index_name}_new"
+            logger.info(f"Building {method} index {index_name} on {table_name} with {options}")
+            cur.execute(sql.SQL("DROP INDEX {concurrently}IF EXISTS {index}").format(
+                concurrently=concurrently_sql, index=sql.Identifier(staging_name)))
+            cur.execute(sql.SQL(
+                "CREATE INDEX {concurrently}{index} ON {table} USING {method} (embedding {opclass}) WITH ({options})"
+            ).format(
+                concurrently=concurrently_sql,
+                index=sql.Identifier(staging_name),
+                table=sql.Identifier(table_name),
+                method=sql.SQL(method),
+                opclass=sql.SQL(VECTOR_OPCLASS),
+                options=with_clause
+            ))
+
+            # Only one ANN index per table; drop the previous ones once the new index is ready
+            for existing in SUPPORTED_METHODS:
+                cur.execute(sql.SQL("DROP INDEX {concurrently}IF EXISTS {index}").format(
+                    concurrently=concurrently_sql, index=sql.Identifier(index_name_for(table_name, existing))))
+            cur.execute(sql.SQL("ALTER INDEX {staging} RENAME TO {index}").format(
+                staging=sql.Identifier(staging_name), index=sql.Identifier(index_name)))
+            cur.execute(sql.SQL("ANALYZE {table}").format(table=sql.Identifier(table_name)))
+            cur.close()
+            logger.info(f"Index {index_name} built successfully")
+        except Exception as e:
+            logger.error(f"Building {method} index on {table_name} failed: {e}", exc_info=True)
+            raise
+        finally:
+            if conn:
+                conn.close()
+
+        return next((entry for entry in self.report(table_name) if entry["index_name"] == index_name), {})
+
+    def rebuild_index(self, table_name, concurrently=True):
+        """Rebuild the existing ANN index(es) on a context table, e.g. after a bulk reload."""
+        self._validate_table(table_name)
+        existing = [entry["index_name"] for entry in self.report(table_name)]
+        if not existing:
+            raise ValueError(f"No vector index exists on {table_name}; build one first.")
+
+        conn = None
+        try:
+            conn = self._connect()
+            cur = conn.cursor()
+            if self.maintenance_work_mem:
+                cur.execute("SET maintenance_work_mem = %s", (self.maintenance_work_mem,))
+            for index_name in existing:
+                logger.info(f"Rebuilding index {index_name}")
+                cur.execute(sql.SQL("REINDEX INDEX {concurrently}{index}").format(
+                    concurrently=sql.SQL("CONCURRENTLY ") if concurrently else sql.SQL(""),
+                    index=sql.Identifier(index_name)))
+            cur.close()
+        except Exception as e:
+            logger.error(f"Rebuilding indexes on {table_name} failed: {e}", exc_info=True)
+            raise
+        finally:
+            if conn:
+                conn.close()
+
+        return self.report(table_name)
+
+    def drop_index(self, table_name, method=None):
+        self._validate_table(table_name)
+        methods = [method.lower()] if method else list(SUPPORTED_METHODS)
+        conn = None
+        try:
+            conn = self._connect()
+            cur = conn.cursor()
+            for name in methods:
+                cur.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {index}").format(
+                    index=sql.Identifier(index_name_for(table_name, name))))
+            cur.close()
+            logger.info(f"Dropped vector indexes {methods} on {table_name}")
+        finally:
+            if conn:
+                conn.close()
+
+    def report(self, table_name=None):
+        """
+        Describe the ANN indexes on the context tables.
+
+        Returns:
+            list: One dict per index with method, build options, size, scan count and validity
+        """
+        tables = [table_name] if table_name else list(CONTEXT_TABLES)
+        for table in tables:
+            self._validate_table(table)
+
+        conn = None
+        try:
+            conn = self._connect()
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT t.relname AS table_name,
+                       i.relname AS index_name,
+                       am.amname AS method,
+                       i.reloptions,
+                       pg_get_indexdef(i.oid) AS definition,
+                       pg_relation_size(i.oid) AS size_bytes,
+                       pg_size_pretty(pg_relation_size(i.oid)) AS size,
+                       COALESCE(s.idx_scan, 0) AS idx_scan,
+                       ix.indisvalid AS is_valid,
+                       t.reltuples::bigint AS estimated_rows
+                FROM pg_index ix
+                JOIN pg_class i ON i.oid = ix.indexrelid
+                JOIN pg_class t ON t.oid = ix.indrelid
+                JOIN pg_am am ON am.oid = i.relam
+                LEFT JOIN pg_stat_user_indexes s ON s.indexrelid = i.oid
+                WHERE t.relname = ANY(%s)
+                  AND am.amname = ANY(%s)
+                ORDER BY t.relname, i.relname
+            """, (tables, list(SUPPORTED_METHODS)))
+            colnames = [desc[0] for desc in cur.description]
+            entries = []
+            for row in cur.fetchall():
+                entry = dict(zip(colnames, row))
+                entry["options"] = dict(option.split("=", 1) for option in (entry.pop("reloptions") or []))
+                entries.append(entry)
+            cur.close()
+            return entries
+        finally:
+            if conn:
+                conn.close()
@@ -2,6 +2,26 @@ from langchain_openai import AzureOpenAIEmbeddings
 from langchain_community.embeddings import OpenAIEmbeddings
 from openai import OpenAI
 from src.utils.logger import logger
+from src.utils.rate_limiter import get_rate_limiter
+
+
+class RateLimitedEmbeddings:
+    """Wraps a LangChain embeddings client so each request takes a token from the shared LLM quota."""
+
+    def __init__(self, embeddings, limiter):
+        self._embeddings = embeddings
+        self._limiter = limiter
+
+    def embed_query(self, text):
+        self._limiter.acquire()
+        return self._embeddings.embed_query(text)
+
+    def embed_documents(self, texts):
+        self._limiter.acquire()
+        return self._embeddings.embed_documents(texts)
+
+    def __getattr__(self, name):
+        return getattr(self._embeddings, name)
 
 class Embedding():
     def __init__(self, config):
@@ -55,6 +75,9 @@ class Embedding():
                 )
                 logger.info("Standard LLM embeddings initialized successfully")
                 
+            limiter = get_rate_limiter(self.config)
+            if limiter is not None:
+                embedding = RateLimitedEmbeddings(embedding, limiter)
             return embedding
             
         except Exception as e:
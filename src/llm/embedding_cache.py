@@ -0,0 +1,251 @@
+"""
+Two-tier cache for query embeddings.
+
+The in-process tier is an LRU with TTL; the optional persistent tier (local SQLite
+file or a Postgres table) survives restarts and is shared by every worker that
+points at it. Keys are the SHA-256 of the embedding model plus the normalised text.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from src.utils.logger import logger
+
+
+def normalise_text(text: str) -> str:
+    return re.sub(r'\s+', ' ', text or '').strip().lower()
+
+
+def embedding_cache_key(text: str, model: str) -> str:
+    return hashlib.sha256(f"{model}\x00{normalise_text(text)}".encode('utf-8')).hexdigest()
+
+
+class DiskEmbeddingStore:
+    """SQLite-backed persistent tier; embeddings are stored as packed float64 blobs."""
+
+    def __init__(self, path, max_entries=100000):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                cache_key  TEXT PRIMARY KEY,
+                model      TEXT,
+                embedding  BLOB,
+                created_at REAL
+            )
+        """)
+        self._conn.commit()
+
+    def get(self, key, ttl_seconds):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT embedding, created_at FROM embedding_cache WHERE cache_key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        if ttl_seconds and time.time() - row[1] > ttl_seconds:
+            return None
+        return array('d', row[0]).tolist()
+
+    def put(self, key, model, embedding):
+        blob = array('d', embedding).tobytes()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embedding_cache (cache_key, model, embedding, created_at) VALUES (?, ?, ?, ?)",
+                (key, model, blob, time.time())
+            )
+            self._conn.commit()
+
+    def prune(self, ttl_seconds):
+        with self._lock:
+            if ttl_seconds:
+                self._conn.execute("DELETE FROM embedding_cache WHERE created_at < ?", (time.time() - ttl_seconds,))
+            self._conn.execute("""
+                DELETE FROM embedding_cache WHERE cache_key IN (
+                    SELECT cache_key FROM embedding_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class PostgresEmbeddingStore:
+    """Postgres-backed persistent tier using the market's pgvector connection pool."""
+
+    def __init__(self, pool, max_entries=100000, table_name="embedding_cache"):
+        self.pool = pool
+        self.max_entries = max_entries
+        self.table_name = table_name
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self.table_name} (
+                    cache_key  VARCHAR(64) PRIMARY KEY,
+                    model      VARCHAR(255),
+                    embedding  DOUBLE PRECISION[],
+                    created_at TIMESTAMP DEFAULT NOW()
+                )
+            """)
+            conn.commit()
+            cur.close()
+
+    def get(self, key, ttl_seconds):
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(f"""
+                SELECT embedding FROM {self.table_name}
+                WHERE cache_key = %s
+                  AND (%s = 0 OR created_at > NOW() - make_interval(secs => %s))
+            """, (key, ttl_seconds or 0, ttl_seconds or 0))
+            row = cur.fetchone()
+            cur.close()
+        return list(row[0]) if row else None
+
+    def put(self, key, model, embedding):
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(f"""
+                INSERT INTO {self.table_name} (cache_key, model, embedding, created_at)
+                VALUES (%s, %s, %s, NOW())
+                ON CONFLICT (cache_key) DO UPDATE SET
+                    embedding  = EXCLUDED.embedding,
+                    created_at = EXCLUDED.created_at
+            """, (key, model, list(embedding)))
+            conn.commit()
+            cur.close()
+
+    def prune(self, ttl_seconds):
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            if ttl_seconds:
+                cur.execute(f"DELETE FROM {self.table_name} WHERE created_at < NOW() - make_interval(secs => %s)",
+                            (ttl_seconds,))
+            cur.execute(f"""
+                DELETE FROM {self.table_name} WHERE cache_key IN (
+                    SELECT cache_key FROM {self.table_name} ORDER BY created_at DESC OFFSET %s
+                )
+            """, (self.max_entries,))
+            conn.commit()
+            cur.close()
+
+    def close(self):
+        pass
+
+
+class EmbeddingCache:
+    def __init__(self, model, max_entries=10000, ttl_seconds=86400, persistent_store=None, prune_interval=3600):
+        self.model = model
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = float(ttl_seconds or 0)
+        self.persistent_store = persistent_store
+        self.prune_interval = prune_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_prune = time.monotonic()
+        self._stats = {'hits': 0, 'memory_hits': 0, 'persistent_hits': 0, 'misses': 0,
+                       'evictions': 0, 'expired': 0, 'persistent_errors': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _get_memory(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            embedding, expires_at = entry
+            if expires_at and time.monotonic() > expires_at:
+                del self._entries[key]
+                self._stats['expired'] += 1
+                return None
+            self._entries.move_to_end(key)
+            return embedding
+
+    def _put_memory(self, key, embedding):
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._entries[key] = (embedding, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def get(self, text):
+        key = embedding_cache_key(text, self.model)
+        embedding = self._get_memory(key)
+        if embedding is not None:
+            self._count('hits')
+            self._count('memory_hits')
+            return embedding
+
+        if self.persistent_store is not None:
+            try:
+                embedding = self.persistent_store.get(key, self.ttl_seconds)
+            except Exception as e:
+                self._count('persistent_errors')
+                logger.warning(f"Persistent embedding cache lookup failed: {e}")
+                embedding = None
+            if embedding is not None:
+                self._put_memory(key, embedding)
+                self._count('hits')
+                self._count('persistent_hits')
+                return embedding
+
+        self._count('misses')
+        return None
+
+    def put(self, text, embedding):
+        key = embedding_cache_key(text, self.model)
+        self._put_memory(key, embedding)
+        if self.persistent_store is not None:
+            try:
+                self.persistent_store.put(key, self.model, embedding)
+                self._maybe_prune()
+            except Exception as e:
+                self._count('persistent_errors')
+                logger.warning(f"Persistent embedding cache write failed: {e}")
+
+    def get_or_compute(self, text, compute_fn):
+        """Return the cached embedding for text, computing and storing it on a miss."""
+        embedding = self.get(text)
+        if embedding is None:
+            embedding = compute_fn(text)
+            self.put(text, embedding)
+        return embedding
+
+    def _maybe_prune(self):
+        if time.monotonic() - self._last_prune < self.prune_interval:
+            return
+        self._last_prune = time.monotonic()
+        self.persistent_store.prune(self.ttl_seconds)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, size=len(self._entries), max_entries=self.max_entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['persistent_tier'] = type(self.persistent_store).__name__ if self.persistent_store else None
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def close(self):
+        if self.persistent_store is not None:
+            self.persistent_store.close()
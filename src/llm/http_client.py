@@ -0,0 +1,115 @@
+"""
+Shared keep-alive HTTP clients for chat completion endpoints.
+
+One httpx client (or OpenAI client wrapping one) is kept per endpoint so calls
+reuse pooled connections instead of paying a TCP/TLS handshake each time.
+Async clients are bound to the event loop that created them, so they are cached
+per loop. HTTP/2 is used when the optional `h2` package is installed.
+"""
+import asyncio
+import importlib.util
+import threading
+import weakref
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+from src.utils.logger import logger
+
+_sync_clients = {}
+_async_clients = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def _h2_available():
+    return importlib.util.find_spec('h2') is not None
+
+
+def http_client_options(config):
+    """Keyword arguments for httpx.Client/AsyncClient built from the [LLM_HTTP] section."""
+    section = 'LLM_HTTP'
+    http2 = config.getboolean(section, 'http2', fallback=True)
+    if http2 and not _h2_available():
+        logger.warning("HTTP/2 requested for LLM calls but the 'h2' package is not installed, using HTTP/1.1")
+        http2 = False
+    return {
+        'http2': http2,
+        'verify': config.get('LLM', 'cert_path', fallback='') or False,
+        'limits': httpx.Limits(
+            max_connections=config.getint(section, 'max_connections', fallback=100),
+            max_keepalive_connections=config.getint(section, 'max_keepalive_connections', fallback=20),
+            keepalive_expiry=config.getfloat(section, 'keepalive_expiry_seconds', fallback=30),
+        ),
+        'timeout': httpx.Timeout(
+            config.getfloat(section, 'read_timeout_seconds', fallback=120),
+            connect=config.getfloat(section, 'connect_timeout_seconds', fallback=10),
+            pool=config.getfloat(section, 'pool_timeout_seconds', fallback=10),
+        ),
+    }
+
+
+def _endpoint_key(config):
+    return (config.get('LLM', 'base_url', fallback=''), config.get('LLM', 'api_key', fallback=''),
+            config.get('LLM', 'cert_path', fallback=''))
+
+
+def create_sync_chat_client(config):
+    """httpx.Client for a custom endpoint, otherwise an OpenAI client on a pooled httpx.Client.
+
+    The OpenAI SDK's own retries are disabled; retries are handled by src.llm.resilience.
+    """
+    options = http_client_options(config)
+    if config.get('LLM', 'base_url', fallback=''):
+        return httpx.Client(**options)
+    return OpenAI(api_key=config.get('LLM', 'api_key'), max_retries=0, http_client=httpx.Client(**options))
+
+
+def create_async_chat_client(config):
+    options = http_client_options(config)
+    if config.get('LLM', 'base_url', fallback=''):
+        return httpx.AsyncClient(**options)
+    return AsyncOpenAI(api_key=config.get('LLM', 'api_key'), max_retries=0, http_client=httpx.AsyncClient(**options))
+
+
+def get_shared_chat_client(config):
+    """Process-wide sync client for the configured endpoint."""
+    key = _endpoint_key(config)
+    client = _sync_clients.get(key)
+    if client is None:
+        with _lock:
+            client = _sync_clients.get(key)
+            if client is None:
+                client = create_sync_chat_client(config)
+                _sync_clients[key] = client
+    return client
+
+
+def get_async_chat_client(config):
+    """Async client for the configured endpoint, shared by every call on the running event loop."""
+    loop = asyncio.get_running_loop()
+    key = _endpoint_key(config)
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            client = create_async_chat_client(config)
+            clients[key] = client
+            logger.info(f"Async LLM client created for endpoint: {key[0] or 'openai'}")
+    return client
+
+
+async def aclose_chat_clients():
+    """Close the shared clients; call on application shutdown."""
+    with _lock:
+        loop = asyncio.get_running_loop()
+        async_clients = list(_async_clients.pop(loop, {}).values())
+        sync_clients = list(_sync_clients.values())
+        _sync_clients.clear()
+    for client in async_clients:
+        if isinstance(client, AsyncOpenAI):
+            await client.close()
+        else:
+            await client.aclose()
+    for client in sync_clients:
+        client.close()
+    logger.info("Shared LLM HTTP clients closed")
@@ -1,13 +1,49 @@
-import requests
+import httpx
 import json
-from openai import OpenAI
+import threading
+from src.llm.http_client import get_shared_chat_client, get_async_chat_client
+from src.llm.resilience import (RetryableLLMError, CircuitOpenError, RETRYABLE_STATUS_CODES, get_resilience_policy,
+                                 is_retryable, parse_retry_after)
+from src.utils.rate_limiter import get_rate_limiter
 from src.utils.logger import logger
 
+_usage_totals = {'calls': 0, 'prompt_tokens': 0, 'cached_tokens': 0, 'completion_tokens': 0}
+_usage_lock = threading.Lock()
+
+
+def llm_usage_stats():
+    """Process-wide token usage, including prompt tokens served from the provider's prompt cache."""
+    with _usage_lock:
+        totals = dict(_usage_totals)
+    totals['cached_prompt_ratio'] = round(totals['cached_tokens'] / totals['prompt_tokens'], 4) \
+        if totals['prompt_tokens'] else 0.0
+    return totals
+
+
+def _usage_from(usage):
+    """Normalise an OpenAI usage object or a raw JSON usage dict."""
+    if usage is None:
+        return {}
+    if not isinstance(usage, dict):
+        usage = usage.model_dump() if hasattr(usage, 'model_dump') else vars(usage)
+    details = usage.get('prompt_tokens_details') or {}
+    return {
+        'prompt_tokens': usage.get('prompt_tokens') or 0,
+        'cached_tokens': details.get('cached_tokens') or 0,
+        'completion_tokens': usage.get('completion_tokens') or 0,
+    }
+
+
 class LLMConnector:
-    def __init__(self, messages_prompt, config):
+    def __init__(self, messages_prompt, config, client=None, temperature=0.0, top_p=0.1):
         logger.debug("Initializing LLMConnector")
         self.messages_prompt = messages_prompt
         self.config = config
+        self.client = client
+        self.temperature = temperature
+        self.top_p = top_p
+        # Token usage of the last completed call: prompt_tokens, cached_tokens, completion_tokens
+        self.last_usage = {}
         
         try:
             self.LLM_BASE_URL = self.config.get('LLM', 'base_url')
@@ -23,70 +59,100 @@ class LLMConnector:
             logger.error(f"Failed to load LLM configuration: {str(e)}", exc_info=True)
             raise
 
+    def _record_usage(self, usage):
+        self.last_usage = _usage_from(usage)
+        if not self.last_usage:
+            return
+        with _usage_lock:
+            _usage_totals['calls'] += 1
+            for key, value in self.last_usage.items():
+                _usage_totals[key] += value
+        logger.debug(f"Token usage: {self.last_usage}")
+
+    def _custom_endpoint_request(self):
+        headers = {
+            'HSBC-Params': f'{{"req_from":"{self.LLM_PROJECT_ID}", "type":"chat"}}',
+            'Authorization-Type': 'genai',
+            'Authorization': f'Bearer {self.LLM_API_KEY}',
+            'Content-Type': 'application/json'
+        }
+
+        data = {
+            "messages": self.messages_prompt,
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+            "frequency_penalty": 0.1,
+            "presence_penalty": 0.1,
+            "max_tokens": 2919,
+            "stop": None,
+            "stream": False
+        }
+        return headers, data
+
+    def _parse_custom_endpoint_response(self, response):
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            logger.warning(f"LLM request failed with retryable status {response.status_code}")
+            raise RetryableLLMError(f"LLM request failed with status {response.status_code}",
+                                    status_code=response.status_code,
+                                    retry_after=parse_retry_after(response.headers))
+        if response.status_code != 200:
+            logger.error(f"LLM request failed with status {response.status_code}: {response.text}")
+            raise Exception(f"LLM request failed with status {response.status_code}")
+        
+        response_data = json.loads(response.text)
+        logger.debug(f"LLM response received, status: {response.status_code}")
+        
+        if 'choices' not in response_data or not response_data['choices']:
+            logger.error(f"Invalid LLM response format: {response_data}")
+            raise Exception("Invalid response format from LLM")
+        
+        answer = response_data['choices'][0]['message']['content'].strip()
+        self._record_usage(response_data.get('usage'))
+        logger.info("LLM response processed successfully")
+        return answer
+
+    def _chat_completion_kwargs(self):
+        return dict(
+            model=self.LLM_MODEL,
+            messages=self.messages_prompt,
+            temperature=self.temperature,
+            top_p=self.top_p,
+            presence_penalty=0.1,
+            frequency_penalty=0.1
+        )
+
+    def _parse_chat_completion(self, response):
+        answer = response.choices[0].message.content.strip()
+        logger.info("Standard LLM response processed successfully")
+        self._record_usage(response.usage)
+        return answer
+
     def get_llm_response(self):
+        """Blocking call; uses the caller's client or the process-wide keep-alive client."""
         logger.info(f"Getting LLM response using model: {self.LLM_MODEL}")
         
         try:
-            # Initialize LLM client with or without base_url
-            if self.LLM_BASE_URL:
-                logger.debug("Using custom LLM endpoint")
-                
-                headers = {
-                    'HSBC-Params': f'{{"req_from":"{self.LLM_PROJECT_ID}", "type":"chat"}}',
-                    'Authorization-Type': 'genai',
-                    'Authorization': f'Bearer {self.LLM_API_KEY}',
-                    'Content-Type': 'application/json'
-                }
-
-                data = {
-                    "messages": self.messages_prompt,
-                    "temperature": 0.0,
-                    "top_p": 0.1,
-                    "frequency_penalty": 0.1,
-                    "presence_penalty": 0.1,
-                    "max_tokens": 2919,
-                    "stop": None,
-                    "stream": False
-                }
-                
-                logger.debug(f"Making request to custom endpoint: {self.LLM_BASE_URL}")
-                response = requests.post(self.LLM_BASE_URL, headers=headers, json=data, verify=False)
-                
-                if response.status_code != 200:
-                    logger.error(f"LLM request failed with status {response.status_code}: {response.text}")
-                    raise Exception(f"LLM request failed with status {response.status_code}")
-                
-                response_data = json.loads(response.text)
-                logger.debug(f"LLM response received, status: {response.status_code}")
-                
-                if 'choices' not in response_data or not response_data['choices']:
-                    logger.error(f"Invalid LLM response format: {response_data}")
-                    raise Exception("Invalid response format from LLM")
-                
-                answer = response_data['choices'][0]['message']['content'].strip()
-                logger.info("LLM response processed successfully")
+            client = self.client if self.client is not None else get_shared_chat_client(self.config)
 
-            else:
+            limiter = get_rate_limiter(self.config)
+
+            def attempt(timeout):
+                timeout_kwargs = {'timeout': timeout} if timeout is not None else {}
+                if self.LLM_BASE_URL:
+                    logger.debug(f"Making request to custom endpoint: {self.LLM_BASE_URL}")
+                    headers, data = self._custom_endpoint_request()
+                    response = client.post(self.LLM_BASE_URL, headers=headers, json=data, **timeout_kwargs)
+                    return self._parse_custom_endpoint_response(response)
                 logger.debug("Using standard LLM client")
-                
-                client = OpenAI(api_key=self.LLM_API_KEY)
-                response = client.chat.completions.create(
-                    model=self.LLM_MODEL,
-                    messages=self.messages_prompt,
-                    temperature=0.0,
-                    top_p=0.1,
-                    presence_penalty=0.1,
-                    frequency_penalty=0.1
-                )
-                
-                answer = response.choices[0].message.content.strip()
-                logger.info("Standard LLM response processed successfully")
-                logger.debug(f"Token usage: {response.usage}")
+                response = client.chat.completions.create(**self._chat_completion_kwargs(), **timeout_kwargs)
+                return self._parse_chat_completion(response)
+
+            answer = get_resilience_policy(self.config).call(attempt, limiter=limiter)
             
             logger.debug(f"Response length: {len(answer)} characters")
             return answer
             
-        except requests.exceptions.RequestException as req_error:
+        except httpx.HTTPError as req_error:
             logger.error(f"Network error during LLM request: {str(req_error)}", exc_info=True)
             raise
         except json.JSONDecodeError as json_error:
@@ -94,4 +160,124 @@ class LLMConnector:
             raise
         except Exception as e:
             logger.error(f"LLM request failed: {str(e)}", exc_info=True)
-            raise
\ No newline at end of file
+            raise
+
+    async def aget_llm_response(self):
+        """Non-blocking call on the event loop's shared HTTP/2 keep-alive client for this endpoint."""
+        logger.info(f"Getting async LLM response using model: {self.LLM_MODEL}")
+        
+        try:
+            client = get_async_chat_client(self.config)
+
+            limiter = get_rate_limiter(self.config)
+
+            async def attempt(timeout):
+                timeout_kwargs = {'timeout': timeout} if timeout is not None else {}
+                if self.LLM_BASE_URL:
+                    logger.debug(f"Making async request to custom endpoint: {self.LLM_BASE_URL}")
+                    headers, data = self._custom_endpoint_request()
+                    response = await client.post(self.LLM_BASE_URL, headers=headers, json=data, **timeout_kwargs)
+                    return self._parse_custom_endpoint_response(response)
+                logger.debug("Using standard async LLM client")
+                response = await client.chat.completions.create(**self._chat_completion_kwargs(), **timeout_kwargs)
+                return self._parse_chat_completion(response)
+
+            # Retries, deadline and (when enabled) a hedged duplicate after the endpoint's p95 latency
+            answer = await get_resilience_policy(self.config).acall(attempt, limiter=limiter)
+            
+            logger.debug(f"Response length: {len(answer)} characters")
+            return answer
+            
+        except httpx.HTTPError as req_error:
+            logger.error(f"Network error during async LLM request: {str(req_error)}", exc_info=True)
+            raise
+        except json.JSONDecodeError as json_error:
+            logger.error(f"Failed to parse LLM response JSON: {str(json_error)}", exc_info=True)
+            raise
+        except Exception as e:
+            logger.error(f"Async LLM request failed: {str(e)}", exc_info=True)
+            raise
+
+    async def astream_llm_response(self):
+        """
+        Stream the completion as text deltas over the shared async client.
+
+        Closing the generator early (aclose) closes the HTTP stream, which stops generation.
+        Partial output cannot be replayed, so streams are not retried or hedged; they only
+        respect and feed the endpoint's circuit breaker.
+        """
+        logger.info(f"Streaming LLM response using model: {self.LLM_MODEL}")
+        client = get_async_chat_client(self.config)
+        breaker = get_resilience_policy(self.config).breaker
+        # Wait on the local limiter before taking the breaker's half-open probe slot
+        limiter = get_rate_limiter(self.config)
+        if limiter is not None:
+            await limiter.aacquire()
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit breaker for LLM endpoint '{breaker.name}' is open")
+        
+        received = False
+        try:
+            if self.LLM_BASE_URL:
+                headers, data = self._custom_endpoint_request()
+                data["stream"] = True
+                async with client.stream("POST", self.LLM_BASE_URL, headers=headers, json=data) as response:
+                    if response.status_code in RETRYABLE_STATUS_CODES:
+                        raise RetryableLLMError(f"LLM request failed with status {response.status_code}",
+                                                status_code=response.status_code,
+                                                retry_after=parse_retry_after(response.headers))
+                    if response.status_code != 200:
+                        body = await response.aread()
+                        logger.error(f"LLM stream request failed with status {response.status_code}: {body[:500]}")
+                        raise Exception(f"LLM request failed with status {response.status_code}")
+                    # Server-sent events: one 'data: {...}' line per chunk, terminated by 'data: [DONE]'
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        payload = line[len("data:"):].strip()
+                        if payload == "[DONE]":
+                            break
+                        chunk = json.loads(payload)
+                        if chunk.get("usage"):
+                            self._record_usage(chunk["usage"])
+                        choices = chunk.get("choices") or []
+                        delta = (choices[0].get("delta") or {}).get("content") if choices else None
+                        if delta:
+                            received = True
+                            yield delta
+            else:
+                # The final chunk carries the usage (including cached prompt tokens) when requested
+                stream = await client.chat.completions.create(stream=True, stream_options={"include_usage": True},
+                                                              **self._chat_completion_kwargs())
+                try:
+                    async for chunk in stream:
+                        if chunk.usage:
+                            self._record_usage(chunk.usage)
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            received = True
+                            yield chunk.choices[0].delta.content
+                finally:
+                    await stream.close()
+            breaker.record_success()
+            
+        except Exception as e:
+            if is_retryable(e):
+                breaker.record_failure()
+            else:
+                breaker.release_probe()
+            if isinstance(e, httpx.HTTPError):
+                logger.error(f"Network error during streaming LLM request: {str(e)}", exc_info=True)
+            elif isinstance(e, json.JSONDecodeError):
+                logger.error(f"Failed to parse streamed LLM chunk: {str(e)}", exc_info=True)
+            raise
+        except GeneratorExit:
+            # Closed early by the consumer (statement complete): only a stream that produced output proves health
+            if received:
+                breaker.record_success()
+            else:
+                breaker.release_probe()
+            raise
+        except BaseException:
+            # Cancelled (e.g. client disconnect): says nothing about the endpoint, give back the probe slot
+            breaker.release_probe()
+            raise
@@ -5,6 +5,11 @@ def get_prompt_for_analytical_intent(query: str):
     return prompt
 
 def get_prompt_for_generating_sql_query(tables: str, schema: str, content: str):
+    prompt = get_sql_generation_request(tables, schema, content) + get_sql_generation_rules()
+    return prompt
+
+def get_sql_generation_request(tables: str, schema: str, content: str):
+    """Per-request part of the SQL generation prompt: retrieved context and the user request."""
     prompt = f'''
     ### Table Details
     The following are the table descriptions and join keys, separated by '|':
@@ -21,7 +26,12 @@ def get_prompt_for_generating_sql_query(tables: str, schema: str, content: str):
 
     {content}
 
-    ### Rules and Guidelines (Follow all strictly)
+'''
+    return prompt
+
+def get_sql_generation_rules():
+    """Static rules and output format of the SQL generation prompt; identical for every request."""
+    prompt = '''    ### Rules and Guidelines (Follow all strictly)
     1. Use **only** column names listed in the MATCHED_SCHEMA section.
     2. Associate each column strictly with its corresponding table from MATCHED_SCHEMA.
     3. If the user prompt matches any known prompt examples, return the corresponding sample SQL query.
@@ -110,3 +120,37 @@ def get_prompt_verify_invalid_domain_query(content: str):
       A single boolean value: True or False
     """
     return prompt  
+
+def get_prompt_for_combined_guardrails(query: str):
+    prompt = f"""
+      You are a classifier for a banking analytics assistant. Evaluate the user request below on two checks.
+
+      1. "analytical": true if the request is an analytical/BI question that can be answered by querying data
+         (counts, trends, aggregations, lists, comparisons), otherwise false.
+      2. "domain": true if the request relates to the banking or financial domain, otherwise false.
+         Treat it as banking/financial if it refers to entities (bank, account, customer, user, client),
+         operations (deposit, withdraw, transfer, payment, transaction, statement, audit) or financial terms
+         (balance, loan, mortgage, interest rate, credit, debit, savings, investment, insurance, tax, currency, fund, ATM).
+         Be case-insensitive and consider domain-specific intent, not only exact keywords.
+
+      User request:
+      {query}
+
+      Respond with ONLY a JSON object and nothing else, exactly in this shape:
+      {{"analytical": true, "domain": true}}
+    """
+    return prompt
+
+def get_verdict_instructions_for_sql_generation():
+    prompt = '''
+    ### Pre-check (answer this first)
+    Before writing any SQL, classify the User Request on two checks:
+    - "analytical": true if it is an analytical/BI question answerable by querying data, otherwise false.
+    - "domain": true if it relates to the banking or financial domain, otherwise false.
+    The first line of your output must be the verdict, exactly in this format:
+      Verdict:-{"analytical": true, "domain": true}
+    If either value is false, output ONLY the verdict line and stop.
+    Otherwise put the "Optimised Query:-" line immediately after the verdict line; this overrides
+    the rule above that nothing may appear before the query.
+    '''
+    return prompt
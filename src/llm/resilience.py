@@ -0,0 +1,317 @@
+"""
+Resilience layer for LLM calls: per-call deadlines, retries with exponential
+backoff and jitter on 429/5xx/transport errors (honouring Retry-After), hedged
+requests on the async path, and a circuit breaker per endpoint.
+
+Breakers and latency histories are shared by every caller of the same endpoint,
+so one market's stalls open the breaker for all requests going to that endpoint.
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+
+import httpx
+import openai
+
+from src.utils.logger import logger
+from src.utils.rate_limiter import RateLimitTimeoutError
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class RetryableLLMError(Exception):
+    """Transient LLM failure (429/5xx); retry_after is the server's hint in seconds, if any."""
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the endpoint while its circuit breaker is open."""
+
+
+class DeadlineExceededError(TimeoutError):
+    """Raised when an LLM call did not succeed within its overall deadline."""
+
+
+def parse_retry_after(headers):
+    value = headers.get('retry-after') if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def is_retryable(error):
+    # Our own limiter timing out says nothing about the endpoint
+    if isinstance(error, RateLimitTimeoutError):
+        return False
+    if isinstance(error, RetryableLLMError):
+        return True
+    if isinstance(error, (httpx.TimeoutException, httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError,
+                          openai.InternalServerError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in RETRYABLE_STATUS_CODES
+
+
+def _retry_after_of(error):
+    if isinstance(error, RetryableLLMError):
+        return error.retry_after
+    response = getattr(error, 'response', None)
+    return parse_retry_after(getattr(response, 'headers', None))
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies used to derive the hedging delay."""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def __len__(self):
+        return len(self._samples)
+
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures; half-open lets one probe through after the reset timeout."""
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = float(reset_timeout)
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def release_probe(self):
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit breaker '{self.name}' closed")
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuit breaker '{self.name}' opened after {self._failures} consecutive failures")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def stats(self):
+        with self._lock:
+            return {'state': self.state, 'consecutive_failures': self._failures}
+
+
+class ResiliencePolicy:
+    """Retry/deadline/hedging settings from [LLM_RESILIENCE] bound to one endpoint's breaker and latency history."""
+
+    def __init__(self, config, endpoint):
+        section = 'LLM_RESILIENCE'
+        self.endpoint = endpoint
+        self.enabled = config.getboolean(section, 'enabled', fallback=True)
+        self.deadline = config.getfloat(section, 'deadline_seconds', fallback=60)
+        self.max_attempts = max(1, config.getint(section, 'max_attempts', fallback=3))
+        self.backoff_base = config.getfloat(section, 'backoff_base_seconds', fallback=0.5)
+        self.backoff_max = config.getfloat(section, 'backoff_max_seconds', fallback=8)
+        self.hedge_enabled = config.getboolean(section, 'hedge_enabled', fallback=False)
+        self.hedge_quantile = config.getfloat(section, 'hedge_quantile', fallback=0.95)
+        self.hedge_min_delay = config.getfloat(section, 'hedge_min_delay_seconds', fallback=1.0)
+        self.hedge_min_samples = config.getint(section, 'hedge_min_samples', fallback=20)
+        self.breaker, self.latencies = _endpoint_state(
+            endpoint,
+            failure_threshold=config.getint(section, 'breaker_failure_threshold', fallback=5),
+            reset_timeout=config.getfloat(section, 'breaker_reset_seconds', fallback=30),
+        )
+
+    def _backoff(self, attempt, retry_after):
+        # Full jitter: uniform over [0, min(max, base * 2^attempt)]
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        return max(delay, retry_after or 0)
+
+    def hedge_delay(self):
+        if not self.hedge_enabled or len(self.latencies) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, self.latencies.quantile(self.hedge_quantile))
+
+    def _before_attempt(self):
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Circuit breaker for LLM endpoint '{self.endpoint}' is open")
+
+    def _after_failure(self, error, attempt, deadline):
+        """Record the failure and return the backoff delay, or re-raise when the call should not be retried."""
+        if isinstance(error, RateLimitTimeoutError):
+            # The endpoint was never contacted: give back the probe slot without judging its health
+            self.breaker.release_probe()
+            raise error
+        if not is_retryable(error):
+            # The endpoint answered; a bad request says nothing about its health
+            self.breaker.record_success()
+            raise error
+        self.breaker.record_failure()
+        if attempt + 1 >= self.max_attempts:
+            raise error
+        delay = self._backoff(attempt, _retry_after_of(error))
+        if delay >= deadline - time.monotonic():
+            raise DeadlineExceededError(
+                f"LLM call to '{self.endpoint}' exceeded its {self.deadline}s deadline: {error}") from error
+        logger.warning(f"LLM call to '{self.endpoint}' failed (attempt {attempt + 1}/{self.max_attempts}): {error}; "
+                       f"retrying in {delay:.2f}s")
+        return delay
+
+    def call(self, fn, limiter=None):
+        """
+        Run fn(timeout) with retries; timeout is the time left before the overall deadline.
+
+        A token is taken from `limiter` (if given) before each attempt, and before the breaker's
+        half-open probe slot, so waiting on the local limiter never holds the probe.
+        Hedging is only available on the async path.
+        """
+        if not self.enabled:
+            if limiter is not None:
+                limiter.acquire()
+            return fn(None)
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            if limiter is not None:
+                limiter.acquire(timeout=max(0.001, deadline - time.monotonic()))
+            self._before_attempt()
+            started = time.monotonic()
+            try:
+                result = fn(max(0.001, deadline - started))
+            except Exception as e:
+                time.sleep(self._after_failure(e, attempt, deadline))
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            self.latencies.record(time.monotonic() - started)
+            return result
+
+    async def _attempt(self, fn, deadline, limiter=None):
+        if limiter is not None:
+            await limiter.aacquire(timeout=max(0.001, deadline - time.monotonic()))
+        self._before_attempt()
+        started = time.monotonic()
+        remaining = max(0.001, deadline - started)
+        try:
+            result = await asyncio.wait_for(fn(remaining), timeout=remaining)
+        except asyncio.CancelledError:
+            # A losing hedge must not leave a half-open probe slot taken
+            self.breaker.release_probe()
+            raise
+        self.breaker.record_success()
+        self.latencies.record(time.monotonic() - started)
+        return result
+
+    async def _hedged_attempt(self, fn, deadline, limiter=None):
+        delay = self.hedge_delay()
+        primary = asyncio.create_task(self._attempt(fn, deadline, limiter))
+        if delay is None or delay >= deadline - time.monotonic():
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        logger.info(f"LLM call to '{self.endpoint}' slower than {delay:.2f}s, sending hedged request")
+        tasks = {primary, asyncio.create_task(self._attempt(fn, deadline, limiter))}
+        error = None
+        try:
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def acall(self, fn, limiter=None):
+        """Async counterpart of call(); fn(timeout) must return an awaitable. Slow attempts may be hedged."""
+        if not self.enabled:
+            if limiter is not None:
+                await limiter.aacquire()
+            return await fn(None)
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            try:
+                return await self._hedged_attempt(fn, deadline, limiter)
+            except (CircuitOpenError, RateLimitTimeoutError):
+                raise
+            except Exception as e:
+                await asyncio.sleep(self._after_failure(e, attempt, deadline))
+                attempt += 1
+
+
+_endpoints = {}
+_endpoints_lock = threading.Lock()
+
+
+def _endpoint_state(endpoint, failure_threshold, reset_timeout):
+    with _endpoints_lock:
+        state = _endpoints.get(endpoint)
+        if state is None:
+            state = (CircuitBreaker(endpoint, failure_threshold, reset_timeout), LatencyTracker())
+            _endpoints[endpoint] = state
+        return state
+
+
+def get_resilience_policy(config):
+    endpoint = config.get('LLM', 'base_url', fallback='') or 'openai'
+    return ResiliencePolicy(config, endpoint)
+
+
+def resilience_stats():
+    with _endpoints_lock:
+        endpoints = dict(_endpoints)
+    return {
+        endpoint: dict(breaker.stats(), samples=len(latencies), p50_seconds=latencies.quantile(0.5),
+                       p95_seconds=latencies.quantile(0.95))
+        for endpoint, (breaker, latencies) in endpoints.items()
+    }
@@ -3,20 +3,18 @@ BigQuery client setup service.
 """
 from google.cloud import bigquery
 from google.oauth2 import service_account
-from src.database.db_config import GoogleCloudSqlUtility
 
 
-from src.utils.config_reader import load_config
-
-
-def get_bigquery_client(market=None):
+def create_bigquery_client(db_util):
     """
-    Create and return a BigQuery client using the configuration in config.ini.
+    Build a BigQuery client from a market's GoogleCloudSqlUtility settings.
+
+    Args:
+        db_util (GoogleCloudSqlUtility): Market database utility holding the GCP settings
 
     Returns:
         tuple: (bigquery.Client, project_id, dataset_id, location)
     """
-    db_util = GoogleCloudSqlUtility(market)
     project_id = db_util.project_id
     dataset_id = db_util.dataset_id
     service_account_file = db_util.service_account_file
@@ -28,4 +26,16 @@ def get_bigquery_client(market=None):
     # Create BigQuery client
     client = bigquery.Client(credentials=credentials, project=project_id, location=location)
 
-    return client, project_id, dataset_id, location
\ No newline at end of file
+    return client, project_id, dataset_id, location
+
+
+def get_bigquery_client(market=None):
+    """
+    Return the shared BigQuery client for a market, creating it on first use.
+
+    Returns:
+        tuple: (bigquery.Client, project_id, dataset_id, location)
+    """
+    from src.services.market_registry import get_market_resources
+
+    return get_market_resources(market).bigquery_client
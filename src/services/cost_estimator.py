@@ -6,11 +6,17 @@ from google.cloud import bigquery
 from datetime import datetime
 import json
 import os
+import threading
 
 from src.services.bq_client import get_bigquery_client
+from src.services.estimate_cache import estimate_cache_key
+from src.services.market_registry import get_market_resources
 from src.services.cost_utils import calculate_query_cost, format_bytes
 from src.utils.logger import logger
 
+# Serialises read-modify-write of the history file across concurrent estimates
+_history_lock = threading.Lock()
+
 class Estimate:
     def __init__(self, query, market):
         self.market = market
@@ -33,19 +39,35 @@ class Estimate:
         try:
             # Get BigQuery client
             logger.debug("Retrieving BigQuery client")
-            client, project_id, dataset_id = get_bigquery_client(self.market)
+            client, project_id, dataset_id, _ = get_bigquery_client(self.market)
             logger.info(f"Connected to project: {project_id}, dataset: {dataset_id}")
+            default_dataset = f"{project_id}.{dataset_id}"
+
+            # Reuse a dry run of the same SQL while the tables it reads are unchanged
+            start_time = datetime.now()
+            cache = get_market_resources(self.market).estimate_cache
+            cache_key = estimate_cache_key(self.market, self.query, default_dataset) if cache is not None else None
+            cached = cache.get(cache_key) if cache is not None else None
+            if cached is not None:
+                cached.update({
+                    'query': self.query,
+                    'elapsed_ms': (datetime.now() - start_time).total_seconds() * 1000,
+                    'cache_hit': True,
+                    'timestamp': datetime.now().isoformat()
+                })
+                # Already recorded in the history file when it was first estimated
+                logger.info(f"Cost estimate served from cache: ${cached.get('estimated_cost_usd', 0):.6f} USD")
+                return cached
 
             # Configure job for dry run
             job_config = bigquery.QueryJobConfig(
                 dry_run=True,
                 use_query_cache=False,
-                default_dataset=f"{project_id}.{dataset_id}"
+                default_dataset=default_dataset
             )
             logger.debug("Configured dry run job")
 
             # Run the query as a dry run
-            start_time = datetime.now()
             logger.debug("Executing dry run query")
             query_job = client.query(self.query, job_config=job_config)
             end_time = datetime.now()
@@ -65,12 +87,17 @@ class Estimate:
             # Add additional information
             cost_info.update({
                 'query': self.query,
+                'referenced_tables': [f"{table.project}.{table.dataset_id}.{table.table_id}"
+                                      for table in query_job.referenced_tables or []],
                 'elapsed_ms': elapsed_ms,
+                'cache_hit': False,
                 'status': 'success',
                 'timestamp': datetime.now().isoformat()
             })
 
             logger.info(f"Cost estimation successful: ${cost_info.get('estimated_cost_usd', 0):.6f} USD")
+            if cache is not None:
+                cache.put(cache_key, cost_info)
 
             # Save to history file
             try:
@@ -182,7 +209,7 @@ class Estimate:
         try:
             # Get BigQuery client
             logger.debug("Retrieving BigQuery client for execution plan")
-            client, project_id, dataset_id = get_bigquery_client(self.market)
+            client, project_id, dataset_id, _ = get_bigquery_client(self.market)
 
             # Create EXPLAIN query
             explain_query = f"EXPLAIN PLAN FOR {self.query}"
@@ -234,28 +261,30 @@ class Estimate:
         logger.debug(f"Saving estimate to history file: {history_file}")
 
         try:
-            # Load existing history
-            history = []
-            if os.path.exists(history_file):
-                logger.debug("Loading existing history file")
-                with open(history_file, 'r') as f:
-                    try:
-                        history = json.load(f)
-                        logger.debug(f"Loaded {len(history)} existing history entries")
-                    except json.JSONDecodeError as json_error:
-                        logger.warning(f"History file corrupted, starting fresh: {json_error}")
-                        history = []
-            else:
-                logger.debug("History file doesn't exist, creating new one")
+            # Concurrent estimates (e.g. parallel candidate dry runs) must not interleave the read-modify-write
+            with _history_lock:
+                # Load existing history
+                history = []
+                if os.path.exists(history_file):
+                    logger.debug("Loading existing history file")
+                    with open(history_file, 'r') as f:
+                        try:
+                            history = json.load(f)
+                            logger.debug(f"Loaded {len(history)} existing history entries")
+                        except json.JSONDecodeError as json_error:
+                            logger.warning(f"History file corrupted, starting fresh: {json_error}")
+                            history = []
+                else:
+                    logger.debug("History file doesn't exist, creating new one")
 
-            # Add new estimate
-            history.append(estimate_data)
-            logger.debug(f"Added new estimate to history, total entries: {len(history)}")
+                # Add new estimate
+                history.append(estimate_data)
+                logger.debug(f"Added new estimate to history, total entries: {len(history)}")
 
-            # Save updated history
-            with open(history_file, 'w') as f:
-                json.dump(history, f, indent=2)
-            logger.debug("Successfully saved estimate to history")
+                # Save updated history
+                with open(history_file, 'w') as f:
+                    json.dump(history, f, indent=2)
+                logger.debug("Successfully saved estimate to history")
 
         except Exception as e:
             logger.error(f"Error saving estimate to history: {e}", exc_info=True)
@@ -0,0 +1,115 @@
+"""
+Cache of BigQuery dry-run estimates.
+
+/execute_query estimates every query before running it and /estimate is often
+called for the same SQL, so each repeat would otherwise pay a dry-run round
+trip. Entries are keyed by (market, normalised SQL, default dataset) and held
+in an LRU with TTL. Each entry remembers the modified time of the tables the
+dry run referenced; when any of them changes the entry is dropped, since bytes
+processed (and so the cost) may have changed too. Estimates over tables without
+a trustworthy version (streaming buffers, external tables) are not cached.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from src.utils.logger import logger
+from src.utils.sql_analyzer import normalize_sql
+
+
+def estimate_cache_key(market, sql_query, default_dataset):
+    material = "\x00".join([market, default_dataset, normalize_sql(sql_query)])
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class EstimateCache:
+    def __init__(self, market, table_version_fn, max_entries=2000, ttl_seconds=600):
+        """
+        Args:
+            market (str): Market whose estimates are cached
+            table_version_fn (callable): Table id -> data version (e.g. TableVersionTracker.version)
+            max_entries (int): LRU bound
+            ttl_seconds (float): Maximum age of an estimate; 0 keeps estimates until evicted or invalidated
+        """
+        self.market = market
+        self.table_version_fn = table_version_fn
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = float(ttl_seconds or 0)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'expired': 0, 'invalidated': 0,
+                       'bypassed': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _table_versions(self, referenced_tables):
+        return {table_id: self.table_version_fn(table_id) for table_id in referenced_tables}
+
+    def get(self, key):
+        """
+        Returns:
+            dict or None: Copy of the cached estimate, if it is still valid
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            self._count('misses')
+            return None
+
+        estimate, versions, expires_at = entry
+        if expires_at and time.monotonic() > expires_at:
+            self._drop(key, entry, 'expired')
+            return None
+        try:
+            current = self._table_versions(versions)
+        except Exception as e:
+            logger.warning(f"Estimate cache could not read table metadata for market {self.market}: {e}")
+            current = None
+        if current != versions:
+            self._drop(key, entry, 'invalidated')
+            return None
+        self._count('hits')
+        return dict(estimate)
+
+    def _drop(self, key, entry, reason):
+        with self._lock:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+            self._stats[reason] += 1
+            self._stats['misses'] += 1
+
+    def put(self, key, estimate):
+        try:
+            versions = self._table_versions(estimate.get('referenced_tables') or [])
+        except Exception as e:
+            logger.warning(f"Estimate not cached, table metadata unavailable for market {self.market}: {e}")
+            return
+        if any(version is None for version in versions.values()):
+            # An unknown version would always compare equal, so the entry could never be invalidated
+            self._count('bypassed')
+            return
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._entries[key] = (dict(estimate), versions, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+            self._stats['stores'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, size=len(self._entries), max_entries=self.max_entries,
+                         ttl_seconds=self.ttl_seconds)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
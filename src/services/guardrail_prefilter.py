@@ -0,0 +1,176 @@
+"""
+Local, CPU-only pre-classifier for the analytical-intent and domain guardrails.
+
+Builds a vocabulary from the market's table/column metadata, business glossary
+and few-shot questions, then answers only the high-confidence cases:
+questions that clearly reference the schema with an analytical cue, or that
+clearly match an off-topic pattern with no schema reference at all. Everything
+in between returns None for that check and is left to the LLM validators.
+Questions containing a write verb (update, delete, drop, ...) are never
+accepted locally, so the LLM intent check always sees them.
+"""
+import glob
+import json
+import os
+import re
+
+from src.utils.logger import logger
+
+_WORD_RE = re.compile(r"[a-z][a-z0-9]+")
+
+# Only words that signal aggregation/reporting on their own; function words such as 'by', 'per',
+# 'last' or 'show' also appear in write requests ("update balance by 100") and are not cues
+ANALYTICAL_CUES = {
+    'how many', 'how much', 'count', 'number of', 'total', 'sum', 'average', 'avg', 'median',
+    'max', 'maximum', 'min', 'minimum', 'top', 'bottom', 'highest', 'lowest',
+    'trend', 'over time', 'breakdown', 'distribution', 'percentage', 'percent', 'ratio',
+    'compare', 'comparison', 'daily', 'weekly', 'monthly', 'yearly', 'heat map', 'chart', 'plot',
+}
+
+# Requests to change data or schema; such questions are always left to the LLM
+_WRITE_VERB_RE = re.compile(
+    r"\b(?:(?:updat|delet|insert|alter|truncat|revok|remov|modif|merg|replac|renam|eras|purg|overwrit|execut)\w*"
+    r"|drop(?:s|ped|ping)?|grant(?:s|ed|ing)?|creat(?:e|es|ed|ing)|wip(?:e|es|ed|ing))\b"
+)
+
+OFF_TOPIC_CUES = {
+    'joke', 'poem', 'story', 'song', 'lyrics', 'recipe', 'weather', 'movie', 'film', 'celebrity', 'football',
+    'cricket', 'game', 'translate', 'write code', 'python code', 'javascript', 'who are you', 'your name',
+    'tell me about yourself', 'meaning of life', 'capital of', 'president of', 'horoscope', 'news',
+    'essay', 'homework', 'dating', 'travel', 'holiday', 'vacation',
+}
+
+# Mirrors the keyword list in the LLM domain-check prompt
+DOMAIN_KEYWORDS = {
+    'bank', 'account', 'customer', 'user', 'client', 'deposit', 'withdraw', 'withdrawal', 'transfer', 'payment',
+    'transaction', 'statement', 'audit', 'balance', 'loan', 'mortgage', 'interest', 'credit', 'debit',
+    'saving', 'checking', 'investment', 'insurance', 'capital', 'budget', 'tax', 'currency', 'fund', 'atm',
+    'financial', 'finance', 'fraud', 'card', 'merchant', 'revenue',
+}
+
+_STOPWORDS = {
+    'the', 'and', 'for', 'with', 'from', 'that', 'this', 'are', 'was', 'were', 'has', 'have', 'had', 'not',
+    'all', 'any', 'each', 'its', 'into', 'than', 'then', 'them', 'they', 'our', 'you', 'your', 'can', 'will',
+    'used', 'use', 'based', 'such', 'also', 'more', 'most', 'other', 'some', 'only', 'over', 'per', 'who',
+    'what', 'which', 'when', 'where', 'how', 'show', 'list', 'give', 'get', 'me', 'please', 'data', 'value',
+    'values', 'type', 'types', 'name', 'number', 'details', 'information', 'including', 'e', 'g', 'eg',
+    'about', 'after', 'before', 'there', 'their', 'these', 'those', 'been', 'being', 'would', 'could',
+    'should', 'make', 'made', 'like', 'just', 'very', 'many', 'much', 'well', 'within', 'across', 'through',
+    'during', 'under', 'upon', 'out', 'off', 'own', 'same', 'both', 'few', 'new', 'one', 'two', 'tell',
+    'write', 'know', 'want', 'need', 'does', 'did', 'doe', 'thi', 'wa', 'ha',
+}
+
+
+def _stem(word):
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    return {_stem(word) for word in _WORD_RE.findall((text or '').lower().replace('_', ' '))}
+
+
+def _load_json_records(path):
+    if not path or not os.path.exists(path):
+        return []
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Guardrail pre-filter could not read {path}: {e}")
+        return []
+    return data if isinstance(data, list) else [data]
+
+
+class GuardrailPrefilter:
+    def __init__(self, schema_terms, domain_terms, min_schema_hits=1, min_domain_hits=2):
+        """
+        Args:
+            schema_terms (set): Stemmed tokens from table/column names and business terms
+            domain_terms (set): Broader stemmed vocabulary (descriptions, glossary, few-shot questions)
+            min_schema_hits (int): Schema-term hits needed to accept the domain check locally
+            min_domain_hits (int): Total vocabulary hits needed to accept the domain check locally
+        """
+        self.schema_terms = frozenset(schema_terms)
+        self.domain_terms = frozenset(domain_terms | schema_terms)
+        self.min_schema_hits = min_schema_hits
+        self.min_domain_hits = min_domain_hits
+        self._analytical_phrases = tuple(cue for cue in ANALYTICAL_CUES if ' ' in cue)
+        self._analytical_words = frozenset(_stem(cue) for cue in ANALYTICAL_CUES if ' ' not in cue)
+        self._off_topic_phrases = tuple(cue for cue in OFF_TOPIC_CUES if ' ' in cue)
+        self._off_topic_words = frozenset(_stem(cue) for cue in OFF_TOPIC_CUES if ' ' not in cue)
+
+    @classmethod
+    def from_config(cls, config, market):
+        """Build the vocabulary from the market's metadata files."""
+        section = 'Database'
+        tables_path = config.get(section, 'tables_path', fallback='')
+        columns_path = config.get(section, 'columns_path', fallback='')
+        glossary_path = config.get(section, 'glossary_path', fallback='./config/business_glossary.json')
+        messages_path = config.get(section, 'messages_path', fallback='')
+
+        tables = _load_json_records(tables_path)
+        for path in sorted(glob.glob(os.path.join('config', market, 'tables', '*.json'))):
+            tables.extend(_load_json_records(path))
+        columns = _load_json_records(columns_path)
+        glossary = _load_json_records(glossary_path)
+
+        schema_terms, domain_terms = set(), set()
+        for table in tables:
+            schema_terms |= tokenize(table.get('table_name', '')) | tokenize(table.get('display_name', ''))
+            for key in ('filter_columns', 'aggregate_columns', 'sort_columns', 'key_columns', 'related_business_terms', 'tags'):
+                for value in table.get(key) or []:
+                    schema_terms |= tokenize(value if isinstance(value, str) else json.dumps(value))
+            domain_terms |= tokenize(table.get('description', ''))
+        for column in columns:
+            schema_terms |= tokenize(column.get('column_name', ''))
+            for term in column.get('related_business_terms') or []:
+                schema_terms |= tokenize(term)
+            domain_terms |= tokenize(column.get('description', ''))
+        for entry in glossary:
+            schema_terms |= tokenize(entry.get('term', ''))
+            for key in ('tags', 'related_tables'):
+                for value in entry.get(key) or []:
+                    domain_terms |= tokenize(value)
+            domain_terms |= tokenize(entry.get('definition', ''))
+        for message in _load_json_records(messages_path):
+            if message.get('role') == 'user':
+                domain_terms |= tokenize(message.get('content', ''))
+
+        schema_terms = {term for term in schema_terms if len(term) > 2} - _STOPWORDS
+        domain_terms = ({term for term in domain_terms if len(term) > 2} | tokenize(' '.join(DOMAIN_KEYWORDS))) - _STOPWORDS
+        logger.info(f"Guardrail pre-filter built for market {market}: {len(schema_terms)} schema terms, "
+                    f"{len(domain_terms)} domain terms")
+        return cls(
+            schema_terms, domain_terms,
+            min_schema_hits=config.getint('GUARDRAILS', 'prefilter_min_schema_hits', fallback=1),
+            min_domain_hits=config.getint('GUARDRAILS', 'prefilter_min_domain_hits', fallback=2),
+        )
+
+    def classify(self, query):
+        """
+        Returns:
+            dict: {'analytical': 'True'|'False'|None, 'domain': 'True'|'False'|None}; None means ask the LLM
+        """
+        text = (query or '').lower()
+        tokens = tokenize(text)
+        schema_hits = len(tokens & self.schema_terms)
+        domain_hits = len(tokens & self.domain_terms)
+        analytical_cue = bool(tokens & self._analytical_words) or any(p in text for p in self._analytical_phrases)
+        off_topic_cue = bool(tokens & self._off_topic_words) or any(p in text for p in self._off_topic_phrases)
+        write_request = bool(_WRITE_VERB_RE.search(text))
+
+        verdict = {'analytical': None, 'domain': None}
+        if off_topic_cue and domain_hits == 0:
+            verdict['domain'] = 'False'
+            if not analytical_cue:
+                verdict['analytical'] = 'False'
+        elif (not off_topic_cue and not write_request
+              and schema_hits >= self.min_schema_hits and domain_hits >= self.min_domain_hits):
+            verdict['domain'] = 'True'
+            if analytical_cue:
+                verdict['analytical'] = 'True'
+        return verdict
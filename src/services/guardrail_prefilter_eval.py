@@ -0,0 +1,113 @@
+"""
+Offline evaluation of the local guardrail pre-filter against the LLM validators.
+
+Usage:
+    python -m src.services.guardrail_prefilter_eval --market US --input questions.jsonl [--output labelled.jsonl]
+
+Each input line is a JSON object with a "query" and, optionally, previously recorded
+LLM verdicts {"analytical": "True"|"False", "domain": "True"|"False"}. Missing verdicts
+are fetched from the LLM validators and can be written to --output so later runs
+need no LLM calls. The report gives, per check, how often the pre-filter answered
+locally, its agreement with the LLM on those cases, and its false accepts/rejects.
+"""
+import argparse
+import json
+import time
+
+from src.services.guardrail_prefilter import GuardrailPrefilter
+from src.services.guardrails_service import (PRE_GENERATION_CHECKS, validate_query_intent_for_analytical,
+                                             validate_query_for_invalid_domain_query)
+from src.utils.config_reader import load_config
+
+
+def _llm_verdicts(query, config, record):
+    validators = {
+        'analytical': validate_query_intent_for_analytical,
+        'domain': validate_query_for_invalid_domain_query,
+    }
+    verdicts = {}
+    for check in PRE_GENERATION_CHECKS:
+        value = record.get(check)
+        if value is None:
+            value = validators[check](query, config)
+        verdicts[check] = str(value).strip()
+    return verdicts
+
+
+def evaluate(prefilter, records, config=None):
+    """
+    Compare pre-filter verdicts with LLM verdicts.
+
+    Args:
+        prefilter (GuardrailPrefilter): Classifier under test
+        records (list): Dicts with 'query' and optional recorded LLM verdicts
+        config: Market configuration, needed only when verdicts must be fetched from the LLM
+
+    Returns:
+        tuple: (report dict, records with LLM verdicts filled in)
+    """
+    report = {
+        check: {'total': 0, 'answered_locally': 0, 'agreements': 0, 'false_accepts': 0, 'false_rejects': 0}
+        for check in PRE_GENERATION_CHECKS
+    }
+    latencies = []
+    labelled = []
+    for record in records:
+        query = record['query']
+        llm = _llm_verdicts(query, config, record)
+        labelled.append(dict(record, **llm))
+
+        started = time.perf_counter()
+        local = prefilter.classify(query)
+        latencies.append(time.perf_counter() - started)
+
+        for check in PRE_GENERATION_CHECKS:
+            stats = report[check]
+            stats['total'] += 1
+            if local[check] is None:
+                continue
+            stats['answered_locally'] += 1
+            if local[check] == llm[check]:
+                stats['agreements'] += 1
+            elif local[check] == 'True':
+                stats['false_accepts'] += 1
+            else:
+                stats['false_rejects'] += 1
+
+    for stats in report.values():
+        answered = stats['answered_locally']
+        stats['coverage'] = round(answered / stats['total'], 4) if stats['total'] else 0.0
+        stats['agreement'] = round(stats['agreements'] / answered, 4) if answered else None
+
+    latencies.sort()
+    report['llm_calls_saved'] = sum(report[check]['answered_locally'] for check in PRE_GENERATION_CHECKS)
+    report['latency_us'] = {
+        'p50': round(latencies[len(latencies) // 2] * 1e6, 1) if latencies else None,
+        'p99': round(latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] * 1e6, 1) if latencies else None,
+    }
+    return report, labelled
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the guardrail pre-filter against LLM verdicts")
+    parser.add_argument('--market', required=True)
+    parser.add_argument('--input', required=True, help="JSONL file with 'query' and optional recorded verdicts")
+    parser.add_argument('--output', help="Write the input records with LLM verdicts filled in")
+    args = parser.parse_args()
+
+    config = load_config(args.market)
+    with open(args.input, 'r') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+
+    prefilter = GuardrailPrefilter.from_config(config, args.market)
+    report, labelled = evaluate(prefilter, records, config)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            for record in labelled:
+                f.write(json.dumps(record) + "\n")
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
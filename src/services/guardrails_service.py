@@ -1,8 +1,12 @@
-from src.llm.prompt_templates import get_prompt_for_analytical_intent, get_prompt_verify_sql_injection, get_prompt_verify_invalid_domain_query
+import asyncio
+import json
+import re
+
+from src.llm.prompt_templates import get_prompt_for_analytical_intent, get_prompt_verify_sql_injection, get_prompt_verify_invalid_domain_query, get_prompt_for_combined_guardrails
 from src.llm.llm_connector import *
 from src.utils.logger import logger
 
-def validate_query_intent_for_analytical(user_query, config):
+def validate_query_intent_for_analytical(user_query, config, client=None):
     logger.info("Starting analytical intent validation")
     logger.debug(f"User query length: {len(user_query)} characters")
     
@@ -12,8 +16,8 @@ def validate_query_intent_for_analytical(user_query, config):
         messages = [{"role": "user", "content": f"{prompt}"}]
         
         logger.debug("Sending request to LLM for intent validation")
-        res = LLMConnector(messages, config)
-        response = res
+        res = LLMConnector(messages, config, client=client)
+        response = res.get_llm_response()
         
         logger.info("Analytical intent validation completed successfully")
         logger.debug(f"Validation response: {response}")
@@ -23,7 +27,7 @@ def validate_query_intent_for_analytical(user_query, config):
         logger.error(f"Analytical intent validation failed: {str(e)}", exc_info=True)
         raise
 
-def validate_query_for_sql_injection(sql_query: str, config):
+def validate_query_for_sql_injection(sql_query: str, config, client=None):
     logger.info("Starting SQL injection validation")
     logger.debug(f"SQL query length: {len(sql_query)} characters")
     
@@ -33,7 +37,7 @@ def validate_query_for_sql_injection(sql_query: str, config):
         messages = [{"role": "user", "content": f"{prompt}"}]
         
         logger.debug("Sending request to LLM for SQL injection check")
-        res = LLMConnector(messages, config)
+        res = LLMConnector(messages, config, client=client)
         response = res.get_llm_response()
         
         logger.info("SQL injection validation completed successfully")
@@ -44,7 +48,7 @@ def validate_query_for_sql_injection(sql_query: str, config):
         logger.error(f"SQL injection validation failed: {str(e)}", exc_info=True)
         raise
 
-def validate_query_for_invalid_domain_query(content: str, config):
+def validate_query_for_invalid_domain_query(content: str, config, client=None):
     logger.info("Starting invalid domain query validation")
     logger.debug(f"Content length: {len(content)} characters")
     
@@ -54,8 +58,8 @@ def validate_query_for_invalid_domain_query(content: str, config):
         messages = [{"role": "user", "content": f"{prompt}"}]
         
         logger.debug("Sending request to LLM for invalid domain query check")
-        res = LLMConnector(messages, config)
-        response = res
+        res = LLMConnector(messages, config, client=client)
+        response = res.get_llm_response()
         
         logger.info("Invalid domain query validation completed successfully")
         logger.debug(f"Invalid domain query check response: {response}")
@@ -63,4 +67,143 @@ def validate_query_for_invalid_domain_query(content: str, config):
         
     except Exception as e:
         logger.error(f"Invalid domain query validation failed: {str(e)}", exc_info=True)
-        raise
\ No newline at end of file
+        raise
+
+async def avalidate_query_intent_for_analytical(user_query, config):
+    logger.info("Starting async analytical intent validation")
+    messages = [{"role": "user", "content": f"{get_prompt_for_analytical_intent(user_query)}"}]
+    response = await LLMConnector(messages, config).aget_llm_response()
+    logger.debug(f"Validation response: {response}")
+    return response
+
+async def avalidate_query_for_sql_injection(sql_query: str, config):
+    logger.info("Starting async SQL injection validation")
+    messages = [{"role": "user", "content": f"{get_prompt_verify_sql_injection(sql_query=sql_query)}"}]
+    response = await LLMConnector(messages, config).aget_llm_response()
+    logger.debug(f"SQL injection check response: {response}")
+    return response
+
+async def avalidate_query_for_invalid_domain_query(content: str, config):
+    logger.info("Starting async invalid domain query validation")
+    messages = [{"role": "user", "content": f"{get_prompt_verify_invalid_domain_query(content)}"}]
+    response = await LLMConnector(messages, config).aget_llm_response()
+    logger.debug(f"Invalid domain query check response: {response}")
+    return response
+
+# 'separate': one LLM call per check; 'combined': one classifier call for intent and domain;
+# 'merged': the verdict is produced by the SQL generation call itself
+GUARDRAIL_MODES = ('separate', 'combined', 'merged')
+PRE_GENERATION_CHECKS = ('analytical', 'domain')
+
+def guardrail_mode(config):
+    mode = config.get('GUARDRAILS', 'mode', fallback='separate').strip().lower()
+    if mode not in GUARDRAIL_MODES:
+        logger.warning(f"Unknown guardrail mode '{mode}', falling back to 'separate'")
+        return 'separate'
+    return mode
+
+def parse_guardrail_verdict(text):
+    """
+    Parse a JSON verdict such as {"analytical": true, "domain": false} out of an LLM response.
+
+    Returns:
+        dict: 'True'/'False' per check that could be read; unreadable checks are left out
+    """
+    verdict = {}
+    match = re.search(r'\{[^{}]*\}', text or '')
+    if not match:
+        return verdict
+    try:
+        data = json.loads(match.group(0))
+    except ValueError:
+        logger.warning(f"Unparseable guardrail verdict: {match.group(0)[:200]}")
+        return verdict
+    for check in PRE_GENERATION_CHECKS:
+        value = data.get(check)
+        if isinstance(value, str):
+            value = {'true': True, 'false': False}.get(value.strip().lower())
+        if isinstance(value, bool):
+            verdict[check] = 'True' if value else 'False'
+    return verdict
+
+async def avalidate_query_combined(user_query, config):
+    """Single classifier call covering the analytical-intent and domain checks."""
+    logger.info("Starting combined guardrail validation")
+    messages = [{"role": "user", "content": f"{get_prompt_for_combined_guardrails(user_query)}"}]
+    response = await LLMConnector(messages, config).aget_llm_response()
+    logger.debug(f"Combined guardrail response: {response}")
+    return parse_guardrail_verdict(response)
+
+async def resolve_pre_generation_verdict(verdict, user_query, config):
+    """
+    Fill in any check missing from a combined/merged verdict by running its individual
+    validator, then return the name of the first failed check or None.
+    """
+    fallbacks = {
+        'analytical': avalidate_query_intent_for_analytical,
+        'domain': avalidate_query_for_invalid_domain_query,
+    }
+    missing = [check for check in PRE_GENERATION_CHECKS if check not in verdict]
+    if missing:
+        logger.info(f"Guardrail verdict incomplete, running fallback checks: {missing}")
+        results = await asyncio.gather(*(fallbacks[check](user_query, config) for check in missing))
+        verdict = dict(verdict, **dict(zip(missing, results)))
+    return next((check for check in PRE_GENERATION_CHECKS if verdict[check] == 'False'), None)
+
+async def run_pre_generation_checks(user_query, config, context_fn=None, mode='separate', known_verdict=None):
+    """
+    Run the analytical-intent and domain checks concurrently, optionally alongside
+    context retrieval, and stop waiting as soon as one check rejects the query.
+
+    In 'combined' mode a single classifier call replaces the two checks; any check it
+    does not answer falls back to its individual validator. 'merged' mode is handled
+    by the SQL generation call and should not be passed here.
+
+    Args:
+        user_query (str): Natural-language question
+        config: Market configuration
+        context_fn (callable, optional): Blocking callable returning the RAG context; runs in a worker thread
+        mode (str): 'separate' or 'combined'
+        known_verdict (dict, optional): Checks already answered (e.g. by the local pre-filter); not sent to the LLM
+
+    Returns:
+        tuple: (name of the failed check or None, context returned by context_fn or None)
+    """
+    known_verdict = known_verdict or {}
+    validators = {
+        'analytical': avalidate_query_intent_for_analytical,
+        'domain': avalidate_query_for_invalid_domain_query,
+    }
+    unanswered = [check for check in PRE_GENERATION_CHECKS if check not in known_verdict]
+    if not unanswered:
+        checks = {}
+    elif mode == 'combined':
+        checks = {
+            asyncio.create_task(avalidate_query_combined(user_query, config)): 'combined',
+        }
+    else:
+        checks = {
+            asyncio.create_task(validators[check](user_query, config)): check for check in unanswered
+        }
+    context_task = asyncio.create_task(asyncio.to_thread(context_fn)) if context_fn else None
+    pending = set(checks) | ({context_task} if context_task else set())
+
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is context_task:
+                    continue
+                if checks[task] == 'combined':
+                    failed_check = await resolve_pre_generation_verdict(dict(known_verdict, **task.result()),
+                                                                        user_query, config)
+                else:
+                    failed_check = checks[task] if task.result() == 'False' else None
+                if failed_check:
+                    logger.info(f"Pre-generation check '{failed_check}' rejected the query, cancelling remaining work")
+                    return failed_check, None
+    finally:
+        for task in pending:
+            task.cancel()
+
+    return None, context_task.result() if context_task else None
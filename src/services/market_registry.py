@@ -0,0 +1,302 @@
+"""
+Process-wide registry of per-market resources.
+
+Parsing config.ini, building embedding/chat clients, BigQuery clients and the
+Cloud SQL connector is expensive, so each market's resources are created lazily
+on first use and then shared by every request until the market is reloaded.
+"""
+import threading
+
+from src.utils.config_reader import load_config
+from src.utils.logger import logger
+
+
+class MarketResources:
+    """Lazily-initialised, thread-safe holder for one market's shared clients."""
+
+    def __init__(self, market):
+        self.market = market
+        self._lock = threading.RLock()
+        self._config = None
+        self._embedding_client = None
+        self._bigquery_client = None
+        self._db_util = None
+        self._pg_pool = None
+        self._embedding_cache = None
+        self._semantic_cache = None
+        self._guardrail_prefilter = None
+        self._few_shot_selector = None
+        self._result_cache = None
+        self._estimate_cache = None
+        self._table_versions = None
+        logger.info(f"Market resources registered for market: {market}")
+
+    def _get_or_create(self, attr, factory):
+        value = getattr(self, attr)
+        if value is not None:
+            return value
+        with self._lock:
+            value = getattr(self, attr)
+            if value is None:
+                logger.debug(f"Initializing {attr.lstrip('_')} for market: {self.market}")
+                value = factory()
+                setattr(self, attr, value)
+            return value
+
+    @property
+    def config(self):
+        return self._get_or_create('_config', lambda: load_config(self.market))
+
+    @property
+    def embedding_client(self):
+        def factory():
+            from src.llm.embedding import Embedding
+            return Embedding(self.config).get_embeddings()
+        return self._get_or_create('_embedding_client', factory)
+
+    @property
+    def chat_client(self):
+        # Markets on the same endpoint share one process-wide keep-alive pool, which outlives close()
+        from src.llm.http_client import get_shared_chat_client
+        return get_shared_chat_client(self.config)
+
+    @property
+    def db_util(self):
+        def factory():
+            from src.database.db_config import GoogleCloudSqlUtility
+            return GoogleCloudSqlUtility(self.market, config=self.config, shared_connector=True)
+        return self._get_or_create('_db_util', factory)
+
+    @property
+    def pg_pool(self):
+        """Bounded psycopg2 pool for the market's pgvector database."""
+        def factory():
+            from src.database.db_connector import get_postgres_connection_params
+            from src.database.pg_pool import PgConnectionPool
+            host, port, database, user, password = get_postgres_connection_params(self.market)
+            section = 'POSTGRES'
+            return PgConnectionPool(
+                host, port, database, user, password,
+                min_size=self.config.getint(section, 'pool_min_size', fallback=1),
+                max_size=self.config.getint(section, 'pool_max_size', fallback=10),
+                max_lifetime=self.config.getfloat(section, 'pool_max_lifetime_seconds', fallback=1800),
+                health_check_interval=self.config.getfloat(section, 'pool_health_check_interval_seconds', fallback=30),
+                acquire_timeout=self.config.getfloat(section, 'pool_acquire_timeout_seconds', fallback=10),
+                name=f"pgvector-{self.market}"
+            )
+        return self._get_or_create('_pg_pool', factory)
+
+    @property
+    def embedding_cache(self):
+        """Query-embedding cache, or None when [EMBEDDING_CACHE] enabled is false."""
+        section = 'EMBEDDING_CACHE'
+        if not self.config.getboolean(section, 'enabled', fallback=True):
+            return None
+
+        def factory():
+            from src.llm.embedding_cache import EmbeddingCache, DiskEmbeddingStore, PostgresEmbeddingStore
+            persistent = self.config.get(section, 'persistent', fallback='none').strip().lower()
+            persistent_max = self.config.getint(section, 'persistent_max_entries', fallback=100000)
+            store = None
+            try:
+                if persistent == 'disk':
+                    path = self.config.get(section, 'disk_path', fallback=f"./cache/embeddings_{self.market}.sqlite3")
+                    store = DiskEmbeddingStore(path, max_entries=persistent_max)
+                elif persistent == 'postgres':
+                    store = PostgresEmbeddingStore(self.pg_pool, max_entries=persistent_max)
+            except Exception as e:
+                logger.warning(f"Persistent embedding cache unavailable for market {self.market}, using memory only: {e}")
+            return EmbeddingCache(
+                model=self.config.get('LLM', 'embedding_model', fallback=''),
+                max_entries=self.config.getint(section, 'max_entries', fallback=10000),
+                ttl_seconds=self.config.getfloat(section, 'ttl_seconds', fallback=86400),
+                persistent_store=store
+            )
+        return self._get_or_create('_embedding_cache', factory)
+
+    @property
+    def semantic_cache(self):
+        """Question -> SQL cache for /generate_query, or None when [SEMANTIC_CACHE] enabled is false."""
+        section = 'SEMANTIC_CACHE'
+        if not self.config.getboolean(section, 'enabled', fallback=True):
+            return None
+
+        def factory():
+            from src.services.semantic_cache import SemanticQueryCache, market_context_fingerprint
+            return SemanticQueryCache(
+                self.market,
+                fingerprint_fn=lambda: market_context_fingerprint(self),
+                similarity_threshold=self.config.getfloat(section, 'similarity_threshold', fallback=0.97),
+                max_entries=self.config.getint(section, 'max_entries', fallback=1000),
+                ttl_seconds=self.config.getfloat(section, 'ttl_seconds', fallback=86400),
+                fingerprint_check_interval=self.config.getfloat(section, 'fingerprint_check_interval_seconds',
+                                                                fallback=60)
+            )
+        return self._get_or_create('_semantic_cache', factory)
+
+    @property
+    def guardrail_prefilter(self):
+        """Local intent/domain pre-classifier, or None when [GUARDRAILS] prefilter_enabled is false."""
+        if not self.config.getboolean('GUARDRAILS', 'prefilter_enabled', fallback=False):
+            return None
+
+        def factory():
+            from src.services.guardrail_prefilter import GuardrailPrefilter
+            return GuardrailPrefilter.from_config(self.config, self.market)
+        return self._get_or_create('_guardrail_prefilter', factory)
+
+    @property
+    def few_shot_selector(self):
+        """Embedding-based few-shot ranker, or None unless [PROMPT] few_shot_selection is 'embedding'."""
+        section = 'PROMPT'
+        if self.config.get(section, 'few_shot_selection', fallback='embedding').strip().lower() != 'embedding':
+            return None
+
+        def factory():
+            from src.services.prompt_builder import FewShotSelector
+
+            def embed_query(text):
+                # Same normalisation as RAGPipeline.get_embedding, so the question embedding is a cache hit
+                text = text.replace("\n", " ")
+                if self.embedding_cache is not None:
+                    return self.embedding_cache.get_or_compute(text, self.embedding_client.embed_query)
+                return self.embedding_client.embed_query(text)
+
+            return FewShotSelector(
+                self.config.get('Database', 'messages_path'),
+                embed_documents=lambda texts: self.embedding_client.embed_documents(texts),
+                embed_query=embed_query,
+                min_similarity=self.config.getfloat(section, 'few_shot_min_similarity', fallback=0.0)
+            )
+        return self._get_or_create('_few_shot_selector', factory)
+
+    @property
+    def result_cache(self):
+        """Query result cache for /execute_query, or None when [RESULT_CACHE] enabled is false."""
+        section = 'RESULT_CACHE'
+        if not self.config.getboolean(section, 'enabled', fallback=True):
+            return None
+
+        def factory():
+            from src.services.result_cache import ResultCache
+            return ResultCache(
+                self.market,
+                table_version_fn=self.table_versions.version,
+                max_bytes=self.config.getint(section, 'max_bytes', fallback=256 * 1024 * 1024),
+                max_entry_bytes=self.config.getint(section, 'max_entry_bytes', fallback=32 * 1024 * 1024),
+                ttl_seconds=self.config.getfloat(section, 'ttl_seconds', fallback=300),
+                disk_path=self.config.get(section, 'disk_path', fallback='') or None,
+                disk_max_bytes=self.config.getint(section, 'disk_max_bytes', fallback=2 * 1024 * 1024 * 1024),
+                bigquery_cache=self.config.get(section, 'bigquery_cache', fallback='deterministic').strip().lower(),
+                cache_nondeterministic=self.config.getboolean(section, 'cache_nondeterministic', fallback=False)
+            )
+        return self._get_or_create('_result_cache', factory)
+
+    @property
+    def estimate_cache(self):
+        """Dry-run result cache for Estimate, or None when [ESTIMATE_CACHE] enabled is false."""
+        section = 'ESTIMATE_CACHE'
+        if not self.config.getboolean(section, 'enabled', fallback=True):
+            return None
+
+        def factory():
+            from src.services.estimate_cache import EstimateCache
+            return EstimateCache(
+                self.market,
+                table_version_fn=self.table_versions.version,
+                max_entries=self.config.getint(section, 'max_entries', fallback=2000),
+                ttl_seconds=self.config.getfloat(section, 'ttl_seconds', fallback=600)
+            )
+        return self._get_or_create('_estimate_cache', factory)
+
+    @property
+    def table_versions(self):
+        """Memoised BigQuery table modified times, shared by the result and estimate caches."""
+        def factory():
+            from src.services.result_cache import TableVersionTracker, bigquery_table_version
+            return TableVersionTracker(
+                lambda table_id: bigquery_table_version(self.bigquery_client[0], table_id),
+                check_interval=self.config.getfloat('QUERY_EXECUTION', 'table_metadata_check_interval_seconds',
+                                                    fallback=30)
+            )
+        return self._get_or_create('_table_versions', factory)
+
+    def invalidate_context_caches(self, reason="context updated"):
+        """Drop cached answers that depend on the market's table/column context."""
+        if self._semantic_cache is not None:
+            self._semantic_cache.invalidate(reason)
+
+    @property
+    def bigquery_client(self):
+        """Tuple of (bigquery.Client, project_id, dataset_id, location)."""
+        def factory():
+            from src.services.bq_client import create_bigquery_client
+            return create_bigquery_client(self.db_util)
+        return self._get_or_create('_bigquery_client', factory)
+
+    def close(self):
+        with self._lock:
+            if self._bigquery_client is not None:
+                try:
+                    self._bigquery_client[0].close()
+                except Exception as e:
+                    logger.warning(f"Failed to close BigQuery client for market {self.market}: {e}")
+            if self._db_util is not None:
+                self._db_util.close()
+            if self._embedding_cache is not None:
+                self._embedding_cache.close()
+            if self._pg_pool is not None:
+                self._pg_pool.close()
+            self._config = None
+            self._embedding_client = None
+            self._bigquery_client = None
+            self._db_util = None
+            self._pg_pool = None
+            self._embedding_cache = None
+            self._semantic_cache = None
+            self._guardrail_prefilter = None
+            self._few_shot_selector = None
+            self._result_cache = None
+            self._estimate_cache = None
+            self._table_versions = None
+        logger.info(f"Market resources closed for market: {self.market}")
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def get_market_resources(market) -> MarketResources:
+    resources = _registry.get(market)
+    if resources is not None:
+        return resources
+    with _registry_lock:
+        resources = _registry.get(market)
+        if resources is None:
+            resources = MarketResources(market)
+            # Fail fast on unknown markets instead of registering them
+            resources.config
+            _registry[market] = resources
+        return resources
+
+
+def reload_market_resources(market=None):
+    """
+    Drop cached resources so the next request rebuilds them from config.
+
+    Args:
+        market (str, optional): Market to reload. Reloads every market when omitted.
+
+    Returns:
+        list: Markets whose resources were released
+    """
+    with _registry_lock:
+        markets = [market] if market else list(_registry.keys())
+        released = []
+        for name in markets:
+            resources = _registry.pop(name, None)
+            if resources is not None:
+                resources.close()
+                released.append(name)
+    logger.info(f"Market resources reloaded: {released}")
+    return released
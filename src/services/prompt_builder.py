@@ -0,0 +1,240 @@
+"""
+Prompt assembly helpers for SQL generation.
+
+The few-shot conversation in messages.json is parsed once and re-read only when
+the file's mtime or size changes. Retrieved table/column context and few-shot
+examples are trimmed to the [PROMPT] token budgets, keeping the highest-scoring
+items, so prompt size (and LLM latency) stays bounded as the metadata grows.
+Few-shot examples can be ranked by embedding similarity (FewShotSelector) or,
+without embeddings, by word overlap with the question. Tokens are counted with
+tiktoken when available, otherwise estimated as len/4.
+"""
+import json
+import os
+import re
+import threading
+from functools import lru_cache
+
+import numpy as np
+
+from src.utils.logger import logger
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken is optional
+    tiktoken = None
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+_few_shot_cache = {}
+_few_shot_lock = threading.Lock()
+
+
+@lru_cache(maxsize=16)
+def _encoding(model):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding('cl100k_base')
+    except Exception as e:
+        logger.warning(f"tiktoken encoding unavailable for model {model}, estimating tokens as len/4: {e}")
+        return None
+
+
+def count_tokens(text, model='gpt-4'):
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages, model='gpt-4'):
+    # ~4 tokens of chat framing per message
+    return sum(count_tokens(message.get('content', ''), model) + 4 for message in messages)
+
+
+def load_few_shot_conversation(path):
+    """
+    Parsed messages.json, cached per path and reloaded when the file's mtime or size changes.
+
+    Returns:
+        list: Chat messages (a new list; the message dicts are shared and must not be mutated)
+    """
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _few_shot_cache.get(path)
+    if cached is not None and cached[0] == signature:
+        return list(cached[1])
+    with _few_shot_lock:
+        cached = _few_shot_cache.get(path)
+        if cached is None or cached[0] != signature:
+            with open(path, 'r') as file:
+                messages = json.load(file)
+            cached = (signature, messages)
+            _few_shot_cache[path] = cached
+            logger.info(f"Few-shot conversation loaded from {path}: {len(messages)} messages")
+    return list(cached[1])
+
+
+def few_shot_examples(messages):
+    """Group the conversation into examples: each user turn with the assistant turns that follow it."""
+    examples = []
+    for message in messages:
+        if message.get('role') == 'user' or not examples:
+            examples.append([message])
+        else:
+            examples[-1].append(message)
+    return examples
+
+
+def _lexical_similarity(query_words, text):
+    words = set(_WORD_RE.findall(text.lower()))
+    if not words or not query_words:
+        return 0.0
+    return len(query_words & words) / len(query_words | words)
+
+
+def select_few_shot_examples(examples, query, budget, model='gpt-4', ranked=None, top_n=0):
+    """
+    Keep the examples most similar to the query that fit in `budget` tokens.
+
+    Args:
+        examples (list): Output of few_shot_examples()
+        query (str): User question
+        budget (int): Token budget for the examples; 0 means no token limit
+        model (str): Model whose tokenizer is used for counting
+        ranked (list, optional): Example indices, most similar first (e.g. from FewShotSelector);
+            ranked by word overlap with the query when omitted
+        top_n (int): Keep at most this many examples; 0 means no limit
+
+    Selected examples keep their original order so the prompt prefix stays stable.
+    """
+    if budget <= 0 and top_n <= 0:
+        return [message for example in examples for message in example]
+    if ranked is None:
+        query_words = set(_WORD_RE.findall(query.lower()))
+        ranked = sorted(range(len(examples)),
+                        key=lambda i: _lexical_similarity(query_words, examples[i][0].get('content', '')),
+                        reverse=True)
+    selected, used = set(), 0
+    for index in ranked:
+        if top_n and len(selected) >= top_n:
+            break
+        # Rankings computed against an older messages.json may point past the current examples
+        if index >= len(examples):
+            continue
+        if budget <= 0:
+            selected.add(index)
+            continue
+        cost = count_message_tokens(examples[index], model)
+        if used + cost <= budget:
+            selected.add(index)
+            used += cost
+    logger.debug(f"Few-shot examples kept: {len(selected)}/{len(examples)} ({used} tokens, budget {budget}, "
+                 f"top_n {top_n})")
+    return [message for index in sorted(selected) for message in examples[index]]
+
+
+class FewShotSelector:
+    """
+    Ranks few-shot examples by embedding similarity to the user question.
+
+    Each example's user turn is embedded once into a normalised in-memory matrix;
+    the matrix is rebuilt when messages.json changes. Ranking is a single
+    matrix-vector product.
+    """
+
+    def __init__(self, messages_path, embed_documents, embed_query, min_similarity=0.0):
+        """
+        Args:
+            messages_path (str): Few-shot conversation file
+            embed_documents (callable): Batch embedding function (list of str -> list of vectors)
+            embed_query (callable): Question embedding function (str -> vector), ideally cached
+            min_similarity (float): Examples below this cosine similarity are never selected
+        """
+        self.messages_path = messages_path
+        self.embed_documents = embed_documents
+        self.embed_query = embed_query
+        self.min_similarity = min_similarity
+        self._lock = threading.Lock()
+        self._signature = None
+        self._matrix = None
+
+    def _ensure_matrix(self):
+        stat = os.stat(self.messages_path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if self._signature == signature:
+            return self._matrix
+        with self._lock:
+            if self._signature != signature:
+                examples = few_shot_examples(load_few_shot_conversation(self.messages_path))
+                questions = [example[0].get('content', '') for example in examples]
+                matrix = np.asarray(self.embed_documents(questions), dtype=np.float32) if questions \
+                    else np.zeros((0, 0), dtype=np.float32)
+                if len(matrix):
+                    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                    matrix = matrix / np.where(norms == 0, 1, norms)
+                self._matrix = matrix
+                self._signature = signature
+                logger.info(f"Few-shot selector embedded {len(questions)} examples from {self.messages_path}")
+            return self._matrix
+
+    def rank(self, query, query_embedding=None):
+        """
+        Returns:
+            list: Example indices (as in few_shot_examples()) most similar first, above min_similarity
+        """
+        matrix = self._ensure_matrix()
+        if not len(matrix):
+            return []
+        vector = np.asarray(query_embedding if query_embedding is not None else self.embed_query(query),
+                            dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        similarities = matrix @ (vector / norm if norm else vector)
+        order = np.argsort(-similarities)
+        return [int(index) for index in order if similarities[index] >= self.min_similarity]
+
+
+def trim_context(context_data, budget, render_fn, model='gpt-4'):
+    """
+    Keep the highest-scoring retrieved contexts whose rendered text fits in `budget` tokens.
+
+    Args:
+        context_data (dict): RAGPipeline.query() result
+        budget (int): Token budget for table and column context together; 0 disables trimming
+        render_fn (callable): Renders a single structured_context item as it will appear in the prompt
+        model (str): Model whose tokenizer is used for counting
+
+    Returns:
+        dict: context_data with only the kept items
+    """
+    structured = context_data.get('structured_context', [])
+    text = context_data.get('text_context', [])
+    if budget <= 0 or not (structured or text):
+        return context_data
+
+    def score(item):
+        return item.get('similarity_score') or 0
+
+    if structured:
+        items, cost_fn = structured, lambda item: count_tokens(render_fn(item), model)
+    else:
+        items, cost_fn = text, lambda item: count_tokens(item.get('context', ''), model)
+
+    kept, used = [], 0
+    for item in sorted(items, key=score, reverse=True):
+        cost = cost_fn(item)
+        if used + cost <= budget:
+            kept.append(item)
+            used += cost
+    logger.debug(f"Context items kept: {len(kept)}/{len(items)} ({used} tokens, budget {budget})")
+
+    if not structured:
+        return dict(context_data, text_context=kept)
+    # text_context mirrors structured_context; drop entries scoring below everything kept
+    floor = min((score(item) for item in kept), default=float('inf'))
+    return dict(context_data, structured_context=kept, text_context=[item for item in text if score(item) >= floor])
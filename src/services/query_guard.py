@@ -0,0 +1,71 @@
+"""
+Checks a query has to pass before it is executed, shared by /execute_query and the job API.
+
+The dry run enforces the cost and estimated-time limits; the static SQL analysis rejects
+anything that modifies state and anything it classifies UNSAFE (multiple statements,
+statements hidden in comments, ...), whether or not it modifies anything.
+"""
+from src.services.cost_estimator import Estimate
+from src.utils.logger import logger
+from src.utils.sql_analyzer import analyze_sql, UNSAFE
+
+# Most a single query may cost, in USD
+MAX_QUERY_COST_USD = 10.0
+
+
+def check_query_before_execution(sql_query: str, market: str, username: str, max_seconds: float = 30):
+    """
+    Cost/time limits and modification guard for a query about to be executed.
+
+    Args:
+        sql_query (str): Query as it will be executed
+        market (str): Market it runs in
+        username (str): Requesting user, for the audit log
+        max_seconds (float): Longest estimated run time allowed (at ~1GB/s processed)
+
+    Returns:
+        tuple: (rejection message or None, dry-run estimate)
+
+    Raises:
+        Exception: If the dry run fails
+    """
+    logger.debug(f"Estimating query cost and execution time for user: {username}")
+    cost_result = Estimate(sql_query, market).estimate_query_cost()
+
+    if cost_result.get("status") == "error":
+        logger.error(f"EXECUTE_QUERY_ESTIMATION_ERROR - User: {username}, Error: {cost_result.get('error_message')}")
+        raise Exception(cost_result["error_message"])
+
+    cost_usd = cost_result.get('estimated_cost_usd', 0)
+    bytes_processed = cost_result.get('bytes_processed', 0)
+
+    # Heuristic timeout calculation (1GB/s processing speed)
+    estimated_seconds = bytes_processed / (1024 ** 3) if bytes_processed > 0 else 0
+
+    logger.info(f"EXECUTE_QUERY_ESTIMATES - User: {username}, Cost: ${cost_usd:.6f}, Estimated time: {estimated_seconds:.1f}s")
+
+    if cost_usd > MAX_QUERY_COST_USD:
+        logger.warning(f"EXECUTE_QUERY_BLOCKED - Cost limit exceeded - User: {username}, "
+                       f"Cost: ${cost_usd:.6f} > ${MAX_QUERY_COST_USD:.2f}")
+        return f"Query execution blocked: Cost ${cost_usd:.2f} exceeds limit of ${MAX_QUERY_COST_USD:.2f}", cost_result
+
+    if estimated_seconds > max_seconds:
+        logger.warning(f"EXECUTE_QUERY_BLOCKED - Time limit exceeded - User: {username}, "
+                       f"Estimated time: {estimated_seconds:.1f}s > {max_seconds}s")
+        return (f"Query execution blocked: Estimated execution time {estimated_seconds:.1f}s exceeds limit of {max_seconds}s",
+                cost_result)
+
+    analysis = analyze_sql(sql_query)
+    if analysis.modifies:
+        logger.error(f"SECURITY_VIOLATION - DML query detected for user: {username}, SQL: {sql_query}")
+        return "DML query detected in the Query. Query execution blocked by guardrails !!", cost_result
+
+    # Multiple statements, statements hidden in comments etc. are never executed, modifying or not
+    if analysis.verdict == UNSAFE:
+        logger.error(f"SECURITY_VIOLATION - Unsafe query ({', '.join(analysis.reasons)}) for user: {username}, SQL: {sql_query}")
+        return "SQL Injection detected in the Query. Query execution blocked by guardrails !!", cost_result
+
+    if sql_query == '':
+        logger.error(f"SECURITY_VIOLATION - Query is None for user: {username}")
+        return "No query was detected. Kindly input a valid search query to proceed.", cost_result
+    return None, cost_result
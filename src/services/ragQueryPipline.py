@@ -1,66 +1,128 @@
 import os
 from openai import OpenAI
-import psycopg2
 import re
 
-from src.database.db_connector import get_postgres_connection_params
-from src.utils.config_reader import load_config
-from src.llm.embedding import Embedding
+from src.services.market_registry import get_market_resources
+from src.utils.logger import logger
 
 # Class for the RAG pipeline
 # Creates a pipeline to retrieve relevant context from a PostgreSQL database
 class RAGPipeline:
     def __init__(self, market):
         self.market = market
-        self.host, self.port, self.database, self.user, self.password = get_postgres_connection_params(market)
         
-        self.config = load_config(self.market)
-        emb = Embedding(self.config)
-        self.client = emb.get_embeddings()
+        resources = get_market_resources(self.market)
+        self.config = resources.config
+        self.client = resources.embedding_client
+        self.embedding_cache = resources.embedding_cache
         
-        self.conn = psycopg2.connect(
-            host=self.host,
-            database=self.database,
-            user=self.user,
-            password=self.password,
-            port=self.port
-        )
-        
-        self.cur = self.conn.cursor()
+        # Connections are leased from the market's shared pool per retrieval
+        self.pool = resources.pg_pool
         self.TOP_K_DB_FETCH = 5
         self.RESPONSE_LIMIT = 10
         self.SHOW_SCORE = True
         self.SHOW_STRUCTURED_CONTEXT = True
+        # 'combined' fetches table and column contexts in one round trip, 'separate' issues one query per table
+        self.RETRIEVAL_MODE = self.config.get('RAG', 'retrieval_mode', fallback='combined').strip().lower()
+        self.PREPARED_RETRIEVAL = "rag_retrieve_similar"
+        # ANN recall/latency knobs; 0 keeps the server default
+        self.EF_SEARCH = self.config.getint('RAG', 'ef_search', fallback=0)
+        self.PROBES = self.config.getint('RAG', 'probes', fallback=0)
 
     # Generates an embedding for the given text using the configured embedding client
     def get_embedding(self, text):
         text = text.replace("\n", " ")
+        if self.embedding_cache is not None:
+            return self.embedding_cache.get_or_compute(text, self.client.embed_query)
         embedding = self.client.embed_query(text)
         return embedding
 
     # Retrieves similar contexts from the database based on the query text and returns a tuple of (column_contexts, table_contexts) where each is a list of (raw_text, similarity_score)
-    def retrieve_similar(self, query_text):
+    def retrieve_similar(self, query_text, ef_search=None, probes=None):
         query_embedding = self.get_embedding(query_text)
         
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            try:
+                search_params_sql = self._search_params_sql(ef_search, probes)
+                if self.RETRIEVAL_MODE == 'combined':
+                    column_results, table_results = self._retrieve_combined(conn, cur, query_embedding, search_params_sql)
+                else:
+                    if search_params_sql:
+                        cur.execute(search_params_sql)
+                    column_results, table_results = self._retrieve_separate(cur, query_embedding)
+            finally:
+                cur.close()
+        
+        return column_results, table_results
+
+    # Builds SET LOCAL statements for hnsw.ef_search / ivfflat.probes; they only last for the current
+    # transaction, which the pool rolls back when the connection is released
+    def _search_params_sql(self, ef_search=None, probes=None):
+        ef_search = self.EF_SEARCH if ef_search is None else ef_search
+        probes = self.PROBES if probes is None else probes
+        statements = []
+        if ef_search:
+            statements.append("SET LOCAL hnsw.ef_search = %d; " % int(ef_search))
+        if probes:
+            statements.append("SET LOCAL ivfflat.probes = %d; " % int(probes))
+        return "".join(statements)
+
+    # Formats the embedding as a pgvector literal; '%.9g' round-trips float4, which is what pgvector stores
+    @staticmethod
+    def _to_vector_literal(embedding):
+        return '[' + ','.join('%.9g' % value for value in embedding) + ']'
+
+    # Fetches both top-K sets in one round trip, binding the vector once to a per-connection prepared statement
+    def _retrieve_combined(self, conn, cur, query_embedding, search_params_sql=""):
+        state = self.pool.connection_state(conn)
+        if not state.get(self.PREPARED_RETRIEVAL):
+            cur.execute(f"""
+                PREPARE {self.PREPARED_RETRIEVAL}(vector, int) AS
+                (SELECT 'column' AS context_type, raw_text,
+                        ((2 - (embedding <-> $1)) / 2) AS similarity_score
+                 FROM column_context
+                 ORDER BY embedding <-> $1
+                 LIMIT $2)
+                UNION ALL
+                (SELECT 'table' AS context_type, raw_text,
+                        ((2 - (embedding <-> $1)) / 2) AS similarity_score
+                 FROM table_context
+                 ORDER BY embedding <-> $1
+                 LIMIT $2)
+            """)
+            state[self.PREPARED_RETRIEVAL] = True
+
+        # Any SET LOCAL statements ride along in the same round trip
+        cur.execute(f"{search_params_sql}EXECUTE {self.PREPARED_RETRIEVAL}(%s, %s)",
+                    (self._to_vector_literal(query_embedding), self.TOP_K_DB_FETCH))
+        column_results, table_results = [], []
+        for context_type, raw_text, score in cur.fetchall():
+            target = column_results if context_type == 'column' else table_results
+            target.append((raw_text, round(score * 100, 2)))
+        return column_results, table_results
+
+    # Original two-query retrieval, one round trip per context table
+    def _retrieve_separate(self, cur, query_embedding):
         # Query column contexts
-        self.cur.execute("""
+        cur.execute("""
             SELECT raw_text,
                    ((2 - (embedding <-> %s::vector)) / 2) AS similarity_score
             FROM column_context
             ORDER BY embedding <-> %s::vector
             LIMIT %s
         """, (query_embedding, query_embedding, self.TOP_K_DB_FETCH))
-        column_results = [(row[0], round(row[1] * 100, 2)) for row in self.cur.fetchall()]
+        column_results = [(row[0], round(row[1] * 100, 2)) for row in cur.fetchall()]
         
         # Query table contexts
-        self.cur.execute("""
+        cur.execute("""
             SELECT raw_text,
                    ((2 - (embedding <-> %s::vector)) / 2) AS similarity_score
             FROM table_context
             ORDER BY embedding <-> %s::vector
             LIMIT %s
         """, (query_embedding, query_embedding, self.TOP_K_DB_FETCH))
-        table_results = [(row[0], round(row[1] * 100, 2)) for row in self.cur.fetchall()]
+        table_results = [(row[0], round(row[1] * 100, 2)) for row in cur.fetchall()]
         
         return column_results, table_results
 
@@ -177,8 +239,8 @@ class RAGPipeline:
         return parsed_structured, parsed_text
     
     # Queries the RAG pipeline for a given question and returns top relevant contexts.
-    def query(self, question):
-        column_contexts, table_contexts = self.retrieve_similar(question)
+    def query(self, question, ef_search=None, probes=None):
+        column_contexts, table_contexts = self.retrieve_similar(question, ef_search=ef_search, probes=probes)
         
         # Log column contexts
         logger.debug("=== COLUMN CONTEXTS ===")
@@ -255,6 +317,6 @@ class RAGPipeline:
             "structured_context": structured_results[:self.RESPONSE_LIMIT] if self.SHOW_STRUCTURED_CONTEXT else []
         }
 
+    # Kept for callers written against the per-request connection; leased connections are already back in the pool
     def close(self):
-        self.cur.close()
-        self.conn.close()
\ No newline at end of file
+        pass
\ No newline at end of file
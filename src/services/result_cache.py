@@ -0,0 +1,313 @@
+"""
+Server-side result cache for /execute_query.
+
+Results are kept as Arrow tables keyed by (market, normalised SQL, last-modified
+time of every table the query references), so a write to any referenced table
+yields a new key and the stale entry just ages out. Modified times are memoised
+for [QUERY_EXECUTION] table_metadata_check_interval_seconds (30s by default), so
+a result may still be served for up to that long after a write. Queries whose
+dry run reports no referenced tables although they have a FROM clause
+(INFORMATION_SCHEMA views, ...) cannot be invalidated and are not cached.
+The memory tier is an LRU bounded by total Arrow bytes; the optional disk tier
+holds Parquet files under its own byte bound and survives restarts. Both honour
+the market's TTL. Queries calling non-deterministic functions (CURRENT_DATE(),
+RAND(), ...) and tables whose modified time does not track their data (streaming
+buffers, external tables) are not cached.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pyarrow.parquet as pq
+
+from src.database.query_executor import execute_arrow
+from src.services.market_registry import get_market_resources
+from src.utils.logger import logger
+from src.utils.sql_analyzer import normalize_sql, is_deterministic, has_from_clause
+
+# [RESULT_CACHE] bigquery_cache values: when a cache miss may be answered from BigQuery's own query cache
+BIGQUERY_CACHE_POLICIES = ('never', 'deterministic', 'always')
+
+
+def bigquery_table_version(client, table_id):
+    """
+    Last-modified time of a table in ms, or None when it cannot be trusted as a data version.
+
+    Rows still in the streaming buffer and external tables change without updating `modified`.
+    """
+    table = client.get_table(table_id)
+    if table.streaming_buffer is not None or table.table_type == 'EXTERNAL' or table.modified is None:
+        return None
+    return int(table.modified.timestamp() * 1000)
+
+
+class TableVersionTracker:
+    """Per-market memo of table data versions, re-read at most every `check_interval` seconds per table."""
+
+    def __init__(self, version_fn, check_interval=30):
+        self.version_fn = version_fn
+        self.check_interval = float(check_interval)
+        self._versions = {}
+
+    def version(self, table_id):
+        now = time.monotonic()
+        cached = self._versions.get(table_id)
+        if cached is not None and now - cached[1] < self.check_interval:
+            return cached[0]
+        version = self.version_fn(table_id)
+        self._versions[table_id] = (version, now)
+        return version
+
+    def clear(self):
+        self._versions.clear()
+
+
+class ResultCache:
+    def __init__(self, market, table_version_fn, max_bytes=256 * 1024 * 1024, max_entry_bytes=32 * 1024 * 1024,
+                 ttl_seconds=300, disk_path=None, disk_max_bytes=2 * 1024 * 1024 * 1024,
+                 bigquery_cache='deterministic', cache_nondeterministic=False):
+        """
+        Args:
+            market (str): Market whose results are cached
+            table_version_fn (callable): Table id -> data version (e.g. TableVersionTracker.version), None if unknown
+            max_bytes (int): Memory tier bound, in Arrow bytes
+            max_entry_bytes (int): Larger results are not cached
+            ttl_seconds (float): Maximum age of a cached result; 0 keeps results until evicted
+            disk_path (str, optional): Directory of the Parquet tier; None disables it
+            disk_max_bytes (int): Disk tier bound, in Parquet file bytes
+            bigquery_cache (str): One of BIGQUERY_CACHE_POLICIES
+            cache_nondeterministic (bool): Also cache queries calling CURRENT_DATE() etc. (stale up to the TTL)
+        """
+        if bigquery_cache not in BIGQUERY_CACHE_POLICIES:
+            raise ValueError(f"Invalid bigquery_cache policy '{bigquery_cache}'. Must be one of {BIGQUERY_CACHE_POLICIES}.")
+        self.market = market
+        self.table_version_fn = table_version_fn
+        self.max_bytes = int(max_bytes)
+        self.max_entry_bytes = int(max_entry_bytes)
+        self.ttl_seconds = float(ttl_seconds or 0)
+        self.disk_path = disk_path
+        self.disk_max_bytes = int(disk_max_bytes)
+        self.bigquery_cache = bigquery_cache
+        self.cache_nondeterministic = cache_nondeterministic
+        if disk_path:
+            os.makedirs(disk_path, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._stats = {'hits': 0, 'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'bypassed': 0, 'too_large': 0,
+                       'stores': 0, 'evictions': 0, 'expired': 0, 'disk_errors': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def key_for(self, sql_query, referenced_tables):
+        """
+        Cache key of a query, or None when its result must not be cached.
+
+        Args:
+            sql_query (str): Query as it will be executed
+            referenced_tables (list): Fully qualified ids of the tables it reads (from the dry run)
+        """
+        if not self.cache_nondeterministic and not is_deterministic(sql_query):
+            self._count('bypassed')
+            return None
+        if not referenced_tables and has_from_clause(sql_query):
+            # Reads something the dry run did not report, so no version would ever invalidate the entry
+            self._count('bypassed')
+            return None
+        versions = []
+        try:
+            for table_id in sorted(set(referenced_tables or [])):
+                version = self.table_version_fn(table_id)
+                if version is None:
+                    self._count('bypassed')
+                    return None
+                versions.append(f"{table_id}@{version}")
+        except Exception as e:
+            logger.warning(f"Result cache could not read table metadata for market {self.market}: {e}")
+            self._count('bypassed')
+            return None
+        material = "\x00".join([self.market, normalize_sql(sql_query)] + versions)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def use_bigquery_cache(self, sql_query):
+        """Whether BigQuery may answer a miss from its own 24h query cache (it invalidates on table changes itself)."""
+        if self.bigquery_cache == 'always':
+            return True
+        return self.bigquery_cache == 'deterministic' and is_deterministic(sql_query)
+
+    def _disk_file(self, key):
+        return os.path.join(self.disk_path, f"{key}.parquet")
+
+    def _get_memory(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            table, expires_at = entry
+            if expires_at and time.monotonic() > expires_at:
+                del self._entries[key]
+                self._bytes -= table.nbytes
+                self._stats['expired'] += 1
+                return None
+            self._entries.move_to_end(key)
+            return table
+
+    def _put_memory(self, key, table, expires_at):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[0].nbytes
+            self._entries[key] = (table, expires_at)
+            self._bytes += table.nbytes
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self._stats['evictions'] += 1
+
+    def _get_disk(self, key):
+        path = self._disk_file(key)
+        try:
+            modified = os.path.getmtime(path)
+        except OSError:
+            return None, None
+        if self.ttl_seconds and time.time() - modified > self.ttl_seconds:
+            self._remove_file(path)
+            self._count('expired')
+            return None, None
+        try:
+            table = pq.read_table(path)
+        except Exception as e:
+            self._count('disk_errors')
+            logger.warning(f"Result cache file {path} unreadable, dropping it: {e}")
+            self._remove_file(path)
+            return None, None
+        # Access time drives the disk tier's LRU eviction
+        os.utime(path, (time.time(), modified))
+        return table, modified
+
+    def _put_disk(self, key, table):
+        path = self._disk_file(key)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            pq.write_table(table, temp_path, compression='snappy')
+            os.replace(temp_path, path)
+            self._prune_disk()
+        except Exception as e:
+            self._count('disk_errors')
+            logger.warning(f"Result cache write to {path} failed: {e}")
+            self._remove_file(temp_path)
+
+    def _prune_disk(self):
+        with self._disk_lock:
+            files = []
+            for entry in os.scandir(self.disk_path):
+                if entry.name.endswith('.parquet'):
+                    stat = entry.stat()
+                    files.append((stat.st_atime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.disk_max_bytes:
+                    break
+                self._remove_file(path)
+                total -= size
+                self._count('evictions')
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def get(self, key):
+        """
+        Returns:
+            tuple: (pyarrow.Table or None, tier: 'memory', 'disk' or None)
+        """
+        table = self._get_memory(key)
+        if table is not None:
+            self._count('hits')
+            self._count('memory_hits')
+            return table, 'memory'
+        if self.disk_path:
+            table, written_at = self._get_disk(key)
+            if table is not None:
+                expires_at = time.monotonic() + self.ttl_seconds - (time.time() - written_at) if self.ttl_seconds else None
+                self._put_memory(key, table, expires_at)
+                self._count('hits')
+                self._count('disk_hits')
+                return table, 'disk'
+        self._count('misses')
+        return None, None
+
+    def put(self, key, table):
+        if table.nbytes > self.max_entry_bytes:
+            self._count('too_large')
+            return
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        self._put_memory(key, table, expires_at)
+        if self.disk_path:
+            self._put_disk(key, table)
+        self._count('stores')
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.disk_path:
+            with self._disk_lock:
+                for entry in os.scandir(self.disk_path):
+                    if entry.name.endswith('.parquet'):
+                        self._remove_file(entry.path)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, size=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes,
+                         ttl_seconds=self.ttl_seconds, bigquery_cache=self.bigquery_cache)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['disk_tier'] = self.disk_path
+        return stats
+
+
+def execute_with_cache(sql_query: str, market: str, timeout: int, referenced_tables=None):
+    """
+    execute_arrow() behind the market's result cache.
+
+    Returns:
+        tuple: (pyarrow.Table, stats dict as from execute_arrow, plus 'result_cache': memory, disk, miss or bypass)
+    """
+    cache = get_market_resources(market).result_cache
+    if cache is None:
+        table, stats = execute_arrow(sql_query, market, timeout=timeout)
+        stats['result_cache'] = 'disabled'
+        return table, stats
+
+    started = time.perf_counter()
+    key = cache.key_for(sql_query, referenced_tables)
+    if key is not None:
+        table, tier = cache.get(key)
+        if table is not None:
+            elapsed = time.perf_counter() - started
+            logger.info(f"Result cache {tier} hit for market {market}: {table.num_rows} rows in {elapsed * 1000:.1f}ms")
+            return table, {
+                'rows': table.num_rows,
+                'arrow_bytes': table.nbytes,
+                'query_seconds': 0.0,
+                'fetch_seconds': round(elapsed, 4),
+                'rows_per_second': round(table.num_rows / elapsed, 1) if elapsed > 0 else None,
+                'result_cache': tier,
+            }
+
+    table, stats = execute_arrow(sql_query, market, timeout=timeout,
+                                 use_query_cache=cache.use_bigquery_cache(sql_query))
+    if key is not None:
+        cache.put(key, table)
+    stats['result_cache'] = 'miss' if key is not None else 'bypass'
+    return table, stats
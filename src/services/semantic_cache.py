@@ -0,0 +1,167 @@
+"""
+Semantic cache for end-to-end SQL generation.
+
+Stores (question embedding -> generated SQL + guardrail verdicts) per market and
+serves any new question whose cosine similarity to a cached one is above the
+configured threshold, skipping every downstream LLM call. Entries are dropped
+whenever the market's table/column context or few-shot messages change; the
+change check runs on a background thread so lookups never wait on Postgres.
+"""
+import os
+import threading
+import time
+
+import numpy as np
+
+from src.utils.logger import logger
+
+
+def market_context_fingerprint(resources):
+    """
+    Fingerprint of everything a cached SQL answer depends on for a market.
+
+    Combines the few-shot messages file's mtime/size with the row-change counters
+    Postgres keeps for table_context and column_context (pg_stat_user_tables), which
+    move on every insert, update or delete without scanning the tables.
+    """
+    parts = []
+    messages_path = resources.config.get('Database', 'messages_path', fallback='')
+    if messages_path and os.path.exists(messages_path):
+        stat = os.stat(messages_path)
+        parts.append(f"messages:{stat.st_mtime_ns}:{stat.st_size}")
+
+    with resources.pg_pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT relname, n_tup_ins, n_tup_upd, n_tup_del
+            FROM pg_stat_user_tables
+            WHERE relname IN ('table_context', 'column_context')
+            ORDER BY relname
+        """)
+        for table_name, inserted, updated, deleted in cur.fetchall():
+            parts.append(f"{table_name}:{inserted}:{updated}:{deleted}")
+        cur.close()
+    return "|".join(parts)
+
+
+class SemanticQueryCache:
+    def __init__(self, market, fingerprint_fn=None, similarity_threshold=0.97, max_entries=1000,
+                 ttl_seconds=86400, fingerprint_check_interval=60):
+        self.market = market
+        self.fingerprint_fn = fingerprint_fn
+        self.similarity_threshold = float(similarity_threshold)
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = float(ttl_seconds or 0)
+        self.fingerprint_check_interval = float(fingerprint_check_interval)
+
+        self._lock = threading.Lock()
+        self._entries = []
+        self._matrix = None
+        self._fingerprint = None
+        self._last_fingerprint_check = 0.0
+        self._fingerprint_refreshing = False
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'invalidations': 0, 'evictions': 0}
+
+    @staticmethod
+    def _normalise(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_fingerprint(self):
+        """Start a background fingerprint refresh when one is due; never blocks the caller."""
+        if self.fingerprint_fn is None:
+            return
+        now = time.monotonic()
+        if now - self._last_fingerprint_check < self.fingerprint_check_interval:
+            return
+        with self._lock:
+            if self._fingerprint_refreshing or now - self._last_fingerprint_check < self.fingerprint_check_interval:
+                return
+            self._fingerprint_refreshing = True
+            self._last_fingerprint_check = now
+        threading.Thread(target=self._refresh_fingerprint, name=f"semantic-cache-fingerprint-{self.market}",
+                         daemon=True).start()
+
+    def _refresh_fingerprint(self):
+        try:
+            fingerprint = self.fingerprint_fn()
+            if self._fingerprint is not None and fingerprint != self._fingerprint:
+                self.invalidate("market context changed")
+            self._fingerprint = fingerprint
+        except Exception as e:
+            logger.warning(f"Semantic cache fingerprint check failed for market {self.market}: {e}")
+        finally:
+            self._fingerprint_refreshing = False
+
+    def _drop_expired(self):
+        if not self.ttl_seconds:
+            return
+        cutoff = time.monotonic() - self.ttl_seconds
+        kept = [entry for entry in self._entries if entry['created_at'] >= cutoff]
+        if len(kept) != len(self._entries):
+            self._entries = kept
+            self._matrix = None
+
+    def lookup(self, embedding, llm_type):
+        """
+        Find the most similar cached question above the threshold.
+
+        Returns:
+            dict or None: Cached entry with 'sql_query', 'verdicts', 'question' and 'similarity'
+        """
+        self._check_fingerprint()
+        query_vector = self._normalise(embedding)
+        with self._lock:
+            self._drop_expired()
+            if not self._entries:
+                self._stats['misses'] += 1
+                return None
+            if self._matrix is None:
+                self._matrix = np.vstack([entry['embedding'] for entry in self._entries])
+            similarities = self._matrix @ query_vector
+            for index in np.argsort(similarities)[::-1]:
+                similarity = float(similarities[index])
+                if similarity < self.similarity_threshold:
+                    break
+                entry = self._entries[index]
+                if entry['llm_type'] == llm_type:
+                    self._stats['hits'] += 1
+                    return dict(entry, similarity=round(similarity, 4), embedding=None)
+            self._stats['misses'] += 1
+            return None
+
+    def store(self, question, embedding, llm_type, sql_query, verdicts):
+        self._check_fingerprint()
+        entry = {
+            'question': question,
+            'embedding': self._normalise(embedding),
+            'llm_type': llm_type,
+            'sql_query': sql_query,
+            'verdicts': verdicts,
+            'created_at': time.monotonic(),
+        }
+        with self._lock:
+            self._entries.append(entry)
+            if len(self._entries) > self.max_entries:
+                overflow = len(self._entries) - self.max_entries
+                self._entries = self._entries[overflow:]
+                self._stats['evictions'] += overflow
+            self._matrix = None
+            self._stats['stores'] += 1
+
+    def invalidate(self, reason="explicit"):
+        with self._lock:
+            dropped = len(self._entries)
+            self._entries = []
+            self._matrix = None
+            self._stats['invalidations'] += 1
+        logger.info(f"Semantic cache invalidated for market {self.market} ({reason}), {dropped} entries dropped")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, size=len(self._entries), max_entries=self.max_entries,
+                         similarity_threshold=self.similarity_threshold)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
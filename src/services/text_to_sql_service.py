@@ -1,79 +1,403 @@
+import asyncio
 import configparser
-import json
-from src.llm.prompt_templates import get_prompt_for_generating_sql_query
+from concurrent.futures import ThreadPoolExecutor
+from src.llm.prompt_templates import (get_prompt_for_generating_sql_query, get_sql_generation_request,
+                                     get_sql_generation_rules, get_verdict_instructions_for_sql_generation)
 import os
 from src.llm.llm_connector import LLMConnector
 from src.services.ragQueryPipline import RAGPipeline
-from src.utils.config_reader import load_config
+from src.services.market_registry import get_market_resources
+from src.services.cost_estimator import Estimate
+from src.services.guardrails_service import parse_guardrail_verdict
+from src.services.prompt_builder import (count_message_tokens, few_shot_examples, load_few_shot_conversation,
+                                        select_few_shot_examples, trim_context)
+from src.utils.sql_analyzer import analyze_sql, UNSAFE
 from src.utils.logger import logger
 
+# Markers the model emits before the SQL, in order of preference
+QUERY_MARKERS = ["Optimised Query:-", "Optimised Query:", "Optimized Query:-", "Optimized Query:"]
+
+
+class SqlStreamExtractor:
+    """
+    Incrementally pulls the SQL statement out of a streamed completion.
+
+    Text before the query marker is discarded; SQL after it is returned by feed()
+    as soon as it is safe to forward. `complete` becomes True once a statement
+    terminator (';' outside quotes/comments) or a closing code fence is seen, at
+    which point generation can be stopped.
+    """
+
+    def __init__(self, markers=None):
+        self.markers = markers or QUERY_MARKERS
+        self.buffer = ""
+        self.sql = ""
+        # Text the model wrote before the marker (e.g. a merged guardrail verdict)
+        self.preamble = ""
+        self.marker_found = False
+        self.complete = False
+        self._fence_checked = False
+        self._quote = None
+        self._comment = None
+
+    def _find_marker(self):
+        # A marker ending in ':' may still be followed by '-', so wait for one more character
+        for marker in self.markers:
+            index = self.buffer.find(marker)
+            if index == -1:
+                continue
+            end = index + len(marker)
+            if marker.endswith(':') and end >= len(self.buffer):
+                return None
+            return index, end
+        return None
+
+    def _scan(self, text):
+        """Return (safe_to_emit, complete) for text after the marker, holding back ambiguous tails."""
+        i = 0
+        while i < len(text):
+            char = text[i]
+            if self._comment == '--':
+                if char == '\n':
+                    self._comment = None
+            elif self._comment == '/*':
+                if text.startswith('*/', i):
+                    self._comment = None
+                    i += 1
+                elif char == '*' and i == len(text) - 1:
+                    return text[:i], False
+            elif self._quote:
+                if char == '\\':
+                    if i == len(text) - 1:
+                        return text[:i], False
+                    i += 1
+                elif char == self._quote:
+                    self._quote = None
+            elif char == '`':
+                if len(text) - i < 3:
+                    return text[:i], False
+                if text.startswith('```', i):
+                    return text[:i].rstrip(), True
+                self._quote = '`'
+            elif char in ('-', '/'):
+                if i == len(text) - 1:
+                    return text[:i], False
+                if text.startswith('--', i):
+                    self._comment = '--'
+                    i += 1
+                elif text.startswith('/*', i):
+                    self._comment = '/*'
+                    i += 1
+            elif char in ("'", '"'):
+                self._quote = char
+            elif char == ';':
+                return text[:i + 1], True
+            i += 1
+        return text, False
+
+    def feed(self, delta):
+        """Add a streamed chunk; returns the SQL text that can be forwarded now."""
+        if self.complete:
+            return ""
+        self.buffer += delta
+        if not self.marker_found:
+            found = self._find_marker()
+            if found is None:
+                return ""
+            start, end = found
+            self.marker_found = True
+            self.preamble = self.buffer[:start]
+            self.buffer = self.buffer[end:]
+
+        if not self._fence_checked:
+            stripped = self.buffer.lstrip()
+            if not stripped:
+                return ""
+            if stripped.startswith('`'):
+                if len(stripped) < 3 or (stripped.startswith('```') and '\n' not in stripped):
+                    return ""
+                if stripped.startswith('```'):
+                    stripped = stripped.split('\n', 1)[1]
+            self.buffer = stripped.lstrip()
+            self._fence_checked = True
+
+        emitted, self.complete = self._scan(self.buffer)
+        self.buffer = self.buffer[len(emitted):]
+        if not self.sql:
+            emitted = emitted.lstrip()
+        self.sql += emitted
+        return emitted
+
+    def finish(self):
+        """Flush whatever is left once the stream ends; falls back to the whole response without a marker."""
+        if self.complete:
+            return ""
+        if not self.marker_found:
+            self.preamble = self.buffer
+            remainder = self.buffer.strip()
+        else:
+            remainder = self.buffer.rstrip()
+            if not self.sql:
+                remainder = remainder.lstrip()
+        self.buffer = ""
+        self.sql += remainder
+        self.complete = True
+        return remainder
+
+
 class ConvertTextToSqlRequest():
-    def __init__(self, query: str, llm_type: str, market: str):
+    def __init__(self, query: str, llm_type: str, market: str, include_verdict: bool = False):
         self.query = query
         self.llm_type = llm_type
         self.market = market
-        self.config = load_config(market)
+        self.resources = get_market_resources(market)
+        self.config = self.resources.config
+        # Merged guardrail mode: the generation call also returns the intent/domain verdict
+        self.include_verdict = include_verdict
+        self.verdict = {}
+        # Token budgets for retrieved context and few-shot examples (0 = no trimming)
+        self.tokenizer_model = self.config.get('LLM', 'model', fallback='gpt-4')
+        self.context_token_budget = self.config.getint('PROMPT', 'context_token_budget', fallback=3000)
+        self.few_shot_token_budget = self.config.getint('PROMPT', 'few_shot_token_budget', fallback=1500)
+        self.few_shot_top_n = self.config.getint('PROMPT', 'few_shot_top_n', fallback=3)
+        # Rules go in the system message as a request-independent prefix for provider-side prompt caching
+        self.prefix_caching = self.config.getboolean('PROMPT', 'prefix_caching', fallback=False)
+        # Token usage of the last generation call, including cached prompt tokens
+        self.last_usage = {}
+        # Multi-candidate generation: N concurrent completions, cheapest dry-run-valid SQL wins (1 = off)
+        self.candidates = max(1, self.config.getint('TEXT_TO_SQL', 'candidates', fallback=1))
+        self.candidate_temperature = self.config.getfloat('TEXT_TO_SQL', 'candidate_temperature', fallback=0.7)
+        self.candidate_top_p = self.config.getfloat('TEXT_TO_SQL', 'candidate_top_p', fallback=0.95)
+        self.candidate_report = []
         logger.info("TEXT_TO_SQL_INIT - Query: %s, LLM Type: %s", query[:100] + "..." if len(query) > 100 else query, llm_type)
 
-    def convert_text_to_sql_using_llm(self):
+    def build_prompt_messages(self, context_data=None):
+        """Assemble the chat messages for SQL generation, retrieving RAG context unless provided."""
+        # Get Table and columns contexts using RAGPipeline unless the caller already retrieved them
+        if context_data is None:
+            context_data = RAGPipeline(self.market).query(self.query)
+
+        # Keep the highest-scoring context that fits the token budget
+        context_data = trim_context(context_data, self.context_token_budget, self._render_context_item,
+                                    self.tokenizer_model)
+
+        # Process the structured context to extract tables and columns
+        matched_tables = self._extract_tables_from_rag(context_data)
+        matched_cols = self._extract_columns_from_rag(context_data)
+
+        # Create prompt for text to sql
+        # Define system instruction
+        system_message = {
+            "role": "system",
+            "content": (
+                "You are a skilled Data Analyst with deep expertise in BigQuery and GoogleSQL dialect. "
+                "Your task is to generate accurate and optimized SQL queries only. "
+                "Respond strictly with the SQL query as per instructions—no explanations, comments, or additional text."
+            )
+        }
+        # Load middle conversation from JSON (parsed once, reloaded when the file changes)
+        MESSAGES_PATH = self.config.get('Database', 'messages_path')
+        examples = few_shot_examples(load_few_shot_conversation(MESSAGES_PATH))
+        middle_conversation = select_few_shot_examples(
+            examples, self.query, self.few_shot_token_budget, self.tokenizer_model,
+            ranked=self._rank_few_shot_examples(), top_n=self.few_shot_top_n
+        )
+        
+        if self.prefix_caching:
+            # Stable prefix (system instruction, rules, verdict instructions) first so providers with
+            # prompt caching can reuse it; the retrieved context and question go last
+            system_message["content"] += "\n\n" + get_sql_generation_rules()
+            if self.include_verdict:
+                system_message["content"] += get_verdict_instructions_for_sql_generation()
+            TEMPLATE = get_sql_generation_request(matched_tables, matched_cols, self.query)
+            TEMPLATE += "    Follow the rules and output format given in the system message."
+        else:
+            TEMPLATE = get_prompt_for_generating_sql_query(matched_tables, matched_cols, self.query)
+            if self.include_verdict:
+                TEMPLATE += get_verdict_instructions_for_sql_generation()
+        
+        # Define the last user prompt dynamically
+        last_prompt = {
+            "role": "user",
+            "content": f"{TEMPLATE}"
+        }
+        
+        messages = [system_message] + middle_conversation + [last_prompt]
+        logger.debug("Prompt assembled: %s messages, ~%s tokens", len(messages),
+                     count_message_tokens(messages, self.tokenizer_model))
+        return messages
+
+    def _rank_few_shot_examples(self):
+        """Example indices by embedding similarity to the question, or None to rank by word overlap."""
+        selector = self.resources.few_shot_selector
+        if selector is None:
+            return None
+        try:
+            return selector.rank(self.query)
+        except Exception as e:
+            logger.warning("Embedding few-shot selection failed, falling back to word overlap: %s", e)
+            return None
+
+    def _render_context_item(self, item):
+        """Render one structured context item the way it appears in the prompt, for token counting."""
+        context_data = {'structured_context': [item]}
+        if item.get('key_value_context', {}).get('type') == 'table':
+            return self._extract_tables_from_rag(context_data)
+        return self._extract_columns_from_rag(context_data)
+
+    @staticmethod
+    def extract_sql(res):
+        # Try different possible markers in order of preference
+        for marker in QUERY_MARKERS:
+            if marker in res:
+                parts = res.split(marker, 1)  # Split only once
+                if len(parts) > 1:
+                    return parts[1].strip()
+        
+        # If no marker found, return the full response
+        logger.warning("No query marker found in LLM response")
+        return res
+
+    def convert_text_to_sql_using_llm(self, context_data=None):
         logger.info("Generating SQL for: '%s'", self.query)
         if self.llm_type =='openai':
-            # Get Table and columns contexts using RAGPipeline with the provided market
-            rag_pipeline = RAGPipeline(self.market)
-            context_data = rag_pipeline.query(self.query)
+            prompt_messages = self.build_prompt_messages(context_data)
 
-            # Process the structured context to extract tables and columns
-            matched_tables = self._extract_tables_from_rag(context_data)
-            matched_cols = self._extract_columns_from_rag(context_data)
-            
-            # Close the RAG pipeline connection
-            rag_pipeline.close()
-
-            # Create prompt for text to sql
-            # Define system instruction
-            system_message = {
-                "role": "system",
-                "content": (
-                    "You are a skilled Data Analyst with deep expertise in BigQuery and GoogleSQL dialect. "
-                    "Your task is to generate accurate and optimized SQL queries only. "
-                    "Respond strictly with the SQL query as per instructions—no explanations, comments, or additional text."
-                )
-            }
-            # Load middle conversation from JSON
-            MESSAGES_PATH = self.config.get('Database', 'messages_path')
-            with open(MESSAGES_PATH, 'r') as file:
-                middle_conversation = json.load(file)
-            
-            TEMPLATE = get_prompt_for_generating_sql_query(matched_tables, matched_cols, self.query)
-            
-            # Define the last user prompt dynamically
-            last_prompt = {
-                "role": "user",
-                "content": f"{TEMPLATE}"
-            }
-            
-            prompt_messages = [system_message] + middle_conversation + [last_prompt]
+            if self.candidates > 1:
+                return self._generate_best_candidate(prompt_messages)
 
-            llm = LLMConnector(prompt_messages, self.config)
+            llm = LLMConnector(prompt_messages, self.config, client=self.resources.chat_client)
             res = llm.get_llm_response()
+            self.last_usage = llm.last_usage
             logger.debug("LLM response: %s", res)
             
-            # Try different possible markers in order of preference
-            markers = ["Optimised Query:-", "Optimised Query:", "Optimized Query:-", "Optimized Query:"]
-            
-            for marker in markers:
-                if marker in res:
-                    parts = res.split(marker, 1)  # Split only once
-                    if len(parts) > 1:
-                        return parts[1].strip()
-            
-            # If no marker found, return the full response
-            logger.warning("No query marker found in LLM response")
-            return res
+            if self.include_verdict:
+                self.verdict = self._parse_verdict(res)
+            return self.extract_sql(res)
         else:
             logger.warning("TEXT_TO_SQL_UNSUPPORTED_LLM - Type: %s", self.llm_type)
             return f"Unsupported LLM: {self.llm_type}"
 
+    @staticmethod
+    def _parse_verdict(res):
+        marker_positions = [res.find(marker) for marker in QUERY_MARKERS if marker in res]
+        return parse_guardrail_verdict(res[:min(marker_positions)] if marker_positions else res)
+
+    def _generate_best_candidate(self, prompt_messages):
+        """
+        Generate several SQL candidates concurrently and return the cheapest one that passes a BigQuery dry run.
+
+        The first candidate is generated at temperature 0 (the single-candidate answer); the others at
+        [TEXT_TO_SQL] candidate_temperature. Falls back to the first candidate when no candidate is valid.
+        """
+        temperatures = [0.0] + [self.candidate_temperature] * (self.candidates - 1)
+
+        def generate(temperature):
+            # Sampled candidates need a wider nucleus than the default top_p to actually differ
+            llm = LLMConnector(prompt_messages, self.config, client=self.resources.chat_client,
+                               temperature=temperature, top_p=self.candidate_top_p if temperature else 0.1)
+            return llm.get_llm_response(), llm.last_usage
+
+        with ThreadPoolExecutor(max_workers=len(temperatures), thread_name_prefix='sql-candidate') as pool:
+            futures = [pool.submit(generate, temperature) for temperature in temperatures]
+        responses = []
+        for index, future in enumerate(futures):
+            try:
+                responses.append((index, *future.result()))
+            except Exception as e:
+                logger.warning("SQL candidate %s generation failed: %s", index, e)
+        if not responses:
+            # Every call failed; surface the baseline candidate's error
+            futures[0].result()
+
+        self.last_usage = {key: sum(usage.get(key, 0) for _, _, usage in responses)
+                           for key in ('prompt_tokens', 'cached_tokens', 'completion_tokens')}
+        if self.include_verdict:
+            # The verdict comes from the lowest-temperature answer available
+            self.verdict = self._parse_verdict(responses[0][1])
+
+        candidates, seen = [], set()
+        for index, res, _ in responses:
+            sql = self.extract_sql(res)
+            key = ' '.join(sql.split()).rstrip(';').lower()
+            if key in seen:
+                continue
+            seen.add(key)
+            candidate = {'index': index, 'sql': sql, 'status': 'pending'}
+            # Do not spend dry runs on statements the guardrails would block anyway
+            if analyze_sql(sql).verdict == UNSAFE:
+                candidate['status'] = 'rejected'
+            candidates.append(candidate)
+
+        to_check = [candidate for candidate in candidates if candidate['status'] == 'pending']
+        if to_check:
+            # Dry runs are independent BigQuery calls; running them in parallel costs max() rather than sum()
+            with ThreadPoolExecutor(max_workers=len(to_check), thread_name_prefix='sql-dry-run') as pool:
+                estimates = list(pool.map(lambda candidate: Estimate(candidate['sql'], self.market).estimate_query_cost(),
+                                          to_check))
+            for candidate, estimate in zip(to_check, estimates):
+                if estimate.get('status') == 'success':
+                    candidate.update(status='valid', bytes_processed=estimate.get('bytes_processed', 0),
+                                     estimated_cost_usd=estimate.get('estimated_cost_usd'))
+                else:
+                    candidate.update(status='invalid', error=estimate.get('error_message'))
+
+        self.candidate_report = candidates
+        valid = [candidate for candidate in candidates if candidate['status'] == 'valid']
+        logger.info("SQL candidates: %s generated, %s unique, %s valid", len(responses), len(candidates), len(valid))
+        if not valid:
+            logger.warning("No SQL candidate passed the dry run, returning the first candidate")
+            return candidates[0]['sql']
+        best = min(valid, key=lambda candidate: (candidate['bytes_processed'], candidate['index']))
+        logger.info("Selected SQL candidate %s (%s bytes)", best['index'], best['bytes_processed'])
+        return best['sql']
+
+    async def stream_sql(self, context_data=None):
+        """
+        Stream the generated SQL as it arrives, stopping the completion once the statement is complete.
+
+        Yields:
+            str: SQL fragments; the concatenation equals the final statement
+        """
+        logger.info("Streaming SQL for: '%s'", self.query)
+        if self.llm_type != 'openai':
+            logger.warning("TEXT_TO_SQL_UNSUPPORTED_LLM - Type: %s", self.llm_type)
+            yield f"Unsupported LLM: {self.llm_type}"
+            return
+
+        if context_data is None:
+            context_data = await asyncio.to_thread(RAGPipeline(self.market).query, self.query)
+        prompt_messages = await asyncio.to_thread(self.build_prompt_messages, context_data)
+
+        extractor = SqlStreamExtractor()
+        llm = LLMConnector(prompt_messages, self.config)
+        stream = llm.astream_llm_response()
+        try:
+            async for delta in stream:
+                fragment = extractor.feed(delta)
+                if self.include_verdict and extractor.marker_found and not self.verdict:
+                    self.verdict = parse_guardrail_verdict(extractor.preamble)
+                if fragment:
+                    yield fragment
+                if extractor.complete:
+                    logger.info("SQL statement complete, stopping generation early")
+                    break
+        finally:
+            # Closing the generator closes the HTTP stream, which ends generation server-side
+            await stream.aclose()
+            self.last_usage = llm.last_usage
+
+        fragment = extractor.finish()
+        if self.include_verdict and not self.verdict:
+            self.verdict = parse_guardrail_verdict(extractor.preamble)
+        if not extractor.marker_found:
+            if 'False' in self.verdict.values():
+                # Rejected by the merged verdict: the response holds no SQL to forward
+                return
+            logger.warning("No query marker found in streamed LLM response")
+        if fragment:
+            yield fragment
+
     def _extract_tables_from_rag(self, context_data):
         """Extract and format table information from RAG pipeline results. """
         tables_info = []
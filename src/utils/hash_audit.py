@@ -9,3 +9,6 @@ def compute_md5_hash(data: dict) -> str:
         data_str = json.dumps({k: str(v) for k, v in data.items()}, sort_keys=True)
     return hashlib.md5(data_str.encode('utf-8')).hexdigest()
 
+
+def compute_content_hash(raw_text: str, embedding_model: str = '') -> str:
+    return compute_md5_hash({'raw_text': raw_text, 'embedding_model': embedding_model})
@@ -1,6 +1,8 @@
 import nltk
 import re
 
+from src.utils.sql_analyzer import analyze_sql
+
 # english_vocab = set(w.lower() for w in nltk.corpus.words.words())
 
 def invalid_utterance_in_prompt(nlp_query):
@@ -44,28 +46,14 @@ def check_for_modification_in_query(sql_query: str) -> bool:
         sql_query: The SQL query to check
         
     Returns:
-        bool: True if the query contains modification keywords, False otherwise
+        bool: True if any statement modifies data, schema or permissions, False otherwise
     """
     if not sql_query or not isinstance(sql_query, str):
         return False
     
-    # Common SQL modification keywords
-    modification_keywords = {
-        'DELETE', 'TRUNCATE', 'UPDATE', 'DROP', 'ALTER',
-        'INSERT', 'CREATE', 'REPLACE', 'GRANT', 'REVOKE'
-    }
-    
-    # Remove string literals to avoid false positives
-    query_upper = re.sub(r'\'.*?\'|".*?"', '', sql_query, flags=re.DOTALL).upper()
-    
-    # Check for any modification keywords as whole words
-    return any(
-        f' {keyword} ' in f' {query_upper} '
-        for keyword in modification_keywords
-    )
-    
-destructive_keywords = {'delete', 'drop', 'update', 'truncate', 'insert'}
+    # Keywords are matched on lexer tokens, so string literals and identifiers
+    # such as last_update_date are not mistaken for modifications
+    return analyze_sql(sql_query).modifies
 
 def is_dml_query(nlp_query):
-    cleaned_query = re.sub(r'[^\w\s]', '', nlp_query).lower()
-    return any(word in destructive_keywords for word in cleaned_query.split())
+    return check_for_modification_in_query(nlp_query)
@@ -0,0 +1,282 @@
+"""
+Client-side token-bucket rate limiter for the shared LLM/embedding quota.
+
+One bucket is shared by every market in the process (backend=memory) or by every
+worker process on the host (backend=file, an fcntl-locked state file).
+
+Callers declare a priority class. While any interactive caller is waiting, bulk
+callers are held back; interactive waiters refresh a short-lived marker on every
+poll, so a crashed process cannot block bulk traffic for long. Bulk callers may
+also never dip into the last `bulk_reserve_tokens`, so interactive bursts always
+find headroom.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from src.utils.logger import logger
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX hosts
+    fcntl = None
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+PRIORITIES = (INTERACTIVE, BULK)
+
+_current_priority = ContextVar('llm_request_priority', default=INTERACTIVE)
+
+
+class RateLimitTimeoutError(TimeoutError):
+    """Raised when no token became available before the caller's timeout."""
+
+
+def current_priority():
+    return _current_priority.get()
+
+
+@contextmanager
+def request_priority(priority):
+    """Run the enclosed LLM/embedding calls under the given priority class."""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority '{priority}'. Must be one of {PRIORITIES}.")
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class _MemoryBucketState:
+    """Bucket state shared by the threads of this process."""
+
+    def __init__(self, capacity):
+        self._lock = threading.Lock()
+        self._state = {'tokens': float(capacity), 'updated_at': time.time(), 'interactive_until': 0.0}
+
+    @contextmanager
+    def locked(self):
+        with self._lock:
+            yield self._state
+
+
+class _FileBucketState:
+    """Bucket state in a JSON file guarded by fcntl.flock, shared by all worker processes on the host."""
+
+    def __init__(self, path, capacity):
+        if fcntl is None:
+            raise RuntimeError("File-backed rate limiting requires fcntl (POSIX)")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.capacity = float(capacity)
+        self._thread_lock = threading.Lock()
+
+    @contextmanager
+    def locked(self):
+        with self._thread_lock, open(self.path, 'a+') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                handle.seek(0)
+                raw = handle.read()
+                try:
+                    state = json.loads(raw) if raw else None
+                except ValueError:
+                    state = None
+                if not state:
+                    state = {'tokens': self.capacity, 'updated_at': time.time(), 'interactive_until': 0.0}
+                yield state
+                handle.seek(0)
+                handle.truncate()
+                handle.write(json.dumps(state))
+                handle.flush()
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+class TokenBucketRateLimiter:
+    def __init__(self, rate, capacity, bulk_reserve_tokens=0, backend='memory', state_path=None,
+                 poll_interval=0.05, name='llm'):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self.bulk_reserve_tokens = min(float(bulk_reserve_tokens), self.capacity - 1)
+        self.poll_interval = float(poll_interval)
+        self.name = name
+        if backend == 'file':
+            self._state = _FileBucketState(state_path or f"./cache/rate_limiter_{name}.json", self.capacity)
+        else:
+            self._state = _MemoryBucketState(self.capacity)
+        self.backend = backend
+
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            priority: {'acquired': 0, 'timeouts': 0, 'waiting': 0, 'total_wait_seconds': 0.0,
+                       'max_wait_seconds': 0.0, 'recent_waits': deque(maxlen=500)}
+            for priority in PRIORITIES
+        }
+        logger.info(f"Rate limiter '{name}' configured - backend: {backend}, rate: {self.rate}/s, "
+                    f"burst: {self.capacity}, bulk reserve: {self.bulk_reserve_tokens}")
+
+    def _try_take(self, cost, priority):
+        """Take tokens if allowed; returns 0 on success or the suggested wait in seconds."""
+        with self._state.locked() as state:
+            now = time.time()
+            state['tokens'] = min(self.capacity, state['tokens'] + (now - state['updated_at']) * self.rate)
+            state['updated_at'] = now
+
+            if priority == INTERACTIVE:
+                floor = 0.0
+            else:
+                if state['interactive_until'] > now:
+                    return self.poll_interval
+                floor = self.bulk_reserve_tokens
+
+            if state['tokens'] - cost >= floor:
+                state['tokens'] -= cost
+                return 0.0
+
+            if priority == INTERACTIVE:
+                state['interactive_until'] = max(state['interactive_until'], now + 2 * self.poll_interval)
+            deficit = cost + floor - state['tokens']
+            return deficit / self.rate if self.rate > 0 else self.poll_interval
+
+    def _record(self, priority, waited, timed_out=False):
+        with self._metrics_lock:
+            metrics = self._metrics[priority]
+            if timed_out:
+                metrics['timeouts'] += 1
+                return
+            metrics['acquired'] += 1
+            metrics['total_wait_seconds'] += waited
+            metrics['max_wait_seconds'] = max(metrics['max_wait_seconds'], waited)
+            metrics['recent_waits'].append(waited)
+
+    def _waiting(self, priority, delta):
+        with self._metrics_lock:
+            self._metrics[priority]['waiting'] += delta
+
+    def _start(self, cost, priority):
+        priority = priority or current_priority()
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority '{priority}'. Must be one of {PRIORITIES}.")
+        if cost > self.capacity:
+            raise ValueError(f"Cost {cost} exceeds rate limiter burst capacity {self.capacity}")
+        return priority
+
+    def acquire(self, cost=1, priority=None, timeout=None):
+        """
+        Block until `cost` tokens are available.
+
+        Args:
+            cost (float): Tokens to take, normally 1 per HTTP request
+            priority (str, optional): 'interactive' or 'bulk'; defaults to the current request_priority()
+            timeout (float, optional): Seconds to wait before raising RateLimitTimeoutError
+
+        Returns:
+            float: Seconds spent waiting
+        """
+        priority = self._start(cost, priority)
+        started = time.monotonic()
+        self._waiting(priority, 1)
+        try:
+            while True:
+                wait = self._try_take(cost, priority)
+                if wait == 0:
+                    waited = time.monotonic() - started
+                    self._record(priority, waited)
+                    return waited
+                elapsed = time.monotonic() - started
+                if timeout is not None and elapsed + min(wait, self.poll_interval) > timeout:
+                    self._record(priority, elapsed, timed_out=True)
+                    raise RateLimitTimeoutError(
+                        f"Rate limiter '{self.name}' could not grant a {priority} token within {timeout}s")
+                time.sleep(min(wait, self.poll_interval))
+        finally:
+            self._waiting(priority, -1)
+
+    async def aacquire(self, cost=1, priority=None, timeout=None):
+        """Async counterpart of acquire(); waits with asyncio.sleep so the event loop stays free."""
+        priority = self._start(cost, priority)
+        started = time.monotonic()
+        self._waiting(priority, 1)
+        try:
+            while True:
+                wait = self._try_take(cost, priority)
+                if wait == 0:
+                    waited = time.monotonic() - started
+                    self._record(priority, waited)
+                    return waited
+                elapsed = time.monotonic() - started
+                if timeout is not None and elapsed + min(wait, self.poll_interval) > timeout:
+                    self._record(priority, elapsed, timed_out=True)
+                    raise RateLimitTimeoutError(
+                        f"Rate limiter '{self.name}' could not grant a {priority} token within {timeout}s")
+                await asyncio.sleep(min(wait, self.poll_interval))
+        finally:
+            self._waiting(priority, -1)
+
+    def stats(self):
+        with self._state.locked() as state:
+            tokens = min(self.capacity, state['tokens'] + (time.time() - state['updated_at']) * self.rate)
+        result = {'backend': self.backend, 'rate_per_second': self.rate, 'burst': self.capacity,
+                  'bulk_reserve_tokens': self.bulk_reserve_tokens, 'available_tokens': round(tokens, 2)}
+        with self._metrics_lock:
+            for priority, metrics in self._metrics.items():
+                waits = sorted(metrics['recent_waits'])
+                result[priority] = {
+                    'acquired': metrics['acquired'],
+                    'timeouts': metrics['timeouts'],
+                    'waiting': metrics['waiting'],
+                    'avg_wait_seconds': round(metrics['total_wait_seconds'] / metrics['acquired'], 4)
+                    if metrics['acquired'] else 0.0,
+                    'p95_wait_seconds': round(waits[min(len(waits) - 1, int(0.95 * len(waits)))], 4)
+                    if waits else 0.0,
+                    'max_wait_seconds': round(metrics['max_wait_seconds'], 4),
+                }
+        return result
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(config):
+    """
+    Process-wide limiter for the LLM/embedding quota, or None when [RATE_LIMITER] enabled is false.
+
+    Markets pointing at the same backend/state file share one bucket; the first
+    market to initialise it decides the rate and burst.
+    """
+    section = 'RATE_LIMITER'
+    if not config.getboolean(section, 'enabled', fallback=True):
+        return None
+    backend = config.get(section, 'backend', fallback='memory').strip().lower()
+    state_path = config.get(section, 'state_path', fallback='./cache/rate_limiter_llm.json')
+    key = (backend, state_path if backend == 'file' else None)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(key)
+            if limiter is None:
+                limiter = TokenBucketRateLimiter(
+                    rate=config.getfloat(section, 'requests_per_second', fallback=10),
+                    capacity=config.getfloat(section, 'burst', fallback=20),
+                    bulk_reserve_tokens=config.getfloat(section, 'bulk_reserve_tokens', fallback=5),
+                    backend=backend,
+                    state_path=state_path,
+                )
+                _limiters[key] = limiter
+    return limiter
+
+
+def rate_limiter_stats():
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return [limiter.stats() for limiter in limiters]
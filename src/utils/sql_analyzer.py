@@ -0,0 +1,228 @@
+"""
+Deterministic static analysis of generated SQL, built on the sqlparse lexer.
+
+Classifies a query as SAFE (a single read-only SELECT/WITH statement with no
+suspicious constructs), UNSAFE (multiple statements, DML/DDL/DCL or scripting
+keywords, statements hidden in comments) or UNSURE (anything the lexer cannot
+vouch for: unrecognised statements, unterminated literals, comments, OR-tautologies).
+Only UNSURE queries need the LLM injection check.
+
+Keywords are matched on lexer tokens, so identifiers like `last_update_date`
+and string literals such as 'DROP' do not trigger false positives. A keyword
+marks a modification where it starts a statement or a scripting block body
+(after THEN, ELSE, DO, LOOP, BEGIN or REPEAT), and any DML/DDL keyword does
+inside IF/FOR/WHILE/... scripts. Inside a SELECT, REPLACE is still one unless it
+modifies a star (`SELECT * REPLACE (...)`), other DML/DDL keywords (e.g. columns
+named `update`) make the query UNSURE and plain keywords (`WHERE lock = 1`) are
+ignored. Only the
+lexer is used (no statement grouping), which keeps analysis well under a
+millisecond for typical generated queries; results are memoised per query text.
+"""
+from collections import namedtuple
+from functools import lru_cache
+
+from sqlparse import tokens as T
+from sqlparse.lexer import Lexer
+
+SAFE = 'SAFE'
+UNSAFE = 'UNSAFE'
+UNSURE = 'UNSURE'
+
+# Leading keywords of statements that change data, schema, permissions or session state
+MODIFICATION_KEYWORDS = {
+    'INSERT', 'UPDATE', 'DELETE', 'MERGE', 'UPSERT', 'REPLACE', 'TRUNCATE', 'DROP', 'ALTER', 'CREATE',
+    'RENAME', 'GRANT', 'REVOKE', 'COPY', 'EXPORT', 'LOAD', 'CALL', 'EXECUTE', 'EXEC', 'DECLARE', 'SET',
+    'BEGIN', 'COMMIT', 'ROLLBACK', 'VACUUM', 'ATTACH', 'DETACH', 'LOCK',
+}
+
+# Keywords after which a scripting block body (a statement of its own) starts
+BLOCK_START_KEYWORDS = {'THEN', 'ELSE', 'DO', 'LOOP', 'BEGIN', 'REPEAT'}
+
+_LITERALS = (T.Number.Integer, T.Number.Float, T.String.Single, T.String.Symbol)
+
+SqlAnalysis = namedtuple('SqlAnalysis', ['verdict', 'modifies', 'statement_types', 'reasons'])
+
+
+def _split_statements(sql_query):
+    """Lex the query and split it on ';' into lists of (ttype, value, depth) without whitespace."""
+    statements, current, depth = [], [], 0
+    for ttype, value in Lexer.get_default_instance().get_tokens(sql_query):
+        if ttype in T.Whitespace or ttype in T.Newline or (ttype in T.Text and value.isspace()):
+            continue
+        if ttype is T.Punctuation:
+            if value == ';':
+                statements.append(current)
+                current = []
+                continue
+            if value == '(':
+                depth += 1
+            elif value == ')':
+                depth = max(0, depth - 1)
+        current.append((ttype, value, depth))
+    statements.append(current)
+    return [statement for statement in statements if any(ttype not in T.Comment for ttype, _, _ in statement)]
+
+
+def _statement_type(statement):
+    """Type of the statement: its leading keyword, or the main keyword after a WITH clause."""
+    significant = [(ttype, value.upper(), depth) for ttype, value, depth in statement if ttype not in T.Comment]
+    ttype, first, _ = next(((t, v, d) for t, v, d in significant if t is not T.Punctuation), (None, '', 0))
+    if ttype is T.Keyword.CTE:
+        first = next((value for ttype, value, depth in significant
+                      if depth == 0 and ttype in (T.Keyword.DML, T.Keyword.DDL)), 'UNKNOWN')
+    elif ttype not in T.Keyword:
+        return 'UNKNOWN'
+    return first.split()[0] if first else 'UNKNOWN'
+
+
+def _is_tautology(statement, index):
+    """`OR 1=1`, `OR 'a'='a'` and `OR TRUE` starting at statement[index] (the OR keyword)."""
+    following = [(ttype, value.upper()) for ttype, value, _ in statement[index + 1:index + 5]
+                 if ttype not in T.Comment]
+    if following and following[0] == (T.Keyword, 'TRUE'):
+        return True
+    if len(following) < 3:
+        return False
+    (left_type, left), (op_type, op), (right_type, right) = following[:3]
+    if not (left_type in _LITERALS and right_type in _LITERALS and op_type in T.Operator and op == '='):
+        return False
+    # `OR 1=1+x` is an expression, not a tautology
+    return left == right and (len(following) == 3 or following[3][0] not in T.Operator)
+
+
+def _is_star_replace(statement, index):
+    """REPLACE at statement[index] is BigQuery's `* REPLACE (...)` or `* EXCEPT (...) REPLACE (...)` column modifier."""
+    significant = [(ttype, value.upper(), depth) for ttype, value, depth in statement[:index] if ttype not in T.Comment]
+    if significant and significant[-1][0] is T.Punctuation and significant[-1][1] == ')':
+        # Step back over the EXCEPT column list to its opening parenthesis
+        depth = significant[-1][2] + 1
+        opening = next((position for position in range(len(significant) - 1, -1, -1)
+                        if significant[position][1] == '(' and significant[position][2] == depth), None)
+        if opening is None or opening < 2 or significant[opening - 1][1] != 'EXCEPT':
+            return False
+        significant = significant[:opening - 1]
+    return bool(significant) and significant[-1][0] is T.Wildcard
+
+
+@lru_cache(maxsize=1024)
+def analyze_sql(sql_query):
+    """
+    Classify a SQL string.
+
+    Args:
+        sql_query (str): SQL to analyze
+
+    Returns:
+        SqlAnalysis: verdict (SAFE/UNSAFE/UNSURE), whether any statement modifies state,
+        the statement types found and the reasons behind the verdict
+    """
+    if not sql_query or not isinstance(sql_query, str) or not sql_query.strip():
+        return SqlAnalysis(UNSURE, False, (), ('empty query',))
+
+    statements = _split_statements(sql_query)
+    if not statements:
+        return SqlAnalysis(UNSURE, False, (), ('no statement found',))
+
+    unsafe, unsure = [], []
+    modifies = False
+    statement_types = tuple(_statement_type(statement) for statement in statements)
+    if len(statements) > 1:
+        unsafe.append(f'{len(statements)} statements')
+
+    for statement, statement_type in zip(statements, statement_types):
+        if statement_type in MODIFICATION_KEYWORDS:
+            modifies = True
+            unsafe.append(f'{statement_type} statement')
+        elif statement_type != 'SELECT':
+            unsure.append(f'unrecognised statement type {statement_type}')
+
+        # Anything but a query is a script (IF ... THEN, FOR ... DO, ...) whose body may hold further statements
+        script = statement_type != 'SELECT'
+        previous = None
+        for index, (ttype, value, _) in enumerate(statement):
+            if ttype in T.Comment:
+                if value.startswith('/*!') or ';' in value:
+                    unsafe.append('statement hidden in comment')
+                else:
+                    unsure.append('comment')
+            elif ttype in T.Keyword:
+                keyword = value.upper().split()[0]
+                if keyword == 'REPLACE' and not _is_star_replace(statement, index):
+                    modifies = True
+                    unsafe.append('REPLACE keyword')
+                elif ttype in (T.Keyword.DML, T.Keyword.DDL) and keyword not in ('SELECT', 'REPLACE'):
+                    if script:
+                        modifies = True
+                        unsafe.append(f'{keyword} keyword')
+                    else:
+                        # Inside a query this is most likely a column name
+                        unsure.append(f'{keyword} keyword')
+                elif script and previous in BLOCK_START_KEYWORDS and keyword in MODIFICATION_KEYWORDS:
+                    modifies = True
+                    unsafe.append(f'{keyword} statement')
+                elif keyword == 'INTO' and statement_type == 'SELECT':
+                    modifies = True
+                    unsafe.append('SELECT INTO')
+                elif keyword == 'OR' and _is_tautology(statement, index):
+                    unsure.append('OR tautology')
+            elif ttype in T.Error:
+                unsure.append(f'unparseable token {value!r}')
+            if ttype not in T.Comment:
+                previous = value.upper().split()[0] if value.strip() else None
+
+    reasons = tuple(dict.fromkeys(unsafe or unsure))
+    if unsafe:
+        return SqlAnalysis(UNSAFE, modifies, statement_types, reasons)
+    if unsure:
+        return SqlAnalysis(UNSURE, modifies, statement_types, reasons)
+    return SqlAnalysis(SAFE, False, statement_types, ())
+
+
+# Functions whose result changes between runs; BigQuery never serves these queries from its cache either
+NONDETERMINISTIC_FUNCTIONS = {
+    'CURRENT_TIMESTAMP', 'CURRENT_DATE', 'CURRENT_DATETIME', 'CURRENT_TIME', 'RAND', 'GENERATE_UUID',
+    'SESSION_USER',
+}
+
+
+def _is_word_boundary(char):
+    return char.isalnum() or char in "_`'\"@$"
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql_query):
+    """
+    Canonical form of a query for cache keys: comments dropped, whitespace collapsed,
+    keywords upper-cased and trailing ';' removed. Literals and identifiers are kept as written.
+    """
+    parts, spaced = [], False
+    for ttype, value in Lexer.get_default_instance().get_tokens(sql_query or ''):
+        if ttype in T.Comment or ttype in T.Whitespace or ttype in T.Newline or (ttype in T.Text and value.isspace()):
+            spaced = True
+            continue
+        # Whitespace only matters between two word-like tokens: `a , b` and `a,b` normalise alike
+        if spaced and parts and _is_word_boundary(parts[-1][-1]) and _is_word_boundary(value[0]):
+            parts.append(' ')
+        spaced = False
+        parts.append(value.upper() if ttype in T.Keyword else value)
+    return ''.join(parts).rstrip(';')
+
+
+@lru_cache(maxsize=1024)
+def is_deterministic(sql_query):
+    """False when the query calls a function such as CURRENT_TIMESTAMP() or RAND()."""
+    for ttype, value in Lexer.get_default_instance().get_tokens(sql_query or ''):
+        if ttype in T.Comment or ttype in T.String:
+            continue
+        if value.upper() in NONDETERMINISTIC_FUNCTIONS:
+            return False
+    return True
+
+
+@lru_cache(maxsize=1024)
+def has_from_clause(sql_query):
+    """True when the query has a FROM keyword (outside strings and comments), i.e. it may read a table."""
+    for ttype, value in Lexer.get_default_instance().get_tokens(sql_query or ''):
+        if ttype in T.Keyword and value.upper() == 'FROM':
+            return True
+    return False
@@ -0,0 +1,161 @@
+import datetime
+import decimal
+import json
+
+import pyarrow as pa
+import pytest
+
+from src.database.query_executor import serialize_arrow, serialize_row, encode_stream
+
+UTC = datetime.timezone.utc
+TS = datetime.datetime(2024, 1, 2, 3, 4, 5, 123456, tzinfo=UTC)
+
+STRUCT_TYPE = pa.struct([
+    ('id', pa.int64()),
+    ('amount', pa.float64()),
+    ('at', pa.timestamp('us', tz='UTC')),
+    ('price', pa.decimal128(38, 9)),
+])
+
+
+def _table():
+    return pa.table({
+        'f': pa.array([0.1234567890123, 1.2345678901234567e-5, 1e-12, 1.7976931348623157e308, None]),
+        'n': pa.array([decimal.Decimal('12.345678901'), decimal.Decimal('-0.000000001'), None,
+                       decimal.Decimal('1'), decimal.Decimal('99999999999.5')], pa.decimal128(38, 9)),
+        't': pa.array([TS, TS.replace(microsecond=0), None, TS, TS], pa.timestamp('us', tz='UTC')),
+        'd': pa.array([datetime.date(2024, 1, 2), None, datetime.date(2020, 2, 29),
+                       datetime.date(1970, 1, 1), datetime.date(9999, 12, 31)]),
+        's': pa.array([{'id': 1, 'amount': 0.1234567890123, 'at': TS, 'price': decimal.Decimal('1.5')},
+                       None,
+                       {'id': None, 'amount': None, 'at': None, 'price': None},
+                       {'id': 2 ** 53 + 1, 'amount': 1e-12, 'at': TS, 'price': decimal.Decimal('0.000000001')},
+                       {'id': -1, 'amount': -2.5, 'at': TS, 'price': decimal.Decimal('-3')}], STRUCT_TYPE),
+    })
+
+
+def _expected(value):
+    """What the row-by-row path means for a value, in JSON terms."""
+    if isinstance(value, dict):
+        return {key: _expected(item) for key, item in value.items()}
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, str):
+        try:
+            return datetime.datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _assert_same(actual, expected, path):
+    if isinstance(expected, dict):
+        assert isinstance(actual, dict) and actual.keys() == expected.keys(), path
+        for key in expected:
+            _assert_same(actual[key], expected[key], f"{path}.{key}")
+    elif isinstance(expected, datetime.datetime):
+        assert datetime.datetime.fromisoformat(actual) == expected, path
+    elif isinstance(expected, float):
+        assert isinstance(actual, (int, float)) and actual == expected, path
+    else:
+        assert actual == expected and type(actual) is type(expected), path
+
+
+def _assert_matches_row_path(records, table):
+    rows = [serialize_row(row) for row in table.to_pylist()]
+    assert len(records) == len(rows)
+    for index, (record, row) in enumerate(zip(records, rows)):
+        _assert_same(record, _expected(row), f"row {index}")
+
+
+def test_json_matches_row_path():
+    table = _table()
+    _assert_matches_row_path(json.loads(serialize_arrow(table, 'json')), table)
+
+
+def test_json_keeps_float64_precision():
+    values = [0.1234567890123, 1.2345678901234567e-5, 1e-12, 5e-324, 123456.78901234567]
+    records = json.loads(serialize_arrow(pa.table({'f': values}), 'json'))
+    assert [record['f'] for record in records] == values
+
+
+def test_json_writes_non_finite_floats_as_null():
+    records = json.loads(serialize_arrow(pa.table({'f': [float('nan'), float('inf'), 1.0]}), 'json'))
+    assert [record['f'] for record in records] == [None, None, 1.0]
+
+
+def test_json_does_not_unquote_strings():
+    values = ['1.5', '\x00#1.5', '\x00\x00#2', '\x00#', 'a"\x00#1', '"quoted"', None]
+    table = pa.table({'s': values, 'nested': [{'s': value} for value in values]})
+    records = json.loads(serialize_arrow(table, 'json'))
+    assert [record['s'] for record in records] == values
+    assert [record['nested']['s'] for record in records] == values
+
+
+def test_ndjson_stream_matches_row_path():
+    table = _table()
+    batches = table.to_batches(max_chunksize=2)
+    lines = b''.join(encode_stream(iter(batches), table.schema, 'ndjson')).decode('utf-8').splitlines()
+    *records, trailer = [json.loads(line) for line in lines]
+    _assert_matches_row_path(records, table)
+    assert trailer['_stream_end']['rows'] == table.num_rows
+
+
+@pytest.mark.parametrize('result_format', ['arrow', 'parquet'])
+def test_binary_formats_round_trip(result_format):
+    table = _table()
+    body = serialize_arrow(table, result_format)
+    if result_format == 'arrow':
+        decoded = pa.ipc.open_stream(body).read_all()
+    else:
+        import pyarrow.parquet as pq
+        decoded = pq.read_table(pa.BufferReader(body))
+    assert decoded.equals(table)
+
+
+def _read_arrow_stream(body):
+    reader = pa.ipc.open_stream(body)
+    batches, trailer = [], None
+    while True:
+        try:
+            batch, metadata = reader.read_next_batch_with_custom_metadata()
+        except StopIteration:
+            return pa.Table.from_batches(batches, schema=reader.schema), trailer
+        if metadata is not None and b'stream_end' in metadata:
+            trailer = json.loads(metadata[b'stream_end'])
+        else:
+            batches.append(batch)
+
+
+def test_arrow_stream_ends_with_stats_trailer():
+    table = _table()
+    stats = {}
+    body = b''.join(encode_stream(iter(table.to_batches(max_chunksize=2)), table.schema, 'arrow', stats=stats))
+    decoded, trailer = _read_arrow_stream(body)
+    assert decoded.equals(table)
+    assert trailer['rows'] == table.num_rows and trailer['truncated'] is False
+
+
+def test_arrow_stream_signals_row_limit_truncation():
+    table = _table()
+    body = b''.join(encode_stream(iter(table.to_batches(max_chunksize=2)), table.schema, 'arrow', max_rows=3))
+    decoded, trailer = _read_arrow_stream(body)
+    assert decoded.num_rows == 3
+    assert trailer == dict(trailer, rows=3, truncated=True)
+
+
+@pytest.mark.parametrize('result_format', ['arrow', 'ndjson'])
+def test_stream_checks_byte_limit_before_sending(result_format):
+    table = pa.table({'id': list(range(10000)), 'name': [f"name-{i}" for i in range(10000)]})
+    max_bytes = 50000
+    stats = {}
+    chunks = list(encode_stream(iter(table.to_batches(max_chunksize=4000)), table.schema, result_format,
+                                max_bytes=max_bytes, stats=stats))
+    assert stats['truncated'] is True
+    assert 0 < stats['rows'] < table.num_rows
+    # Everything but the end-of-stream trailer stays within the limit
+    assert sum(len(chunk) for chunk in chunks[:-1]) <= max_bytes
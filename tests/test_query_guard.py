@@ -0,0 +1,67 @@
+import pytest
+
+from src.services import query_guard
+from src.services.query_guard import check_query_before_execution
+
+
+class FakeEstimate:
+    """Stands in for the BigQuery dry run."""
+    result = {}
+
+    def __init__(self, query, market):
+        self.query = query
+        self.market = market
+
+    def estimate_query_cost(self):
+        return dict(self.result)
+
+
+@pytest.fixture
+def dry_run(monkeypatch):
+    monkeypatch.setattr(query_guard, 'Estimate', FakeEstimate)
+    FakeEstimate.result = {'status': 'success', 'estimated_cost_usd': 0.01, 'bytes_processed': 1024,
+                           'referenced_tables': ['p.d.orders']}
+    return FakeEstimate
+
+
+def test_safe_query_passes_with_its_estimate(dry_run):
+    rejection, estimate = check_query_before_execution("SELECT * FROM `p.d.orders`", 'US', 'alice')
+    assert rejection is None
+    assert estimate['referenced_tables'] == ['p.d.orders']
+
+
+def test_cost_limit(dry_run):
+    dry_run.result['estimated_cost_usd'] = 12.5
+    rejection, _ = check_query_before_execution("SELECT * FROM `p.d.orders`", 'US', 'alice')
+    assert rejection.startswith("Query execution blocked: Cost $12.50")
+
+
+def test_time_limit_is_configurable(dry_run):
+    dry_run.result['bytes_processed'] = 60 * 1024 ** 3
+    assert check_query_before_execution("SELECT * FROM `p.d.orders`", 'US', 'alice')[0] is not None
+    assert check_query_before_execution("SELECT * FROM `p.d.orders`", 'US', 'alice', max_seconds=600)[0] is None
+
+
+@pytest.mark.parametrize('sql_query', [
+    "DELETE FROM t WHERE TRUE",
+    "IF TRUE THEN DELETE FROM t WHERE TRUE; END IF;",
+    "FOR r IN (SELECT 1 AS x) DO UPDATE t SET a = r.x WHERE TRUE; END FOR;",
+])
+def test_modifications_are_rejected(dry_run, sql_query):
+    rejection, _ = check_query_before_execution(sql_query, 'US', 'alice')
+    assert rejection.startswith("DML query detected")
+
+
+@pytest.mark.parametrize('sql_query', [
+    "SELECT 1 FROM t; SELECT 2 FROM t",
+    "SELECT 1 /*! DROP TABLE t */ FROM t",
+])
+def test_unsafe_queries_are_rejected_even_without_modifications(dry_run, sql_query):
+    rejection, _ = check_query_before_execution(sql_query, 'US', 'alice')
+    assert rejection.startswith("SQL Injection detected")
+
+
+def test_failed_dry_run_raises(dry_run):
+    dry_run.result = {'status': 'error', 'error_message': 'Syntax error'}
+    with pytest.raises(Exception, match='Syntax error'):
+        check_query_before_execution("SELEC 1", 'US', 'alice')
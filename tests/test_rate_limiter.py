@@ -0,0 +1,145 @@
+import asyncio
+import types
+
+import pytest
+
+from src.utils import rate_limiter
+from src.utils.rate_limiter import (TokenBucketRateLimiter, RateLimitTimeoutError, request_priority,
+                                    INTERACTIVE, BULK)
+
+
+class FakeClock:
+    """time.time/monotonic/sleep that only move when the code under test sleeps (or the test advances them)."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    async def asleep(self, seconds):
+        self.sleep(seconds)
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, 'time', clock)
+    monkeypatch.setattr(rate_limiter, 'asyncio', types.SimpleNamespace(sleep=clock.asleep))
+    return clock
+
+
+def _limiter(**kwargs):
+    options = dict(rate=1, capacity=3, bulk_reserve_tokens=0, poll_interval=0.05)
+    options.update(kwargs)
+    return TokenBucketRateLimiter(**options)
+
+
+def test_burst_then_steady_rate(clock):
+    limiter = _limiter()
+    assert [limiter.acquire() for _ in range(3)] == [0, 0, 0]
+    waited = limiter.acquire()
+    assert waited == pytest.approx(1.0)
+    assert max(clock.sleeps) <= limiter.poll_interval
+    assert limiter.stats()[INTERACTIVE]['acquired'] == 4
+
+
+def test_timeout_raises_without_taking_a_token(clock):
+    limiter = _limiter(capacity=1)
+    limiter.acquire()
+    with pytest.raises(RateLimitTimeoutError):
+        limiter.acquire(timeout=0.5)
+    stats = limiter.stats()
+    assert stats[INTERACTIVE]['timeouts'] == 1
+    assert stats[INTERACTIVE]['waiting'] == 0
+    # The refill during the failed wait is still there for the next caller
+    assert limiter.acquire(timeout=1) < 1
+
+
+def test_bulk_never_takes_the_reserve(clock):
+    limiter = _limiter(rate=0.001, capacity=5, bulk_reserve_tokens=2)
+    for _ in range(3):
+        limiter.acquire(priority=BULK, timeout=0)
+    with pytest.raises(RateLimitTimeoutError):
+        limiter.acquire(priority=BULK, timeout=0)
+    limiter.acquire(priority=INTERACTIVE, timeout=0)
+    limiter.acquire(priority=INTERACTIVE, timeout=0)
+
+
+def test_waiting_interactive_caller_holds_bulk_back(clock):
+    limiter = _limiter(rate=100, capacity=2, poll_interval=0.05)
+    limiter.acquire(timeout=0)
+    limiter.acquire(timeout=0)
+    with pytest.raises(RateLimitTimeoutError):
+        # Leaves a marker that an interactive caller is waiting, valid for two poll intervals
+        limiter.acquire(timeout=0)
+
+    clock.advance(0.05)
+    assert limiter.stats()['available_tokens'] == 2
+    with pytest.raises(RateLimitTimeoutError):
+        limiter.acquire(priority=BULK, timeout=0)
+    assert limiter.acquire(priority=INTERACTIVE, timeout=0) == 0
+
+    clock.advance(0.06)
+    assert limiter.acquire(priority=BULK, timeout=0) == 0
+
+
+def test_priority_comes_from_the_request_context(clock):
+    limiter = _limiter(rate=0.001, capacity=3, bulk_reserve_tokens=2)
+    with request_priority(BULK):
+        limiter.acquire(timeout=0)
+        with pytest.raises(RateLimitTimeoutError):
+            limiter.acquire(timeout=0)
+    limiter.acquire(timeout=0)
+    assert limiter.stats()[BULK]['acquired'] == 1
+
+
+def test_invalid_requests(clock):
+    limiter = _limiter()
+    with pytest.raises(ValueError):
+        limiter.acquire(cost=4)
+    with pytest.raises(ValueError):
+        limiter.acquire(priority='urgent')
+    with pytest.raises(ValueError):
+        with request_priority('urgent'):
+            pass
+
+
+def test_async_acquire_waits_without_blocking(clock):
+    limiter = _limiter(capacity=1)
+
+    async def take_two():
+        return [await limiter.aacquire(), await limiter.aacquire()]
+
+    assert asyncio.run(take_two()) == [0, pytest.approx(1.0)]
+    with pytest.raises(RateLimitTimeoutError):
+        asyncio.run(limiter.aacquire(timeout=0.5))
+
+
+def test_file_backend_shares_one_bucket(clock, tmp_path):
+    state_path = str(tmp_path / 'bucket.json')
+    first = _limiter(rate=0.001, capacity=2, backend='file', state_path=state_path)
+    second = _limiter(rate=0.001, capacity=2, backend='file', state_path=state_path)
+    first.acquire(timeout=0)
+    second.acquire(timeout=0)
+    with pytest.raises(RateLimitTimeoutError):
+        first.acquire(timeout=0)
+
+
+def test_file_backend_recovers_from_a_corrupt_state_file(clock, tmp_path):
+    state_path = tmp_path / 'bucket.json'
+    state_path.write_text('{not json')
+    limiter = _limiter(capacity=2, backend='file', state_path=str(state_path))
+    assert limiter.acquire(timeout=0) == 0
+    assert limiter.stats()['available_tokens'] == 1
@@ -0,0 +1,287 @@
+import asyncio
+import configparser
+import time
+import types
+
+import pytest
+
+from src.llm import resilience
+from src.llm.resilience import (ResiliencePolicy, CircuitBreaker, RetryableLLMError, CircuitOpenError,
+                                DeadlineExceededError, parse_retry_after)
+from src.utils.rate_limiter import RateLimitTimeoutError
+
+
+class FakeClock:
+    """time.monotonic/sleep that only move when the code under test sleeps (or a fake call takes time)."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class FakeEndpoint:
+    """Scripted LLM endpoint: each call takes `latency` seconds and raises or returns the next outcome."""
+
+    def __init__(self, *outcomes, clock=None, latency=0.0):
+        self.outcomes = list(outcomes)
+        self.clock = clock
+        self.latency = latency
+        self.timeouts = []
+
+    def __call__(self, timeout):
+        self.timeouts.append(timeout)
+        if self.clock is not None:
+            self.clock.advance(self.latency)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    @property
+    def calls(self):
+        return len(self.timeouts)
+
+
+def _unavailable(retry_after=None):
+    return RetryableLLMError("503 Service Unavailable", status_code=503, retry_after=retry_after)
+
+
+def _policy(**options):
+    settings = {'deadline_seconds': 60, 'max_attempts': 3, 'backoff_base_seconds': 1, 'backoff_max_seconds': 8,
+                'breaker_failure_threshold': 5, 'breaker_reset_seconds': 30}
+    settings.update(options)
+    config = configparser.ConfigParser()
+    config.read_dict({'LLM_RESILIENCE': {key: str(value) for key, value in settings.items()}})
+    return ResiliencePolicy(config, 'https://llm.test')
+
+
+@pytest.fixture(autouse=True)
+def fresh_endpoints(monkeypatch):
+    # Breakers and latency histories are process-wide per endpoint
+    monkeypatch.setattr(resilience, '_endpoints', {})
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resilience, 'time', clock)
+    # Full jitter at its upper bound, so backoff delays are exact
+    monkeypatch.setattr(resilience, 'random', types.SimpleNamespace(uniform=lambda low, high: high))
+    return clock
+
+
+@pytest.fixture
+def no_jitter(monkeypatch):
+    monkeypatch.setattr(resilience, 'random', types.SimpleNamespace(uniform=lambda low, high: low))
+
+
+def _open_breaker(policy, clock):
+    for _ in range(policy.breaker.failure_threshold):
+        with pytest.raises(RetryableLLMError):
+            policy.call(FakeEndpoint(_unavailable(), clock=clock))
+    assert policy.breaker.state == CircuitBreaker.OPEN
+
+
+@pytest.mark.parametrize('headers, expected', [
+    ({'retry-after': '2.5'}, 2.5),
+    ({'retry-after': '-1'}, 0.0),
+    ({'retry-after': 'Wed, 21 Oct 2015 07:28:00 GMT'}, None),
+    ({}, None),
+    (None, None),
+])
+def test_parse_retry_after(headers, expected):
+    assert parse_retry_after(headers) == expected
+
+
+def test_retries_with_capped_exponential_backoff(clock):
+    policy = _policy(max_attempts=4, backoff_max_seconds=3)
+    endpoint = FakeEndpoint(_unavailable(), _unavailable(), _unavailable(), 'ok')
+    assert policy.call(endpoint) == 'ok'
+    assert clock.sleeps == [1, 2, 3]
+    assert policy.breaker.stats() == {'state': 'closed', 'consecutive_failures': 0}
+
+
+def test_retry_after_overrides_a_shorter_backoff(clock):
+    policy = _policy()
+    assert policy.call(FakeEndpoint(_unavailable(retry_after=5), 'ok')) == 'ok'
+    assert clock.sleeps == [5]
+
+
+def test_each_attempt_gets_the_time_left_before_the_deadline(clock):
+    policy = _policy(deadline_seconds=10)
+    endpoint = FakeEndpoint(_unavailable(), 'ok', clock=clock, latency=2)
+    policy.call(endpoint)
+    assert endpoint.timeouts == [10, pytest.approx(10 - 2 - 1)]
+
+
+def test_deadline_stops_retries(clock):
+    policy = _policy(deadline_seconds=3)
+    endpoint = FakeEndpoint(_unavailable(retry_after=5), 'ok')
+    with pytest.raises(DeadlineExceededError):
+        policy.call(endpoint)
+    assert endpoint.calls == 1
+
+
+def test_gives_up_after_max_attempts(clock):
+    policy = _policy(max_attempts=3)
+    endpoint = FakeEndpoint(_unavailable(), _unavailable(), _unavailable(), 'ok')
+    with pytest.raises(RetryableLLMError):
+        policy.call(endpoint)
+    assert endpoint.calls == 3
+    assert len(clock.sleeps) == 2
+
+
+def test_non_retryable_errors_are_raised_at_once_and_do_not_trip_the_breaker(clock):
+    policy = _policy(breaker_failure_threshold=1)
+    endpoint = FakeEndpoint(ValueError("400 Bad Request"), 'ok')
+    with pytest.raises(ValueError):
+        policy.call(endpoint)
+    assert endpoint.calls == 1
+    assert policy.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_open_breaker_fails_fast(clock):
+    policy = _policy(max_attempts=1, breaker_failure_threshold=2)
+    _open_breaker(policy, clock)
+    endpoint = FakeEndpoint('ok')
+    with pytest.raises(CircuitOpenError):
+        policy.call(endpoint)
+    assert endpoint.calls == 0
+
+
+def test_half_open_breaker_lets_one_probe_through(clock):
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    assert not breaker.allow()
+    clock.advance(30)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+
+def test_successful_probe_closes_and_failed_probe_reopens_the_breaker(clock):
+    policy = _policy(max_attempts=1, breaker_failure_threshold=2)
+    _open_breaker(policy, clock)
+
+    clock.advance(30)
+    with pytest.raises(RetryableLLMError):
+        policy.call(FakeEndpoint(_unavailable()))
+    assert policy.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        policy.call(FakeEndpoint('ok'))
+
+    clock.advance(30)
+    assert policy.call(FakeEndpoint('ok')) == 'ok'
+    assert policy.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_limiter_timeout_keeps_the_breaker_open_and_the_probe_free(clock):
+    policy = _policy(max_attempts=1, breaker_failure_threshold=1)
+    _open_breaker(policy, clock)
+    clock.advance(30)
+
+    def acquire(timeout=None):
+        raise RateLimitTimeoutError("no token")
+
+    endpoint = FakeEndpoint('ok')
+    with pytest.raises(RateLimitTimeoutError):
+        policy.call(endpoint, limiter=types.SimpleNamespace(acquire=acquire))
+    assert endpoint.calls == 0
+    assert policy.breaker.state != CircuitBreaker.CLOSED
+    # The probe slot was never held, so the next call can still probe
+    assert policy.call(FakeEndpoint('ok')) == 'ok'
+
+
+def test_rate_limit_timeout_inside_the_call_releases_the_probe(clock):
+    policy = _policy(max_attempts=3, breaker_failure_threshold=1)
+    policy.breaker.record_failure()
+    clock.advance(30)
+
+    endpoint = FakeEndpoint(RateLimitTimeoutError("no token"), 'ok')
+    with pytest.raises(RateLimitTimeoutError):
+        policy.call(endpoint)
+    assert endpoint.calls == 1
+    assert policy.breaker.state == CircuitBreaker.HALF_OPEN
+    assert policy.breaker.allow()
+
+
+def test_disabled_policy_calls_once_without_a_deadline(clock):
+    policy = _policy(enabled='false')
+    endpoint = FakeEndpoint(_unavailable(), 'ok')
+    with pytest.raises(RetryableLLMError):
+        policy.call(endpoint)
+    assert endpoint.timeouts == [None]
+
+
+class FakeAsyncEndpoint:
+    """Async scripted endpoint; an outcome may be a (delay, value) pair for a slow answer."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+        self.cancelled = 0
+
+    async def __call__(self, timeout):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, tuple):
+            delay, outcome = outcome
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                raise
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+def test_async_call_retries(no_jitter):
+    policy = _policy()
+    endpoint = FakeAsyncEndpoint(_unavailable(), 'ok')
+    assert asyncio.run(policy.acall(endpoint)) == 'ok'
+    assert endpoint.calls == 2
+
+
+def test_async_hedge_answers_before_a_slow_attempt(no_jitter):
+    policy = _policy(hedge_enabled='true', hedge_min_samples=1, hedge_min_delay_seconds=0.05)
+    policy.latencies.record(0.01)
+    endpoint = FakeAsyncEndpoint((5, 'slow'), 'fast')
+
+    started = time.perf_counter()
+    assert asyncio.run(policy.acall(endpoint)) == 'fast'
+    assert time.perf_counter() - started < 1
+    assert endpoint.calls == 2 and endpoint.cancelled == 1
+    assert policy.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_async_open_breaker_is_not_retried(no_jitter):
+    policy = _policy(max_attempts=3, breaker_failure_threshold=1)
+    endpoint = FakeAsyncEndpoint(_unavailable(), 'ok')
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(policy.acall(endpoint))
+    assert endpoint.calls == 1
+
+
+def test_async_limiter_timeout_is_raised_without_calling_the_endpoint(no_jitter):
+    policy = _policy()
+
+    async def aacquire(timeout=None):
+        raise RateLimitTimeoutError("no token")
+
+    endpoint = FakeAsyncEndpoint('ok')
+    with pytest.raises(RateLimitTimeoutError):
+        asyncio.run(policy.acall(endpoint, limiter=types.SimpleNamespace(aacquire=aacquire)))
+    assert endpoint.calls == 0
+    assert policy.breaker.stats() == {'state': 'closed', 'consecutive_failures': 0}
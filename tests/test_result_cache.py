@@ -0,0 +1,77 @@
+import pyarrow as pa
+import pytest
+
+from src.services.result_cache import ResultCache, TableVersionTracker
+
+
+class FakeVersions:
+    def __init__(self, **versions):
+        self.versions = versions
+        self.reads = 0
+
+    def __call__(self, table_id):
+        self.reads += 1
+        return self.versions[table_id]
+
+
+@pytest.fixture
+def versions():
+    return FakeVersions(**{'p.d.orders': 1, 'p.d.stream': None})
+
+
+@pytest.fixture
+def cache(versions):
+    return ResultCache('US', versions, ttl_seconds=0)
+
+
+def test_key_changes_when_a_referenced_table_changes(cache, versions):
+    key = cache.key_for("SELECT * FROM `p.d.orders`", ['p.d.orders'])
+    assert key == cache.key_for("select *\nfrom `p.d.orders`;", ['p.d.orders'])
+    versions.versions['p.d.orders'] = 2
+    assert cache.key_for("SELECT * FROM `p.d.orders`", ['p.d.orders']) not in (None, key)
+
+
+@pytest.mark.parametrize('sql_query, referenced_tables', [
+    ("SELECT * FROM `p.d.stream`", ['p.d.stream']),
+    ("SELECT * FROM `p.d.orders` WHERE day = CURRENT_DATE()", ['p.d.orders']),
+    ("SELECT table_name FROM `p.d.INFORMATION_SCHEMA.TABLES`", []),
+    ("SELECT table_name FROM `p.d.INFORMATION_SCHEMA.TABLES`", None),
+])
+def test_uncacheable_queries_are_bypassed(cache, sql_query, referenced_tables):
+    assert cache.key_for(sql_query, referenced_tables) is None
+    assert cache.stats()['bypassed'] == 1
+
+
+def test_query_without_tables_is_cached(cache):
+    assert cache.key_for("SELECT 1 AS one", []) is not None
+
+
+def test_memory_tier_round_trip_and_byte_bound(versions):
+    table = pa.table({'a': list(range(1000))})
+    cache = ResultCache('US', versions, max_bytes=table.nbytes * 2, ttl_seconds=0)
+    for key in ('k1', 'k2', 'k3'):
+        cache.put(key, table)
+    assert cache.get('k1') == (None, None)
+    result, tier = cache.get('k3')
+    assert tier == 'memory' and result.equals(table)
+    assert cache.stats()['evictions'] == 1
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path, versions):
+    table = pa.table({'a': [1.5, None]})
+    ResultCache('US', versions, disk_path=str(tmp_path), ttl_seconds=0).put('k1', table)
+    result, tier = ResultCache('US', versions, disk_path=str(tmp_path), ttl_seconds=0).get('k1')
+    assert tier == 'disk' and result.equals(table)
+
+
+def test_version_tracker_rereads_after_the_check_interval(monkeypatch, versions):
+    now = [100.0]
+    monkeypatch.setattr('src.services.result_cache.time.monotonic', lambda: now[0])
+    tracker = TableVersionTracker(versions, check_interval=30)
+    assert tracker.version('p.d.orders') == 1
+    versions.versions['p.d.orders'] = 2
+    now[0] += 29
+    assert tracker.version('p.d.orders') == 1
+    now[0] += 2
+    assert tracker.version('p.d.orders') == 2
+    assert versions.reads == 2
@@ -0,0 +1,121 @@
+import pytest
+
+from src.utils.sql_analyzer import analyze_sql, normalize_sql, is_deterministic, has_from_clause, SAFE, UNSAFE, UNSURE
+
+
+@pytest.mark.parametrize('sql_query', [
+    "SELECT name, SUM(sales) FROM `p.d.orders` WHERE region = 'EU' GROUP BY name",
+    "WITH recent AS (SELECT * FROM orders WHERE day > '2024-01-01') SELECT COUNT(*) FROM recent",
+    "SELECT * REPLACE (ROUND(price, 2) AS price) FROM products",
+    "SELECT p.* REPLACE (UPPER(name) AS name) FROM products p",
+    "SELECT * EXCEPT (cost) REPLACE (price * 2 AS price) FROM products",
+    "SELECT * EXCEPT (a, (b)) REPLACE (1 AS c) FROM t",
+    "SELECT REPLACE(name, 'a', 'b') FROM products",
+    "SELECT id FROM locks WHERE lock = 1 AND set_id = 2",
+    "SELECT last_update_date, 'DROP TABLE x' AS note FROM t",
+    "SELECT 1;",
+])
+def test_safe(sql_query):
+    analysis = analyze_sql(sql_query)
+    assert analysis.verdict == SAFE, analysis.reasons
+    assert analysis.modifies is False
+
+
+@pytest.mark.parametrize('sql_query', [
+    "DELETE FROM orders WHERE TRUE",
+    "UPDATE orders SET price = 0",
+    "INSERT INTO orders SELECT * FROM orders",
+    "REPLACE INTO orders VALUES (1)",
+    "DROP TABLE orders",
+    "WITH x AS (SELECT 1) DELETE FROM orders WHERE TRUE",
+    "MERGE orders USING staging ON FALSE WHEN NOT MATCHED THEN INSERT ROW",
+    "SELECT * FROM t INTO new_table",
+    "SELECT a FROM t REPLACE (1 AS a)",
+])
+def test_unsafe_modifications(sql_query):
+    analysis = analyze_sql(sql_query)
+    assert analysis.verdict == UNSAFE, analysis.reasons
+    assert analysis.modifies is True
+
+
+@pytest.mark.parametrize('sql_query', [
+    "IF TRUE THEN DELETE FROM t WHERE TRUE; END IF;",
+    "IF (SELECT COUNT(*) FROM t) > 0 THEN SELECT 1; ELSE DROP TABLE t; END IF;",
+    "FOR r IN (SELECT 1 AS x) DO UPDATE t SET a = r.x WHERE TRUE; END FOR;",
+    "WHILE TRUE DO TRUNCATE TABLE t; END WHILE;",
+    "LOOP INSERT INTO t VALUES (1); END LOOP;",
+    "REPEAT MERGE t USING s ON FALSE WHEN NOT MATCHED THEN INSERT ROW; UNTIL TRUE END REPEAT;",
+    "IF x THEN SET y = 1; ELSE CALL p(); END IF;",
+    "BEGIN DELETE FROM t WHERE TRUE; END;",
+    "SELECT 1 FROM t; DELETE FROM t WHERE TRUE",
+    "SELECT 1 FROM t /* hidden */ ; UPDATE t SET a = 1 WHERE TRUE",
+    "EXECUTE IMMEDIATE 'DELETE FROM t WHERE TRUE'",
+])
+def test_unsafe_scripts_modify(sql_query):
+    analysis = analyze_sql(sql_query)
+    assert analysis.verdict == UNSAFE, analysis.reasons
+    assert analysis.modifies is True
+
+
+@pytest.mark.parametrize('sql_query, modifies', [
+    # Multiple statements
+    ("SELECT 1 FROM t; SELECT 2 FROM t", False),
+    ("SELECT 1 FROM t;; SELECT 2 FROM t;", False),
+    ("SELECT 1 FROM t; DROP TABLE t", True),
+    ("SELECT 1 FROM t;\nGRANT `roles/owner` ON SCHEMA d TO 'user:x@y.z'", True),
+    # Comment tricks
+    ("SELECT 1 /*; DROP TABLE t */ FROM t", False),
+    ("SELECT 1 /*! DROP TABLE t */ FROM t", False),
+    ("SELECT 1 FROM t -- harmless\n; DELETE FROM t WHERE TRUE", True),
+    ("/* SELECT */ DELETE FROM t WHERE TRUE", True),
+])
+def test_unsafe_statements_and_comment_tricks(sql_query, modifies):
+    # Not all of these modify anything, but none of them may be executed
+    analysis = analyze_sql(sql_query)
+    assert analysis.verdict == UNSAFE, analysis.reasons
+    assert analysis.modifies is modifies
+
+
+@pytest.mark.parametrize('sql_query', [
+    "SELECT * FROM users WHERE name = 'x' OR 1=1",
+    "SELECT * FROM users WHERE name = 'x' OR 'a'='a'",
+    "SELECT * FROM users WHERE name = 'x' OR TRUE",
+    "SELECT * FROM users -- only the first row\nLIMIT 1",
+    "SELECT 1 /* harmless */ FROM t",
+    "SELECT update, delete FROM audit_log",
+    "SELECT CASE WHEN a THEN update ELSE delete END FROM audit_log",
+    "SHOW TABLES",
+    "SELECT 'unterminated FROM t",
+])
+def test_unsure(sql_query):
+    analysis = analyze_sql(sql_query)
+    assert analysis.verdict == UNSURE, analysis.reasons
+    assert analysis.modifies is False
+
+
+def test_expression_after_or_is_not_a_tautology():
+    assert analyze_sql("SELECT * FROM t WHERE a = 2 OR 1=1+a").verdict == SAFE
+
+
+@pytest.mark.parametrize('sql_query', ['', '   ', None, '-- just a comment'])
+def test_empty_queries_are_unsure(sql_query):
+    assert analyze_sql(sql_query).verdict == UNSURE
+
+
+def test_normalize_sql():
+    assert normalize_sql("select  a ,b\n from t -- note\n where x = 'Hi  There';") == \
+        "SELECT a,b FROM t WHERE x='Hi  There'"
+    assert normalize_sql("SELECT a FROM t") == normalize_sql("select a\n/* c */from t;")
+    assert normalize_sql("SELECT a FROM t") != normalize_sql("SELECT A FROM t")
+
+
+def test_is_deterministic():
+    assert is_deterministic("SELECT a FROM t WHERE d = '2024-01-01'")
+    assert not is_deterministic("SELECT a FROM t WHERE d = CURRENT_DATE()")
+    assert is_deterministic("SELECT 'CURRENT_DATE' AS label FROM t -- RAND()")
+
+
+def test_has_from_clause():
+    assert has_from_clause("SELECT * FROM `p.d.INFORMATION_SCHEMA.TABLES`")
+    assert not has_from_clause("SELECT 1 AS one")
+    assert not has_from_clause("SELECT 'FROM t' AS label -- FROM t")